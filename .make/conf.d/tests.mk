@@ -26,10 +26,18 @@ tox-tests: check-python-venv
 	@export USE_MYSQL=False; \
 	tox -v -e allianceauth-latest; \
 
+# Benchmarks
+.PHONY: benchmark
+benchmark: check-python-venv
+	@echo "Running the cleanup benchmarks with tox …"
+	@export USE_MYSQL=False; \
+	tox -v -e benchmark; \
+
 # Help message
 .PHONY: help
 help::
 	@echo "  $(TEXT_UNDERLINE)Tests:$(TEXT_UNDERLINE_END)"
+	@echo "    benchmark                   Run the cleanup benchmarks with tox"
 	@echo "    build-test                  Build the package"
 	@echo "    coverage                    Run tests and create a coverage report"
 	@echo "    tox-tests                   Run tests with tox"
@@ -59,6 +59,15 @@ if os.environ.get("USE_MYSQL", True) is True:
         },
     }
 
+# Separate database standing in for a read replica in the tests
+DATABASES["replica"] = {**DATABASES["default"]}
+
+if "TEST" in DATABASES["default"]:
+    DATABASES["replica"]["TEST"] = {
+        **DATABASES["default"]["TEST"],
+        "NAME": f"{DATABASES['default']['TEST']['NAME']}_replica",
+    }
+
 
 # Add any additional apps to this list.
 # TN-NT Auth Templates - https://github.com/terra-nanotech/tn-nt-auth-templates
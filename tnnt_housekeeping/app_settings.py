@@ -0,0 +1,131 @@
+"""
+App settings for TN-NT Housekeeping
+"""
+
+# Django
+from django.conf import settings
+
+# Number of rows deleted per batch. Every batch is committed in its own transaction.
+TNNT_HOUSEKEEPING_BATCH_SIZE = getattr(settings, "TNNT_HOUSEKEEPING_BATCH_SIZE", 500)
+
+# Number of shards a daily run is split into. Each shard is a separate Celery task.
+# 0 or 1 runs all cleanups serially in the daily task.
+TNNT_HOUSEKEEPING_SHARDS = getattr(settings, "TNNT_HOUSEKEEPING_SHARDS", 0)
+
+# Celery priority the shard tasks are sent with (0 highest, 9 lowest)
+TNNT_HOUSEKEEPING_SHARD_PRIORITY = getattr(
+    settings, "TNNT_HOUSEKEEPING_SHARD_PRIORITY", 9
+)
+
+# Seconds a sharded run may take before it is considered lost and dispatched again
+TNNT_HOUSEKEEPING_SHARD_TIMEOUT = getattr(
+    settings, "TNNT_HOUSEKEEPING_SHARD_TIMEOUT", 3600
+)
+
+# Seconds a daily run holds its claim without a heartbeat, before another worker may take over
+TNNT_HOUSEKEEPING_CLAIM_TIMEOUT = getattr(
+    settings, "TNNT_HOUSEKEEPING_CLAIM_TIMEOUT", 300
+)
+
+# Wall-clock seconds a daily run may spend on its cleanups before it stops at the next
+# batch boundary and continues on the next run. None disables the limit.
+TNNT_HOUSEKEEPING_TIME_BUDGET = getattr(settings, "TNNT_HOUSEKEEPING_TIME_BUDGET", 240)
+
+# Path of a Prometheus textfile the rule metrics are written to after every rule run,
+# e.g. for the node_exporter textfile collector. None disables the textfile.
+TNNT_HOUSEKEEPING_METRICS_TEXTFILE = getattr(
+    settings, "TNNT_HOUSEKEEPING_METRICS_TEXTFILE", None
+)
+
+# Directory the JSON reports of profiled housekeeping runs are written to.
+# None only returns the report in the task result.
+TNNT_HOUSEKEEPING_PROFILE_DIR = getattr(settings, "TNNT_HOUSEKEEPING_PROFILE_DIR", None)
+
+# Estimated number of rows a single rule run may delete, cascaded rows included.
+# Checked before every run when set. None disables the check.
+TNNT_HOUSEKEEPING_IMPACT_THRESHOLD = getattr(
+    settings, "TNNT_HOUSEKEEPING_IMPACT_THRESHOLD", None
+)
+
+# What a run does when a rule exceeds the impact threshold: "shard" switches the run to
+# sharded mode, "refuse" skips the rule until the threshold is raised
+TNNT_HOUSEKEEPING_IMPACT_ACTION = getattr(
+    settings, "TNNT_HOUSEKEEPING_IMPACT_ACTION", "shard"
+)
+
+# Attempts per batch when it fails with a deadlock or lock wait timeout, the first included
+TNNT_HOUSEKEEPING_RETRY_ATTEMPTS = getattr(
+    settings, "TNNT_HOUSEKEEPING_RETRY_ATTEMPTS", 5
+)
+
+# Base and maximum seconds to wait before retrying a batch. The wait doubles with every
+# attempt, up to the maximum, and a random part of it is used (full jitter).
+TNNT_HOUSEKEEPING_RETRY_BACKOFF = getattr(
+    settings, "TNNT_HOUSEKEEPING_RETRY_BACKOFF", 0.5
+)
+TNNT_HOUSEKEEPING_RETRY_BACKOFF_MAX = getattr(
+    settings, "TNNT_HOUSEKEEPING_RETRY_BACKOFF_MAX", 10
+)
+
+# Commit latency in seconds every batch should take. When set, the batch size and the pause
+# between batches are adjusted after every batch, and the tuned batch size is kept per
+# rule for the next run. None keeps the batch size fixed.
+TNNT_HOUSEKEEPING_TARGET_LATENCY = getattr(
+    settings, "TNNT_HOUSEKEEPING_TARGET_LATENCY", None
+)
+
+# Range the batch size is adjusted within, and the longest pause between two batches
+TNNT_HOUSEKEEPING_MIN_BATCH_SIZE = getattr(
+    settings, "TNNT_HOUSEKEEPING_MIN_BATCH_SIZE", 50
+)
+TNNT_HOUSEKEEPING_MAX_BATCH_SIZE = getattr(
+    settings, "TNNT_HOUSEKEEPING_MAX_BATCH_SIZE", 5000
+)
+TNNT_HOUSEKEEPING_MAX_BATCH_SLEEP = getattr(
+    settings, "TNNT_HOUSEKEEPING_MAX_BATCH_SLEEP", 5
+)
+
+# Database alias the read-only parts of the cleanups use: candidate scans, primary key
+# ranges, estimates and dry runs, e.g. a read replica. The deletes always go to the
+# primary, which re-checks the predicate. None reads from the primary as well.
+TNNT_HOUSEKEEPING_READ_DATABASE = getattr(
+    settings, "TNNT_HOUSEKEEPING_READ_DATABASE", None
+)
+
+# Bulk mode: delete signal receivers known to only recalculate the state of a user, e.g.
+# Alliance Auth's main character check on CharacterOwnership, don't run per deleted row.
+# The affected users are reconciled once per batch after it committed instead.
+TNNT_HOUSEKEEPING_DEFER_SIGNALS = getattr(
+    settings, "TNNT_HOUSEKEEPING_DEFER_SIGNALS", True
+)
+
+# Seconds between full scans of the rules that track the rows changing into candidates,
+# e.g. characters moving to Doomheim. The runs in between only look at the changed rows.
+# 0 always scans fully.
+TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL = getattr(
+    settings, "TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL", 604800
+)
+
+# Directory the rows the cleanups delete are archived to before deleting them, as daily
+# gzip compressed JSON Lines files per rule. None disables the archive.
+TNNT_HOUSEKEEPING_ARCHIVE_DIR = getattr(settings, "TNNT_HOUSEKEEPING_ARCHIVE_DIR", None)
+
+# Seconds an orphaned corporation or alliance is kept after it was first found orphaned,
+# so rows that are about to be referenced again aren't deleted in between.
+TNNT_HOUSEKEEPING_ORPHAN_GRACE_PERIOD = getattr(
+    settings, "TNNT_HOUSEKEEPING_ORPHAN_GRACE_PERIOD", 2592000
+)
+
+# Seconds ownership records are kept. Older records are pruned, except for
+# the newest record of every character.
+TNNT_HOUSEKEEPING_OWNERSHIP_RECORD_RETENTION = getattr(
+    settings, "TNNT_HOUSEKEEPING_OWNERSHIP_RECORD_RETENTION", 31536000
+)
+
+# Seconds read notifications are kept, and seconds any notification is kept
+TNNT_HOUSEKEEPING_NOTIFICATION_READ_RETENTION = getattr(
+    settings, "TNNT_HOUSEKEEPING_NOTIFICATION_READ_RETENTION", 2592000
+)
+TNNT_HOUSEKEEPING_NOTIFICATION_RETENTION = getattr(
+    settings, "TNNT_HOUSEKEEPING_NOTIFICATION_RETENTION", 7776000
+)
@@ -17,3 +17,56 @@ class TnntHousekeepingConfig(AppConfig):
     name = "tnnt_housekeeping"
     label = "tnnt_housekeeping"
     verbose_name = f"Terra Nanotech Alliance Auth Houskeeping v{__version__}"
+
+    def ready(self) -> None:
+        """
+        Build the deletion plans for the models the cleanups delete from,
+        register the delete signal receivers bulk mode defers, and the system checks.
+
+        :return:
+        :rtype:
+        """
+
+        # The models can only be imported once the app registry is ready
+        # pylint: disable=import-outside-toplevel
+
+        # Django
+        from django.db.models.signals import pre_delete
+
+        # Alliance Auth
+        from allianceauth.authentication.models import (
+            CharacterOwnership,
+            OwnershipRecord,
+        )
+        from allianceauth.authentication.signals import validate_main_character
+        from allianceauth.eveonline.models import (
+            EveAllianceInfo,
+            EveCharacter,
+            EveCorporationInfo,
+        )
+        from allianceauth.notifications.models import Notification
+
+        # TN-NT Auth Housekeeping
+        from tnnt_housekeeping import checks  # noqa: F401 pylint: disable=unused-import
+        from tnnt_housekeeping.handler.plan import DeletionPlan
+        from tnnt_housekeeping.handler.signals import (
+            DeferredReceiver,
+            register_deferred_receiver,
+        )
+
+        for model in (
+            EveCorporationInfo,
+            EveCharacter,
+            EveAllianceInfo,
+            OwnershipRecord,
+            Notification,
+        ):
+            DeletionPlan.register(model=model)
+
+        register_deferred_receiver(
+            DeferredReceiver(
+                signal=pre_delete,
+                model=CharacterOwnership,
+                receiver=validate_main_character,
+            )
+        )
@@ -0,0 +1,127 @@
+"""
+System checks for TN-NT Housekeeping
+"""
+
+# Django
+from django.conf import settings
+from django.core import checks
+from django.db import router
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.app_settings import (
+    TNNT_HOUSEKEEPING_IMPACT_ACTION,
+    TNNT_HOUSEKEEPING_READ_DATABASE,
+)
+from tnnt_housekeeping.handler.estimate import IMPACT_ACTIONS
+from tnnt_housekeeping.handler.indexes import is_supported, supporting_columns
+from tnnt_housekeeping.rules import get_rules
+
+
+@checks.register(checks.Tags.database)
+def check_cleanup_indexes(  # pylint: disable=unused-argument
+    app_configs=None, databases=None, **kwargs
+) -> list:
+    """
+    Report cleanup rules whose predicate is not supported by an index.
+
+    Database checks only run with `python manage.py check --database <alias>`.
+
+    :param app_configs:
+    :type app_configs:
+    :param databases: Database aliases to check
+    :type databases:
+    :param kwargs:
+    :type kwargs:
+    :return:
+    :rtype:
+    """
+
+    warnings = []
+
+    for rule in get_rules():
+        using = router.db_for_read(rule.model)
+        fields = rule.indexed_fields()
+
+        if not databases or using not in databases or not fields:
+            continue
+
+        if is_supported(model=rule.model, fields=fields, using=using):
+            continue
+
+        columns = supporting_columns(model=rule.model, fields=fields)
+
+        warnings.append(
+            checks.Warning(
+                f"No index supports the predicate of cleanup rule {rule.name}, "
+                "every run scans the whole table.",
+                hint=(
+                    f"Create an index on {rule.model._meta.db_table} "
+                    f"({', '.join(columns)}), e.g. with a CreateSupportingIndex "
+                    "migration operation from tnnt_housekeeping.handler.indexes."
+                ),
+                obj=rule.name,
+                id="tnnt_housekeeping.W001",
+            )
+        )
+
+    return warnings
+
+
+@checks.register()
+def check_read_database(  # pylint: disable=unused-argument
+    app_configs=None, **kwargs
+) -> list:
+    """
+    Report a read database alias that is not configured.
+
+    :param app_configs:
+    :type app_configs:
+    :param kwargs:
+    :type kwargs:
+    :return:
+    :rtype:
+    """
+
+    if (
+        TNNT_HOUSEKEEPING_READ_DATABASE is None
+        or TNNT_HOUSEKEEPING_READ_DATABASE in settings.DATABASES
+    ):
+        return []
+
+    return [
+        checks.Error(
+            f"TNNT_HOUSEKEEPING_READ_DATABASE is set to "
+            f"{TNNT_HOUSEKEEPING_READ_DATABASE!r}, which is not in DATABASES.",
+            hint="Add the database, e.g. a read replica, or remove the setting.",
+            id="tnnt_housekeeping.E001",
+        )
+    ]
+
+
+@checks.register()
+def check_impact_action(  # pylint: disable=unused-argument
+    app_configs=None, **kwargs
+) -> list:
+    """
+    Report an unknown action for rules above the impact threshold.
+
+    :param app_configs:
+    :type app_configs:
+    :param kwargs:
+    :type kwargs:
+    :return:
+    :rtype:
+    """
+
+    if TNNT_HOUSEKEEPING_IMPACT_ACTION in IMPACT_ACTIONS:
+        return []
+
+    return [
+        checks.Error(
+            f"TNNT_HOUSEKEEPING_IMPACT_ACTION is set to "
+            f"{TNNT_HOUSEKEEPING_IMPACT_ACTION!r}, which is not one of "
+            f"{', '.join(repr(action) for action in IMPACT_ACTIONS)}.",
+            hint="Use one of the actions, or remove the setting.",
+            id="tnnt_housekeeping.E002",
+        )
+    ]
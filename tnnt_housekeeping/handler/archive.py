@@ -0,0 +1,142 @@
+"""
+Archive handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+import gzip
+import json
+import os
+
+# Django
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.handler.plan import ACTION_DELETE, DeletionPlan
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+# Rows fetched from the database at a time while streaming a batch
+ARCHIVE_CHUNK_SIZE = 500
+
+# Fastest compression, so archiving adds little to the time a batch holds its locks
+ARCHIVE_COMPRESSLEVEL = 1
+
+
+class Archive:
+    """
+    Gzip compressed JSON Lines archive of the rows a cleanup rule deletes.
+
+    - Every line is one row, in the shape of Django's serializers:
+      `{"model": ..., "pk": ..., "fields": {...}, "archived": ...}`.
+    - The rows of a batch and the rows it cascades to are streamed from the database
+      with `.values()`, no model instances are built, so memory use is bounded by
+      ARCHIVE_CHUNK_SIZE rows whatever the number of batches.
+    - Every batch is appended as its own gzip member, which `zcat` and `gzip.open()`
+      read as one stream. The file rotates daily: `<rule>-<YYYY-MM-DD>.jsonl.gz`.
+    - A batch is archived before its delete commits. A batch that is rolled back
+      or retried afterwards is archived again, so rows appear at least once.
+    - Relations behind a blocker of the model's deletion plan are not archived.
+    """
+
+    def __init__(self, name: str, directory: str) -> None:
+        """
+        Initialize the Archive of a cleanup rule.
+
+        :param name: Name of the cleanup rule
+        :type name: str
+        :param directory: Directory the archive files are written to
+        :type directory: str
+        """
+
+        self.name = name
+        self.directory = directory
+        self.rows = 0
+        self._plans: dict[type[models.Model], DeletionPlan] = {}
+
+    @property
+    def path(self) -> str:
+        """
+        Path of today's archive file.
+
+        :return:
+        :rtype:
+        """
+
+        return os.path.join(
+            self.directory, f"{self.name}-{timezone.now().date().isoformat()}.jsonl.gz"
+        )
+
+    def _plan(self, model: type[models.Model]) -> DeletionPlan:
+        """
+        Get the deletion plan the cascaded rows of a model are found with.
+
+        :param model:
+        :type model:
+        :return:
+        :rtype:
+        """
+
+        if model not in self._plans:
+            self._plans[model] = DeletionPlan.for_model(model=model) or DeletionPlan(
+                model=model
+            )
+
+        return self._plans[model]
+
+    def write(self, model: type[models.Model], pks: list, using: str) -> int:
+        """
+        Append a batch and the rows it cascades to, to today's archive file.
+
+        Call it inside the batch's transaction, after its rows have been locked.
+
+        :param model: Model of the batch
+        :type model: type[models.Model]
+        :param pks: Primary keys of the batch
+        :type pks: list
+        :param using: Database alias
+        :type using: str
+        :return: Number of rows archived
+        :rtype: int
+        """
+
+        archived = timezone.now().isoformat()
+        rows = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        with gzip.open(
+            self.path, mode="at", encoding="utf-8", compresslevel=ARCHIVE_COMPRESSLEVEL
+        ) as file:
+            for step in self._plan(model=model).steps:
+                if step.action != ACTION_DELETE:
+                    continue
+
+                label = step.model._meta.label
+                pk_name = step.model._meta.pk.attname
+
+                for row in (
+                    step.queryset(pks=pks)
+                    .using(using)
+                    .order_by()
+                    .values()
+                    .iterator(chunk_size=ARCHIVE_CHUNK_SIZE)
+                ):
+                    record = {
+                        "model": label,
+                        "pk": row.pop(pk_name),
+                        "fields": row,
+                        "archived": archived,
+                    }
+                    file.write(json.dumps(record, cls=DjangoJSONEncoder) + "\n")
+                    rows += 1
+
+        self.rows += rows
+
+        return rows
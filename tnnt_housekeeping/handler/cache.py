@@ -3,12 +3,13 @@ Cache handler for AA ESI Status.
 """
 
 # Standard Library
-from datetime import timedelta
 from typing import Any
 
+# Third Party
+from django_redis.client import DefaultClient, ShardClient
+
 # Django
 from django.core.cache import cache
-from django.utils.timezone import now
 
 # Alliance Auth
 from allianceauth.services.hooks import get_extension_logger
@@ -20,13 +21,28 @@ from tnnt_housekeeping.providers import AppLogger
 
 logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
 
+# Compare-and-act on a claim, run by Redis as one atomic step
+EXTEND_CLAIM_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_CLAIM_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
 
 class Cache:
     """
     Handling the redis cache for TN-NT Housekeeping.
 
     - Cache keys are generated based on a base key and a subkey.
-    - Cache values are set with a timeout that expires at 11:30 AM the next day.
+    - Cache values are set with the timeout given by the caller, e.g. the time until
+      a tier is due again, see `Tier.seconds_until_due()`.
     """
 
     redis_key_base = "tnnt-housekeeping"
@@ -61,58 +77,204 @@ class Cache:
 
         return cache_key
 
-    @staticmethod
-    def _get_max_cache_time() -> int:
+    def set(self, value: Any, timeout: int) -> None:
         """
-        Get the maximum cache time until 11:30 AM the next day.
+        Set a specific cache value for a cache key with a custom timeout.
 
+        :param value:
+        :type value:
+        :param timeout: Timeout in seconds
+        :type timeout: int
         :return:
         :rtype:
         """
 
-        expire_time = now()
-        target = expire_time.replace(hour=11, minute=30, second=0, microsecond=0)
+        cache_key = self._get_cache_key()
 
-        if expire_time >= target:
-            target += timedelta(days=1)
+        logger.debug(f"Setting cache for: {cache_key}")
 
-        return int((target - expire_time).total_seconds())
+        cache.set(key=cache_key, value=value, timeout=timeout)
 
-    def set_hourly(self, value: Any) -> None:
+    def incr(self, timeout: int | None, delta: int = 1) -> int:
+        """
+        Atomically increment a counter, creating it if it does not exist yet.
+
+        :param timeout: Timeout in seconds, applied when the counter is created. None never expires.
+        :type timeout: int | None
+        :param delta: Amount to increment the counter by
+        :type delta: int
+        :return: The new value of the counter
+        :rtype: int
         """
-        Set a specific cache value for a cache key.
 
-        :param value:
-        :type value:
+        cache_key = self._get_cache_key()
+
+        logger.debug(f"Incrementing cache for: {cache_key}")
+
+        cache.add(key=cache_key, value=0, timeout=timeout)
+
+        return cache.incr(key=cache_key, delta=delta)
+
+    def delete(self) -> None:
+        """
+        Delete a specific cache value for a cache key.
+
         :return:
         :rtype:
         """
 
         cache_key = self._get_cache_key()
 
-        logger.debug(f"Setting cache for: {cache_key}")
+        logger.debug(f"Deleting cache for: {cache_key}")
 
-        cache.set(key=cache_key, value=value, timeout=3600)
+        cache.delete(key=cache_key)
 
-    def set_daily(self, value: Any) -> None:
+    def claim(self, owner: str, timeout: int) -> bool:
         """
-        Set a specific cache value for a cache key.
+        Atomically claim the cache key for an owner, if nobody holds it.
 
-        :param value:
-        :type value:
+        This is a lease: it expires after `timeout` seconds unless it is extended,
+        so the claim of a crashed worker is released on its own.
+
+        :param owner: Unique ID of the claiming run
+        :type owner: str
+        :param timeout: Lease time in seconds
+        :type timeout: int
+        :return: True if the claim was granted
+        :rtype: bool
+        """
+
+        cache_key = self._get_cache_key()
+
+        logger.debug(f"Claiming cache for: {cache_key}")
+
+        return bool(cache.add(key=cache_key, value=owner, timeout=timeout))
+
+    def _run_claim_script(self, script: str, owner: str, *args: Any) -> int | None:
+        """
+        Run a compare-and-act script on the claim's key, atomically in Redis.
+
+        :param script: Lua script, comparing the key's value to the owner first
+        :type script: str
+        :param owner: Unique ID of the claiming run
+        :type owner: str
+        :param args: Further script arguments
+        :type args: Any
+        :return: Result of the script, None if the cache is not a single Redis server
+        :rtype: int | None
+        """
+
+        client = getattr(cache, "client", None)
+
+        # Sharded clients spread keys over servers, a script needs to know its server
+        if not isinstance(client, DefaultClient) or isinstance(client, ShardClient):
+            return None
+
+        return client.get_client(write=True).eval(
+            script,
+            1,
+            client.make_key(self._get_cache_key()),
+            # Values are stored serialized, the owner has to be compared the same way
+            client.encode(owner),
+            *args,
+        )
+
+    def extend(self, owner: str, timeout: int) -> bool:
+        """
+        Heartbeat of a claim: reset its lease time, as long as the owner still holds it.
+
+        On Redis, the owner is compared and the lease reset in one atomic script.
+        Other cache backends have no compare-and-act, so the claim can expire and be
+        taken over between the read and the touch. The touch only follows right
+        after the read, so the window is a single cache round trip.
+
+        :param owner: Unique ID of the claiming run
+        :type owner: str
+        :param timeout: New lease time in seconds
+        :type timeout: int
+        :return: False if the claim has expired or is held by someone else
+        :rtype: bool
+        """
+
+        cache_key = self._get_cache_key()
+
+        logger.debug(f"Extending claim for: {cache_key}")
+
+        extended = self._run_claim_script(EXTEND_CLAIM_SCRIPT, owner, timeout)
+
+        if extended is not None:
+            return bool(extended)
+
+        if cache.get(key=cache_key) != owner:
+            return False
+
+        return bool(cache.touch(key=cache_key, timeout=timeout))
+
+    def release(self, owner: str) -> None:
+        """
+        Release a claim, as long as the owner still holds it.
+
+        Atomic on Redis, with the same race on other cache backends as `extend()`.
+
+        :param owner: Unique ID of the claiming run
+        :type owner: str
         :return:
         :rtype:
         """
 
         cache_key = self._get_cache_key()
 
-        logger.debug(f"Setting cache for: {cache_key}")
+        logger.debug(f"Releasing claim for: {cache_key}")
 
-        cache.set(
-            key=cache_key,
-            value=value,
-            timeout=self._get_max_cache_time(),
-        )
+        if self._run_claim_script(RELEASE_CLAIM_SCRIPT, owner) is not None:
+            return
+
+        if cache.get(key=cache_key) == owner:
+            cache.delete(key=cache_key)
+
+    @classmethod
+    def get_many(cls, subkeys: list[str]) -> dict:
+        """
+        Get the cache values for several subkeys with a single cache read.
+
+        :param subkeys:
+        :type subkeys: list[str]
+        :return: Value per subkey, False for missing keys
+        :rtype: dict
+        """
+
+        cache_keys = {cls(subkey=subkey)._get_cache_key(): subkey for subkey in subkeys}
+
+        logger.debug(f"Getting cache for: {', '.join(cache_keys)}")
+
+        values = cache.get_many(keys=list(cache_keys))
+
+        return {
+            subkey: values.get(cache_key, False)
+            for cache_key, subkey in cache_keys.items()
+        }
+
+    @classmethod
+    def set_many(cls, values: dict[str, Any], timeout: int) -> None:
+        """
+        Set the cache values for several subkeys with a single cache write.
+
+        :param values: Value per subkey
+        :type values: dict[str, Any]
+        :param timeout: Timeout in seconds
+        :type timeout: int
+        :return:
+        :rtype:
+        """
+
+        data = {
+            cls(subkey=subkey)._get_cache_key(): value
+            for subkey, value in values.items()
+        }
+
+        logger.debug(f"Setting cache for: {', '.join(data)}")
+
+        cache.set_many(data=data, timeout=timeout)
 
     def get(self) -> Any:
         """
@@ -0,0 +1,610 @@
+"""
+Deletion handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+import math
+import random
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any
+
+# Django
+from django.db import OperationalError, router, transaction
+from django.db.models import Count, Max, Min, QuerySet
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.app_settings import (
+    TNNT_HOUSEKEEPING_BATCH_SIZE,
+    TNNT_HOUSEKEEPING_RETRY_ATTEMPTS,
+    TNNT_HOUSEKEEPING_RETRY_BACKOFF,
+    TNNT_HOUSEKEEPING_RETRY_BACKOFF_MAX,
+)
+from tnnt_housekeeping.handler.archive import Archive
+from tnnt_housekeeping.handler.plan import DeletionPlan
+from tnnt_housekeeping.handler.signals import affected_users, reconcile_users
+from tnnt_housekeeping.handler.throttle import AdaptiveThrottle
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+# MySQL/MariaDB: lock wait timeout exceeded, deadlock found
+RETRYABLE_MYSQL_ERRORS = (1205, 1213)
+# PostgreSQL: serialization failure, deadlock detected, lock not available
+RETRYABLE_SQLSTATES = ("40001", "40P01", "55P03")
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check whether a database error is a deadlock or lock timeout, which is worth retrying.
+
+    :param error:
+    :type error:
+    :return:
+    :rtype:
+    """
+
+    if not isinstance(error, OperationalError):
+        return False
+
+    cause = error.__cause__ or error
+    sqlstate = getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)
+
+    if sqlstate is not None:
+        return sqlstate in RETRYABLE_SQLSTATES
+
+    return bool(error.args) and error.args[0] in RETRYABLE_MYSQL_ERRORS
+
+
+def backoff(attempt: int) -> float:
+    """
+    Seconds to wait before the next attempt, with full jitter.
+
+    :param attempt: Number of the failed attempt, starting at 1
+    :type attempt: int
+    :return:
+    :rtype:
+    """
+
+    return random.uniform(  # nosec B311 (not used for security)
+        0,
+        min(
+            TNNT_HOUSEKEEPING_RETRY_BACKOFF_MAX,
+            TNNT_HOUSEKEEPING_RETRY_BACKOFF * 2 ** (attempt - 1),
+        ),
+    )
+
+
+@dataclass
+class DeletionResult:
+    """
+    Rows actually deleted by a deletion run.
+
+    - `per_model` maps the model label (e.g. `eveonline.EveCharacter`) to the
+      number of rows deleted from it, cascaded rows included.
+    - `finished` is False if the run stopped early and has to be resumed.
+    - `retries` counts the batches retried after a deadlock or lock timeout.
+    - `failed` is True if the run ended with an error.
+    - `breakdown` maps the values of the run's breakdown field, e.g. a level,
+      to the number of rows deleted from the queryset's model with that value.
+    """
+
+    batches: int = 0
+    per_model: Counter = field(default_factory=Counter)
+    finished: bool = True
+    retries: int = 0
+    failed: bool = False
+    breakdown: Counter = field(default_factory=Counter)
+
+    @property
+    def total(self) -> int:
+        """
+        Total number of deleted rows over all models.
+
+        :return:
+        :rtype:
+        """
+
+        return sum(self.per_model.values())
+
+    def deleted(self, model_label: str) -> int:
+        """
+        Number of rows deleted from a single model.
+
+        :param model_label: Model label, e.g. `eveonline.EveCharacter`
+        :type model_label: str
+        :return:
+        :rtype:
+        """
+
+        return self.per_model.get(model_label, 0)
+
+    def add(self, per_model: dict, breakdown: dict | None = None) -> None:
+        """
+        Add the outcome of a single batch.
+
+        :param per_model: Deleted rows per model label, as returned by `QuerySet.delete()`
+        :type per_model: dict
+        :param breakdown: Deleted rows per value of the breakdown field
+        :type breakdown: dict | None
+        :return:
+        :rtype:
+        """
+
+        self.batches += 1
+        self.per_model.update(
+            {label: count for label, count in per_model.items() if count}
+        )
+        self.breakdown.update(breakdown or {})
+
+    def merge(self, other: "DeletionResult") -> None:
+        """
+        Add the outcome of another run, e.g. of another shard.
+
+        :param other:
+        :type other:
+        :return:
+        :rtype:
+        """
+
+        self.batches += other.batches
+        self.per_model.update(other.per_model)
+        self.finished = self.finished and other.finished
+        self.retries += other.retries
+        self.failed = self.failed or other.failed
+        self.breakdown.update(other.breakdown)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DeletionResult":
+        """
+        Restore a result from its serializable representation.
+
+        :param data: As returned by `as_dict()`
+        :type data: dict
+        :return:
+        :rtype:
+        """
+
+        return cls(
+            batches=data["batches"],
+            per_model=Counter(data["per_model"]),
+            finished=data.get("finished", True),
+            retries=data.get("retries", 0),
+            failed=data.get("failed", False),
+            breakdown=Counter(data.get("breakdown", {})),
+        )
+
+    def as_dict(self) -> dict:
+        """
+        Serializable representation, used as task result.
+
+        :return:
+        :rtype:
+        """
+
+        return {
+            "batches": self.batches,
+            "total": self.total,
+            "per_model": dict(self.per_model),
+            "finished": self.finished,
+            "retries": self.retries,
+            "failed": self.failed,
+            "breakdown": dict(self.breakdown),
+        }
+
+
+class BatchedDeletion:  # pylint: disable=too-many-instance-attributes
+    """
+    Delete the rows of a queryset in keyset-paginated batches.
+
+    - Candidate primary keys are fetched in ascending order, `batch_size` at a time.
+    - Every batch is deleted in its own transaction, so memory use and lock time
+      are bounded by the batch size, not by the number of candidates.
+    - If a safe deletion plan is registered for the model, the batch is deleted with
+      its set-based statements, otherwise with Django's deletion collector.
+    - A batch failing with a deadlock or lock timeout is retried with a jittered
+      backoff, up to TNNT_HOUSEKEEPING_RETRY_ATTEMPTS times. Other errors, and the
+      last failed attempt, end the run.
+    - With a throttle, the batch size and the pause between batches follow the
+      measured commit latency of every batch, see `AdaptiveThrottle`.
+    - The heartbeat is called after every committed batch. When it returns False, e.g.
+      because the claim it extends expired and may be held by another worker, the run
+      stops at this batch boundary.
+    - With a time budget, the run stops at the first batch boundary after the budget
+      is used up. `cursor` is the last primary key handled, a new run started with
+      this cursor continues where the previous one stopped.
+    - With `read_using`, the pages of candidates are read from that database, e.g. a
+      replica. Every batch is deleted on the primary, where the queryset's filter is
+      applied again, so a lagging replica never causes a wrong delete.
+    - With `defer_signals` (bulk mode), delete signal receivers registered as
+      deferrable don't keep the deletion plan from being used. Instead of running
+      per row, the affected users are reconciled once per batch after it committed,
+      see `reconcile_users()`. The deletion collector still runs all receivers.
+    - With an archive, every batch is locked and written to it, with the rows it
+      cascades to, before it is deleted, see `Archive`.
+    - With `breakdown`, every batch is locked first, and its rows are counted per
+      value of that field with one grouped query in the batch's transaction.
+    - `before_delete` is called with every batch in its transaction, before it is
+      deleted. A callable it returns runs once the batch committed, e.g. to invalidate
+      what `Model.delete()` would have, which deleting in bulk doesn't call.
+    - `select` is called with the primary keys of every page of candidates, and
+      returns those to delete, e.g. to keep rows for a grace period the database
+      can't tell. The cursor still moves past the whole page.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        queryset: QuerySet,
+        *,
+        batch_size: int | None = None,
+        heartbeat: Callable[[], Any] | None = None,
+        time_budget: float | None = None,
+        cursor: Any = None,
+        throttle: AdaptiveThrottle | None = None,
+        read_using: str | None = None,
+        defer_signals: bool = False,
+        archive: Archive | None = None,
+        breakdown: str | None = None,
+        before_delete: Callable[[QuerySet], Callable[[], Any] | None] | None = None,
+        select: Callable[[list], list] | None = None,
+    ) -> None:
+        """
+        Initialize the BatchedDeletion with a queryset and a batch size.
+
+        :param queryset: Queryset selecting the rows to delete
+        :type queryset: QuerySet
+        :param batch_size: Number of rows per batch, defaults to TNNT_HOUSEKEEPING_BATCH_SIZE
+        :type batch_size: int | None
+        :param heartbeat: Called after every committed batch, e.g. to extend a claim.
+            Returning False stops the run.
+        :type heartbeat: Callable[[], Any] | None
+        :param time_budget: Wall-clock seconds the run may take, None for no limit
+        :type time_budget: float | None
+        :param cursor: Only consider primary keys after this one, to resume a run
+        :type cursor: Any
+        :param throttle: Adjusts the batch size and pauses, starting at its batch size
+        :type throttle: AdaptiveThrottle | None
+        :param read_using: Database alias to read the candidates from, defaults to the primary
+        :type read_using: str | None
+        :param defer_signals: Reconcile the users of deferrable receivers after every batch
+        :type defer_signals: bool
+        :param archive: Archive the rows of every batch are written to before deleting them
+        :type archive: Archive | None
+        :param breakdown: Field the deleted rows are counted by, e.g. a level
+        :type breakdown: str | None
+        :param before_delete: Called with every batch before it is deleted, returns
+            a callable to run once the batch committed, or None
+        :type before_delete: Callable[[QuerySet], Callable[[], Any] | None] | None
+        :param select: Called with every page of candidate primary keys, returns those
+            to delete
+        :type select: Callable[[list], list] | None
+        """
+
+        if throttle is not None:
+            batch_size = throttle.batch_size
+
+        if batch_size is None:
+            batch_size = TNNT_HOUSEKEEPING_BATCH_SIZE
+
+        if not isinstance(batch_size, int) or isinstance(batch_size, bool):
+            raise TypeError("Argument 'batch_size' must be an integer")
+
+        if batch_size < 1:
+            raise ValueError("Argument 'batch_size' must be a positive integer")
+
+        self.queryset = queryset
+        # QuerySet.db is the read database unless the queryset is used for writing
+        self.using = queryset._db or router.db_for_write(queryset.model)
+        self.read_using = read_using
+        self.defer_signals = defer_signals
+        self.archive = archive
+        self.breakdown = breakdown
+        self.before_delete = before_delete
+        self.select = select
+        self.batch_size = batch_size
+        self.heartbeat = heartbeat
+        self.time_budget = time_budget
+        self.cursor = cursor
+        self.throttle = throttle
+        self.result = DeletionResult()
+
+    def batches(self) -> Iterator[list]:
+        """
+        Yield the candidate primary keys page by page, in ascending order.
+
+        Each page starts after the last primary key of the previous one,
+        so no OFFSET is needed, and rows deleted in between are never skipped.
+        The first page starts after the cursor, if one is set.
+
+        :return:
+        :rtype:
+        """
+
+        last_pk = self.cursor
+
+        while True:
+            # The throttle may have changed the batch size since the previous page
+            batch_size = self.batch_size
+            queryset = self.queryset
+
+            if self.read_using is not None:
+                queryset = queryset.using(self.read_using)
+
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+
+            pks = list(
+                queryset.order_by("pk").values_list("pk", flat=True)[:batch_size]
+            )
+
+            if not pks:
+                return
+
+            yield pks
+
+            if len(pks) < batch_size:
+                return
+
+            last_pk = pks[-1]
+
+    def delete_batch(self, pks: list) -> tuple[dict, dict]:
+        """
+        Delete a single batch in its own transaction.
+
+        The queryset's filter is applied again, so rows that no longer
+        match since their primary keys were fetched are left alone.
+
+        :param pks: Primary keys of the batch
+        :type pks: list
+        :return: Deleted rows per model label, including cascaded rows,
+            and deleted rows per value of the breakdown field
+        :rtype: tuple[dict, dict]
+        """
+
+        queryset = self.queryset.using(self.using).filter(pk__in=pks)
+        plan = DeletionPlan.for_model(model=self.queryset.model)
+
+        locked = None
+
+        with transaction.atomic(using=self.using):
+            if self.archive is not None or self.breakdown is not None:
+                # Locked first, so exactly the rows that are deleted are archived
+                # and counted
+                locked = list(queryset.select_for_update().values_list("pk", flat=True))
+                queryset = self.queryset.using(self.using).filter(pk__in=locked)
+
+            if self.archive is not None and locked:
+                self.archive.write(
+                    model=self.queryset.model, pks=locked, using=self.using
+                )
+
+            breakdown = (
+                dict(
+                    queryset.order_by()
+                    .values_list(self.breakdown)
+                    .annotate(rows=Count("pk"))
+                )
+                if self.breakdown is not None
+                else {}
+            )
+
+            if self.before_delete is not None:
+                callback = self.before_delete(queryset)
+
+                # Dropped with the batch if it rolls back
+                if callback is not None:
+                    transaction.on_commit(callback, using=self.using)
+
+            if plan is not None and plan.is_safe(deferred=self.defer_signals):
+                user_ids = (
+                    affected_users(steps=plan.steps, queryset=queryset)
+                    if self.defer_signals
+                    else set()
+                )
+                per_model = plan.execute(queryset=queryset, pks=locked)
+
+                # Dropped with the batch if it rolls back
+                if user_ids:
+                    transaction.on_commit(
+                        partial(reconcile_users, user_ids=user_ids), using=self.using
+                    )
+
+                return per_model, breakdown
+
+            _, per_model = queryset.delete()
+
+        return per_model, breakdown
+
+    def in_outer_transaction(self) -> bool:
+        """
+        Check whether the deletion runs inside a transaction of the caller.
+
+        :return:
+        :rtype:
+        """
+
+        return transaction.get_connection(using=self.using).in_atomic_block
+
+    def delete_batch_with_retry(self, pks: list) -> tuple[dict, dict]:
+        """
+        Delete a single batch, retrying it after a deadlock or lock timeout.
+
+        Inside an outer transaction, the failed statement may have rolled back
+        more than the batch, so the error is raised right away.
+
+        :param pks: Primary keys of the batch
+        :type pks: list
+        :return: Deleted rows per model label and per value of the breakdown field
+        :rtype: tuple[dict, dict]
+        """
+
+        attempt = 1
+
+        while True:
+            try:
+                return self.delete_batch(pks=pks)
+            except OperationalError as e:
+                if (
+                    not is_retryable(error=e)
+                    or attempt >= TNNT_HOUSEKEEPING_RETRY_ATTEMPTS
+                    or self.in_outer_transaction()
+                ):
+                    raise
+
+                delay = backoff(attempt=attempt)
+
+                logger.warning(
+                    f"Batch {self.result.batches + 1} failed on attempt {attempt} "
+                    f"({e}), retrying in {delay:.2f}s."
+                )
+
+                self.result.retries += 1
+                attempt += 1
+                time.sleep(delay)
+
+    def run(self) -> DeletionResult:
+        """
+        Delete all rows of the queryset, batch by batch.
+
+        The counts are taken from what was actually deleted. They are
+        collected in `self.result` as the batches commit, so they are
+        still available if a later batch fails.
+
+        :return: Deleted rows per model, including cascaded rows
+        :rtype: DeletionResult
+        """
+
+        started = time.monotonic()
+
+        for pks in self.batches():
+            batch_started = time.monotonic()
+            selected = pks if self.select is None else self.select(pks)
+            per_model, breakdown = (
+                self.delete_batch_with_retry(pks=selected) if selected else ({}, {})
+            )
+            latency = time.monotonic() - batch_started
+            # A short page is the last one, so there is nothing left to resume
+            last_page = len(pks) < self.batch_size
+            self.result.add(per_model=per_model, breakdown=breakdown)
+            self.cursor = pks[-1]
+
+            logger.debug(
+                f"Batch {self.result.batches}: Deleted {sum(per_model.values())} "
+                f"rows for {len(selected)} candidates."
+            )
+
+            if self.heartbeat is not None and self.heartbeat() is False:
+                logger.warning(
+                    f"Heartbeat failed after {self.result.batches} batches, "
+                    f"stopping at {self.cursor}."
+                )
+
+                self.result.finished = False
+
+                return self.result
+
+            if (
+                self.time_budget is not None
+                and not last_page
+                and time.monotonic() - started >= self.time_budget
+            ):
+                logger.info(
+                    f"Time budget of {self.time_budget:.0f}s used up after "
+                    f"{self.result.batches} batches, stopping at {self.cursor}."
+                )
+
+                self.result.finished = False
+
+                return self.result
+
+            if self.throttle is not None and not last_page:
+                self.throttle.observe(latency=latency)
+                self.batch_size = self.throttle.batch_size
+
+                if self.throttle.sleep:
+                    time.sleep(self.throttle.sleep)
+
+        return self.result
+
+
+def pk_ranges(queryset: QuerySet, shards: int) -> list[tuple[int, int]]:
+    """
+    Split the primary key range of a queryset into up to `shards` inclusive ranges.
+
+    The ranges are of equal width, not of equal row count, so only a single
+    aggregate query is needed.
+
+    :param queryset: Queryset selecting the candidate rows
+    :type queryset: QuerySet
+    :param shards: Maximum number of ranges
+    :type shards: int
+    :return: List of (first pk, last pk) tuples, empty if there are no candidates
+    :rtype: list[tuple[int, int]]
+    """
+
+    if shards < 1:
+        raise ValueError("Argument 'shards' must be a positive integer")
+
+    bounds = queryset.aggregate(pk_min=Min("pk"), pk_max=Max("pk"))
+    pk_min, pk_max = bounds["pk_min"], bounds["pk_max"]
+
+    if pk_min is None:
+        return []
+
+    size = math.ceil((pk_max - pk_min + 1) / shards)
+
+    return [
+        (start, min(start + size - 1, pk_max))
+        for start in range(pk_min, pk_max + 1, size)
+    ]
+
+
+def pk_quantile_ranges(queryset: QuerySet, shards: int) -> list[tuple[int, int]]:
+    """
+    Split the candidates of a queryset into up to `shards` inclusive primary key ranges
+    of about the same number of candidates.
+
+    Unlike `pk_ranges()`, clustered candidates don't end up in a single range. It takes
+    a count and one query per range, reading the first primary key of the range at its
+    offset in the primary key order.
+
+    :param queryset: Queryset selecting the candidate rows
+    :type queryset: QuerySet
+    :param shards: Maximum number of ranges
+    :type shards: int
+    :return: List of (first pk, last pk) tuples, empty if there are no candidates
+    :rtype: list[tuple[int, int]]
+    """
+
+    if shards < 1:
+        raise ValueError("Argument 'shards' must be a positive integer")
+
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    count = pks.count()
+
+    if not count:
+        return []
+
+    size = math.ceil(count / shards)
+    starts = []
+
+    for offset in range(0, count, size):
+        # Empty once candidates were deleted since they were counted
+        starts.extend(pks[offset : offset + 1])
+
+    pk_max = queryset.aggregate(pk_max=Max("pk"))["pk_max"]
+
+    if not starts or pk_max is None:
+        return []
+
+    ranges = [(start, next_start - 1) for start, next_start in zip(starts, starts[1:])]
+    ranges.append((starts[-1], pk_max))
+
+    return ranges
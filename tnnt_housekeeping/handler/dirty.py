@@ -0,0 +1,202 @@
+"""
+Dirty set handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+from functools import partial
+from typing import Any
+
+# Django
+from django.db import models, transaction
+from django.db.models.signals import post_save
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.app_settings import TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL
+from tnnt_housekeeping.handler.cache import Cache
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+CACHE_KEY_DIRTY_SET = "dirty-set"
+
+# Beyond this many changed rows, a full scan is cheaper than filtering every page
+# of candidates by all of their primary keys
+MAX_DIRTY_PKS = 5000
+
+
+class DirtySet:
+    """
+    Cache-backed set of the primary keys of rows that changed into a rule's candidates.
+
+    The Django cache has no atomic set, so this is an append-only log: adding a
+    primary key increments the `head` counter and stores the key at that position.
+    A drain remembers the last position handled as `tail`. Concurrent saves never
+    overwrite each other, and keys added while a run is in progress are kept for
+    the next one. Entries expire after TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL, by
+    then a full scan has covered them.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Initialize the DirtySet of a rule.
+
+        :param name: Name of the cleanup rule
+        :type name: str
+        """
+
+        self.name = name
+
+    def _subkey(self, position: Any) -> str:
+        """
+        Cache subkey of a log position, or of the `head` and `tail` counters.
+
+        :param position:
+        :type position:
+        :return:
+        :rtype:
+        """
+
+        return f"{CACHE_KEY_DIRTY_SET}:{self.name}:{position}"
+
+    def add(self, pk: Any) -> None:
+        """
+        Add a primary key to the set.
+
+        Nothing is added without TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL, every run scans
+        fully then and the entries would never expire.
+
+        :param pk:
+        :type pk:
+        :return:
+        :rtype:
+        """
+
+        if not TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL:
+            return
+
+        position = Cache(subkey=self._subkey(position="head")).incr(timeout=None)
+
+        Cache(subkey=self._subkey(position=position)).set(
+            value=pk, timeout=TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL
+        )
+
+    def snapshot(self) -> tuple[int, set] | None:
+        """
+        Get the primary keys added since the last drain.
+
+        :return: The head position to drain up to and the primary keys,
+            or None if there are more than MAX_DIRTY_PKS
+        :rtype: tuple[int, set] | None
+        """
+
+        cached = Cache.get_many(
+            subkeys=[self._subkey(position="head"), self._subkey(position="tail")]
+        )
+        head = int(cached[self._subkey(position="head")] or 0)
+        tail = int(cached[self._subkey(position="tail")] or 0)
+
+        logger.debug(f"Dirty set of {self.name}: positions {tail + 1} to {head}")
+
+        if head - tail > MAX_DIRTY_PKS:
+            return None
+
+        values = Cache.get_many(
+            subkeys=[
+                self._subkey(position=position)
+                for position in range(tail + 1, head + 1)
+            ]
+        )
+
+        return head, {pk for pk in values.values() if pk is not False}
+
+    def head(self) -> int:
+        """
+        Get the position of the last primary key added.
+
+        :return:
+        :rtype:
+        """
+
+        return int(Cache(subkey=self._subkey(position="head")).get() or 0)
+
+    def drain(self, head: int) -> None:
+        """
+        Mark the primary keys up to a head position as handled.
+
+        :param head: Head position taken from `snapshot()`
+        :type head: int
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey=self._subkey(position="tail")).set(value=head, timeout=None)
+
+
+_tracked: dict[type[models.Model], list] = {}
+
+
+def track(rule) -> None:
+    """
+    Keep the dirty set of a rule with a `matches` predicate up to date.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :return:
+    :rtype:
+    """
+
+    if rule.matches is None:
+        return
+
+    _tracked.setdefault(rule.model, [])
+
+    if rule not in _tracked[rule.model]:
+        _tracked[rule.model].append(rule)
+
+    post_save.connect(
+        mark_dirty,
+        sender=rule.model,
+        dispatch_uid=f"{__name__}.mark_dirty.{rule.model._meta.label}",
+    )
+
+
+def mark_dirty(  # pylint: disable=unused-argument
+    sender, instance, raw=False, using=None, **kwargs
+) -> None:
+    """
+    post_save receiver adding a saved row to the dirty set of every rule it now matches.
+
+    The primary key is added once the transaction commits, a rolled back save leaves
+    no trace. This never fails the save.
+
+    :param sender:
+    :type sender:
+    :param instance:
+    :type instance:
+    :param raw: Saved as is, e.g. when loading a fixture
+    :type raw: bool
+    :param using:
+    :type using:
+    :param kwargs:
+    :type kwargs:
+    :return:
+    :rtype:
+    """
+
+    if raw:
+        return
+
+    for rule in _tracked.get(sender, []):
+        try:
+            if rule.matches(instance):
+                transaction.on_commit(
+                    partial(DirtySet(name=rule.name).add, pk=instance.pk),
+                    using=using,
+                    robust=True,
+                )
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Failed to mark {instance!r} for {rule.name}: {e}")
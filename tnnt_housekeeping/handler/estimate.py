@@ -0,0 +1,142 @@
+"""
+Impact estimate handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+from collections import Counter
+from dataclasses import dataclass, field
+
+# Django
+from django.db.models import Q
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.app_settings import TNNT_HOUSEKEEPING_READ_DATABASE
+from tnnt_housekeeping.handler.plan import ACTION_SET_NULL, DeletionPlan
+from tnnt_housekeeping.providers import AppLogger
+from tnnt_housekeeping.rules import CleanupRule
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+# What a run does with rules whose estimated impact exceeds the threshold
+IMPACT_ACTION_SHARD = "shard"
+IMPACT_ACTION_REFUSE = "refuse"
+IMPACT_ACTIONS = (IMPACT_ACTION_SHARD, IMPACT_ACTION_REFUSE)
+
+
+@dataclass
+class ImpactEstimate:
+    """
+    Estimated impact of a cleanup rule run, without deleting anything.
+
+    - `deleted` maps the model label to the number of rows the run would delete,
+      the rule's own model and cascaded rows included.
+    - `set_null` maps the model label to the number of rows whose foreign key
+      would be set to NULL.
+    - `blockers` lists why the deletion collector is needed instead of the plan.
+      Relations behind a blocker are not part of the counts.
+    """
+
+    rule: str
+    candidates: int = 0
+    deleted: Counter = field(default_factory=Counter)
+    set_null: Counter = field(default_factory=Counter)
+    blockers: list = field(default_factory=list)
+    explain: str = ""
+
+    @property
+    def total(self) -> int:
+        """
+        Total number of rows the run would delete over all models.
+
+        :return:
+        :rtype:
+        """
+
+        return sum(self.deleted.values())
+
+    def as_dict(self) -> dict:
+        """
+        Serializable representation, e.g. for the dry-run output.
+
+        :return:
+        :rtype:
+        """
+
+        return {
+            "rule": self.rule,
+            "candidates": self.candidates,
+            "total": self.total,
+            "deleted": dict(self.deleted),
+            "set_null": dict(self.set_null),
+            "blockers": self.blockers,
+            "explain": self.explain,
+        }
+
+
+def estimate_rule(
+    rule: CleanupRule,
+    explain: bool = True,
+    using: str | None = None,
+    q: Q | None = None,
+) -> ImpactEstimate:
+    """
+    Estimate the impact of a cleanup rule run.
+
+    The cascade fan-out is counted with one `COUNT(*)` per related model, selecting
+    the related rows through a subquery on the candidate primary keys, so no rows
+    are loaded into Python. It only reads, so it runs on TNNT_HOUSEKEEPING_READ_DATABASE
+    if that is set.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :param explain: Include the database's query plan of the candidate query
+    :type explain: bool
+    :param using: Database alias to read from, defaults to TNNT_HOUSEKEEPING_READ_DATABASE
+    :type using: str | None
+    :param q: Only estimate the candidates matching this filter, e.g. a shard's range
+    :type q: Q | None
+    :return:
+    :rtype: ImpactEstimate
+    """
+
+    queryset = rule.candidates().using(using or TNNT_HOUSEKEEPING_READ_DATABASE)
+
+    if q is not None:
+        queryset = queryset.filter(q)
+
+    using = queryset.db
+    plan = DeletionPlan.for_model(model=rule.model) or DeletionPlan(model=rule.model)
+    candidate_pks = queryset.order_by().values("pk")
+    estimate = ImpactEstimate(rule=rule.name, blockers=list(plan.blockers))
+
+    for step in plan.steps:
+        label = step.model._meta.label
+        count = (
+            step.model._base_manager.using(using)
+            .filter(**{f"{step.lookup}__in": candidate_pks})
+            .count()
+        )
+
+        if step.action == ACTION_SET_NULL:
+            estimate.set_null[label] += count
+        else:
+            estimate.deleted[label] += count
+
+    estimate.candidates = estimate.deleted[rule.model._meta.label]
+
+    if explain:
+        # The query the batches are paged with
+        estimate.explain = (
+            queryset.order_by("pk").values_list("pk", flat=True).explain()
+        )
+
+    logger.debug(
+        f"Estimated impact of {rule.name}: {estimate.candidates} candidates, "
+        f"{estimate.total} rows in total: {dict(estimate.deleted)}"
+    )
+
+    return estimate
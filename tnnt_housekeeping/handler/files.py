@@ -0,0 +1,37 @@
+"""
+File handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+import os
+import tempfile
+
+
+def write_atomically(path: str, content: str) -> None:
+    """
+    Write a text file atomically, so readers never see half a file.
+
+    The content is written to a temporary file in the same directory first,
+    which then replaces the file.
+
+    :param path:
+    :type path:
+    :param content:
+    :type content:
+    :return:
+    :rtype:
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tnnt-housekeeping-")
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(content)
+
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+
+        raise
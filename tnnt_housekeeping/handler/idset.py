@@ -0,0 +1,281 @@
+"""
+Compact ID set handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+import base64
+from array import array
+from collections.abc import Iterable, Iterator
+
+# Django
+from django.db.models import Q
+
+# Encoding modes, the first byte of an encoded set
+MODE_RUNS = 0
+MODE_SPARSE = 1
+
+# Runs at least this long are filtered with a range lookup instead of IN
+RANGE_LOOKUP_MIN_LENGTH = 3
+
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    """
+    Append an unsigned integer as LEB128 varint, 7 bits per byte.
+
+    :param buffer:
+    :type buffer:
+    :param value:
+    :type value:
+    :return:
+    :rtype:
+    """
+
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    buffer.append(value)
+
+
+def _read_varints(data: bytes, offset: int) -> Iterator[int]:
+    """
+    Read the LEB128 varints of a buffer, starting at an offset.
+
+    :param data:
+    :type data:
+    :param offset:
+    :type offset:
+    :return:
+    :rtype:
+    """
+
+    value = 0
+    shift = 0
+
+    for byte in data[offset:]:
+        value |= (byte & 0x7F) << shift
+
+        if byte & 0x80:
+            shift += 7
+
+            continue
+
+        yield value
+
+        value = 0
+        shift = 0
+
+    if shift:
+        raise ValueError("Truncated ID set")
+
+
+class IdSet:
+    """
+    Sorted set of non-negative integer IDs, e.g. candidate primary keys, kept as runs
+    of consecutive IDs, with a compact encoding for Celery messages and the cache.
+
+    - The runs are held in two `array("q")`, their first and last IDs, so a contiguous
+      range of any length takes two integers.
+    - `encode()` gives an ASCII string, safe for the JSON serializer. Every run is stored
+      as two delta varints, its gap to the previous run and its length. Without any
+      consecutive IDs, only the gaps are stored. A set of 200,000 IDs with small gaps
+      takes a few hundred KB instead of the megabytes of a JSON list, a contiguous
+      range a few bytes.
+    - `q()` filters a queryset by the set with one range lookup per long run.
+    """
+
+    def __init__(self, ids: Iterable[int] = ()) -> None:
+        """
+        Initialize the IdSet.
+
+        :param ids: IDs in any order, duplicates are dropped
+        :type ids: Iterable[int]
+        """
+
+        self.starts = array("q")
+        self.ends = array("q")
+
+        for value in sorted(set(ids)):
+            self._append(start=value, end=value)
+
+    @classmethod
+    def from_range(cls, start: int, end: int) -> "IdSet":
+        """
+        Create an IdSet of an inclusive range, without materializing its IDs.
+
+        :param start:
+        :type start:
+        :param end:
+        :type end:
+        :return:
+        :rtype:
+        """
+
+        id_set = cls()
+
+        if end >= start:
+            id_set._append(start=start, end=end)
+
+        return id_set
+
+    def _append(self, start: int, end: int) -> None:
+        """
+        Append a run after the last one, merging them if they touch.
+
+        :param start:
+        :type start:
+        :param end:
+        :type end:
+        :return:
+        :rtype:
+        """
+
+        if start < 0:
+            raise ValueError("IDs must not be negative")
+
+        if self.ends and start <= self.ends[-1] + 1:
+            self.ends[-1] = max(self.ends[-1], end)
+
+            return
+
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in self.ranges())
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in self.ranges():
+            yield from range(start, end + 1)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, IdSet):
+            return NotImplemented
+
+        return self.starts == other.starts and self.ends == other.ends
+
+    def __repr__(self) -> str:
+        return f"IdSet({len(self)} IDs in {len(self.starts)} runs)"
+
+    def ranges(self) -> Iterator[tuple[int, int]]:
+        """
+        Get the runs of consecutive IDs as inclusive ranges.
+
+        :return:
+        :rtype:
+        """
+
+        return zip(self.starts, self.ends)
+
+    def chunks(self, count: int) -> list["IdSet"]:
+        """
+        Split the set into up to `count` sets of about the same number of IDs.
+
+        :param count:
+        :type count:
+        :return:
+        :rtype:
+        """
+
+        if count < 1:
+            raise ValueError("Argument 'count' must be a positive integer")
+
+        size = -(-len(self) // count)
+        chunks = []
+        current = IdSet()
+        current_size = 0
+
+        for start, end in self.ranges():
+            while start <= end:
+                take = min(end - start + 1, size - current_size)
+                current._append(start=start, end=start + take - 1)
+                current_size += take
+                start += take
+
+                if current_size == size:
+                    chunks.append(current)
+                    current = IdSet()
+                    current_size = 0
+
+        if current_size:
+            chunks.append(current)
+
+        return chunks
+
+    def q(self, field: str = "pk") -> Q:
+        """
+        Get the Q object filtering a field by the set.
+
+        :param field:
+        :type field:
+        :return: A Q object matching nothing for an empty set
+        :rtype:
+        """
+
+        q = Q()
+        singles = []
+
+        for start, end in self.ranges():
+            if end - start + 1 >= RANGE_LOOKUP_MIN_LENGTH:
+                q |= Q(**{f"{field}__range": (start, end)})
+            else:
+                singles.extend(range(start, end + 1))
+
+        if singles or not q:
+            q |= Q(**{f"{field}__in": singles})
+
+        return q
+
+    def encode(self) -> str:
+        """
+        Encode the set as a compact ASCII string.
+
+        :return:
+        :rtype:
+        """
+
+        sparse = all(start == end for start, end in self.ranges())
+        buffer = bytearray([MODE_SPARSE if sparse else MODE_RUNS])
+        previous = -1
+
+        for start, end in self.ranges():
+            _write_varint(buffer=buffer, value=start - previous - 1)
+
+            if not sparse:
+                _write_varint(buffer=buffer, value=end - start)
+
+            previous = end
+
+        return base64.b85encode(bytes(buffer)).decode("ascii")
+
+    @classmethod
+    def decode(cls, encoded: str) -> "IdSet":
+        """
+        Decode a set encoded with `encode()`.
+
+        :param encoded:
+        :type encoded:
+        :return:
+        :rtype:
+        """
+
+        data = base64.b85decode(encoded.encode("ascii"))
+
+        if not data or data[0] not in (MODE_RUNS, MODE_SPARSE):
+            raise ValueError("Not an encoded ID set")
+
+        varints = _read_varints(data=data, offset=1)
+        id_set = cls()
+        previous = -1
+
+        for gap in varints:
+            start = previous + gap + 1
+            length = 0 if data[0] == MODE_SPARSE else next(varints, None)
+
+            if length is None:
+                raise ValueError("Truncated ID set")
+
+            id_set._append(start=start, end=start + length)
+            previous = start + length
+
+        return id_set
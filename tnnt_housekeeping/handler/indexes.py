@@ -0,0 +1,262 @@
+"""
+Supporting index handler for TN-NT Housekeeping.
+"""
+
+# Django
+from django.db import connections, models
+from django.db.migrations.operations.base import Operation
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+
+def supporting_columns(model: type[models.Model], fields: tuple[str, ...]) -> list:
+    """
+    Columns of the index supporting a cleanup predicate on `fields`.
+
+    The primary key comes last, so the keyset-paginated batches
+    (`WHERE <predicate> ORDER BY pk LIMIT n`) are read from the index in order.
+
+    :param model:
+    :type model:
+    :param fields: Fields the predicate filters on
+    :type fields: tuple[str, ...]
+    :return:
+    :rtype:
+    """
+
+    return [model._meta.get_field(name).column for name in fields] + [
+        model._meta.pk.column
+    ]
+
+
+def index_columns(model: type[models.Model], using: str) -> dict[str, list]:
+    """
+    Get the indexes of a model's table from the database.
+
+    :param model:
+    :type model:
+    :param using: Database alias
+    :type using: str
+    :return: Columns per index name
+    :rtype: dict[str, list]
+    """
+
+    connection = connections[using]
+
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        )
+
+    return {
+        name: constraint["columns"]
+        for name, constraint in constraints.items()
+        if constraint["index"] or constraint["unique"] or constraint["primary_key"]
+    }
+
+
+def is_supported(
+    model: type[models.Model], fields: tuple[str, ...], using: str
+) -> bool:
+    """
+    Check whether an existing index supports a cleanup predicate on `fields`.
+
+    An index does if its leading columns are the predicate's columns, in any order,
+    followed by the primary key. InnoDB appends the primary key to every secondary
+    index, so on MySQL the predicate's columns are enough.
+
+    :param model:
+    :type model:
+    :param fields: Fields the predicate filters on
+    :type fields: tuple[str, ...]
+    :param using: Database alias
+    :type using: str
+    :return:
+    :rtype:
+    """
+
+    *wanted, pk_column = supporting_columns(model=model, fields=fields)
+    pk_implied = connections[using].vendor == "mysql"
+
+    for columns in index_columns(model=model, using=using).values():
+        if set(columns[: len(wanted)]) != set(wanted):
+            continue
+
+        if pk_implied or columns[len(wanted) : len(wanted) + 1] == [pk_column]:
+            return True
+
+    return False
+
+
+class CreateSupportingIndex(Operation):
+    """
+    Migration operation creating an index that supports a cleanup predicate on
+    another app's model, and dropping it again when migrating backwards.
+
+    - The index is only created if no existing index supports the predicate yet,
+      see `is_supported()`, and only dropped if it has been created by this operation.
+    - It is created online where the backend allows it: `CONCURRENTLY` on PostgreSQL,
+      which needs a non-atomic migration, and `ALGORITHM=INPLACE, LOCK=NONE` on MySQL.
+    - The index is not part of the model's state, so Django never sees it as a change.
+    """
+
+    reversible = True
+    reduces_to_sql = False
+
+    def __init__(self, model: str, fields: list, name: str) -> None:
+        """
+        Initialize the operation.
+
+        :param model: Model label, e.g. `eveonline.EveCharacter`
+        :type model: str
+        :param fields: Fields the predicate filters on
+        :type fields: list
+        :param name: Name of the index
+        :type name: str
+        """
+
+        self.model = model
+        self.fields = list(fields)
+        self.name = name
+
+    def deconstruct(self) -> tuple:
+        """
+        Deconstruct the operation for the migration writer.
+
+        :return:
+        :rtype:
+        """
+
+        return (
+            self.__class__.__qualname__,
+            [],
+            {"model": self.model, "fields": self.fields, "name": self.name},
+        )
+
+    def state_forwards(self, app_label, state) -> None:
+        """
+        The index is not part of the model state.
+
+        :param app_label:
+        :type app_label:
+        :param state:
+        :type state:
+        :return:
+        :rtype:
+        """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state) -> None:
+        """
+        Create the index, unless an existing index already supports the predicate.
+
+        :param app_label:
+        :type app_label:
+        :param schema_editor:
+        :type schema_editor:
+        :param from_state:
+        :type from_state:
+        :param to_state:
+        :type to_state:
+        :return:
+        :rtype:
+        """
+
+        model = to_state.apps.get_model(self.model)
+        using = schema_editor.connection.alias
+
+        if not self.allow_migrate_model(using, model):
+            return
+
+        if is_supported(model=model, fields=tuple(self.fields), using=using):
+            logger.info(
+                f"An existing index on {model._meta.db_table} already supports "
+                f"{', '.join(self.fields)}, not creating {self.name}."
+            )
+
+            return
+
+        quote = schema_editor.quote_name
+        columns = ", ".join(
+            quote(column)
+            for column in supporting_columns(model=model, fields=tuple(self.fields))
+        )
+        vendor = schema_editor.connection.vendor
+        table = quote(model._meta.db_table)
+        sql = f"CREATE INDEX {quote(self.name)} ON {table} ({columns})"
+
+        if vendor == "postgresql":
+            sql = sql.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+        elif vendor == "mysql":
+            sql += " ALGORITHM=INPLACE LOCK=NONE"
+
+        schema_editor.execute(sql)
+
+    def database_backwards(
+        self, app_label, schema_editor, from_state, to_state
+    ) -> None:
+        """
+        Drop the index, if it has been created by this operation.
+
+        :param app_label:
+        :type app_label:
+        :param schema_editor:
+        :type schema_editor:
+        :param from_state:
+        :type from_state:
+        :param to_state:
+        :type to_state:
+        :return:
+        :rtype:
+        """
+
+        model = from_state.apps.get_model(self.model)
+        using = schema_editor.connection.alias
+
+        if not self.allow_migrate_model(using, model):
+            return
+
+        if self.name not in index_columns(model=model, using=using):
+            return
+
+        quote = schema_editor.quote_name
+        vendor = schema_editor.connection.vendor
+
+        if vendor == "postgresql":
+            sql = f"DROP INDEX CONCURRENTLY {quote(self.name)}"
+        elif vendor == "mysql":
+            sql = (
+                f"DROP INDEX {quote(self.name)} ON {quote(model._meta.db_table)} "
+                "ALGORITHM=INPLACE LOCK=NONE"
+            )
+        else:
+            sql = f"DROP INDEX {quote(self.name)}"
+
+        schema_editor.execute(sql)
+
+    def describe(self) -> str:
+        """
+        Describe the operation for `sqlmigrate` and `migrate --plan`.
+
+        :return:
+        :rtype:
+        """
+
+        return f"Create index {self.name} supporting cleanups on {self.model}"
+
+    @property
+    def migration_name_fragment(self) -> str:
+        """
+        Name fragment for auto-generated migration names.
+
+        :return:
+        :rtype:
+        """
+
+        return self.name.lower()
@@ -0,0 +1,355 @@
+"""
+Metrics handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+
+# Django
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.handler.cache import Cache
+from tnnt_housekeeping.handler.deletion import DeletionResult
+from tnnt_housekeeping.handler.files import write_atomically
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+CACHE_KEY_METRICS = "metrics"
+METRIC_PREFIX = "tnnt_housekeeping_rule"
+
+
+@dataclass
+class RuleMetrics:  # pylint: disable=too-many-instance-attributes
+    """
+    Metrics of a single cleanup rule run.
+
+    - The instance is installed as database execute wrapper while the rule runs,
+      so `queries` and `db_time` cover every statement, cascades included.
+    - `pk_range` is set for the runs of a sharded rule. The shards' metrics are merged
+      into those of the whole run, see `merge()`.
+    """
+
+    rule: str
+    timestamp: float = field(default_factory=time.time)
+    wall_time: float = 0.0
+    db_time: float = 0.0
+    queries: int = 0
+    batches: int = 0
+    per_model: dict = field(default_factory=dict)
+    finished: bool = True
+    retries: int = 0
+    pk_range: tuple | None = None
+    breakdown: dict = field(default_factory=dict)
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper, counting and timing the statement.
+
+        :param execute:
+        :type execute:
+        :param sql:
+        :type sql:
+        :param params:
+        :type params:
+        :param many:
+        :type many:
+        :param context:
+        :type context:
+        :return:
+        :rtype:
+        """
+
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @property
+    def total(self) -> int:
+        """
+        Total number of deleted rows over all models.
+
+        :return:
+        :rtype:
+        """
+
+        return sum(self.per_model.values())
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        Deleted rows per second of wall time.
+
+        :return:
+        :rtype:
+        """
+
+        return self.total / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def batch_latency(self) -> float:
+        """
+        Mean wall time per batch, in seconds.
+
+        :return:
+        :rtype:
+        """
+
+        return self.wall_time / self.batches if self.batches else 0.0
+
+    def add_result(self, result: DeletionResult) -> None:
+        """
+        Take the batches and deleted rows from the deletion result of the run.
+
+        :param result:
+        :type result:
+        :return:
+        :rtype:
+        """
+
+        self.batches = result.batches
+        self.per_model = dict(result.per_model)
+        self.finished = result.finished
+        self.retries = result.retries
+        self.breakdown = dict(result.breakdown)
+
+    def merge(self, other: "RuleMetrics") -> None:
+        """
+        Add the metrics of another run of the same rule, e.g. another shard.
+
+        Counts and database time are summed up. The shards run in parallel, so the
+        wall time spans from the first start to the last end instead.
+
+        :param other:
+        :type other:
+        :return:
+        :rtype:
+        """
+
+        ended = max(self.timestamp + self.wall_time, other.timestamp + other.wall_time)
+
+        self.timestamp = min(self.timestamp, other.timestamp)
+        self.wall_time = ended - self.timestamp
+        self.db_time += other.db_time
+        self.queries += other.queries
+        self.batches += other.batches
+        self.per_model = dict(Counter(self.per_model) + Counter(other.per_model))
+        self.finished = self.finished and other.finished
+        self.retries += other.retries
+        self.pk_range = None
+        self.breakdown = dict(Counter(self.breakdown) + Counter(other.breakdown))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RuleMetrics":
+        """
+        Restore metrics from their serializable representation.
+
+        :param data: As returned by `as_dict()`
+        :type data: dict
+        :return:
+        :rtype:
+        """
+
+        return cls(
+            rule=data["rule"],
+            timestamp=data["timestamp"],
+            wall_time=data["wall_time"],
+            db_time=data["db_time"],
+            queries=data["queries"],
+            batches=data["batches"],
+            per_model=dict(data["per_model"]),
+            finished=data["finished"],
+            retries=data["retries"],
+            pk_range=tuple(data["pk_range"]) if data["pk_range"] else None,
+            breakdown=dict(data.get("breakdown", {})),
+        )
+
+    def as_dict(self) -> dict:
+        """
+        Serializable representation, as stored in the cache.
+
+        :return:
+        :rtype:
+        """
+
+        return {
+            "rule": self.rule,
+            "timestamp": self.timestamp,
+            "wall_time": self.wall_time,
+            "db_time": self.db_time,
+            "queries": self.queries,
+            "batches": self.batches,
+            "batch_latency": self.batch_latency,
+            "total": self.total,
+            "rows_per_second": self.rows_per_second,
+            "per_model": self.per_model,
+            "finished": self.finished,
+            "retries": self.retries,
+            "pk_range": self.pk_range,
+            "breakdown": self.breakdown,
+        }
+
+
+@contextmanager
+def collect_metrics(
+    rule: str, using: str | list[str] = DEFAULT_DB_ALIAS, pk_range: tuple | None = None
+) -> Iterator[RuleMetrics]:
+    """
+    Collect the metrics of a cleanup rule run on one or more database connections.
+
+    :param rule: Name of the cleanup rule
+    :type rule: str
+    :param using: Database aliases the rule reads from and deletes from
+    :type using: str | list[str]
+    :param pk_range: Primary key range of a sharded run
+    :type pk_range: tuple | None
+    :return:
+    :rtype:
+    """
+
+    metrics = RuleMetrics(rule=rule, pk_range=pk_range)
+    started = time.perf_counter()
+
+    aliases = [using] if isinstance(using, str) else list(dict.fromkeys(using))
+
+    try:
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(metrics))
+
+            yield metrics
+    finally:
+        metrics.wall_time = time.perf_counter() - started
+
+
+def store_metrics(metrics: RuleMetrics) -> None:
+    """
+    Store the metrics of a rule run in the cache, replacing those of its previous run.
+
+    :param metrics:
+    :type metrics:
+    :return:
+    :rtype:
+    """
+
+    Cache(subkey=f"{CACHE_KEY_METRICS}:{metrics.rule}").set(
+        value=metrics.as_dict(), timeout=None
+    )
+
+
+def load_metrics(rules: list[str]) -> dict:
+    """
+    Load the metrics of the last run of each rule from the cache, with a single read.
+
+    :param rules: Names of the cleanup rules
+    :type rules: list[str]
+    :return: Metrics per rule name, rules without a run are left out
+    :rtype: dict
+    """
+
+    stored = Cache.get_many(subkeys=[f"{CACHE_KEY_METRICS}:{rule}" for rule in rules])
+
+    return {
+        rule: stored[f"{CACHE_KEY_METRICS}:{rule}"]
+        for rule in rules
+        if stored[f"{CACHE_KEY_METRICS}:{rule}"]
+    }
+
+
+def _label(value: str) -> str:
+    """
+    Escape a Prometheus label value.
+
+    :param value:
+    :type value:
+    :return:
+    :rtype:
+    """
+
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(metrics: dict) -> str:
+    """
+    Render rule metrics in the Prometheus text exposition format.
+
+    :param metrics: Metrics per rule name, as returned by `load_metrics()`
+    :type metrics: dict
+    :return:
+    :rtype:
+    """
+
+    gauges = (
+        ("last_run_timestamp_seconds", "timestamp", "Start of the last run"),
+        ("wall_seconds", "wall_time", "Wall time of the last run"),
+        ("db_seconds", "db_time", "Time spent in the database during the last run"),
+        ("queries", "queries", "SQL statements issued by the last run"),
+        ("batches", "batches", "Batches deleted by the last run"),
+        ("batch_latency_seconds", "batch_latency", "Mean wall time per batch"),
+        ("rows_per_second", "rows_per_second", "Deleted rows per second"),
+        ("finished", "finished", "1 if the last run finished, 0 if it ran out of time"),
+        ("retries", "retries", "Batches retried after a deadlock or lock timeout"),
+    )
+    lines = []
+
+    for name, key, description in gauges:
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {description}.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+
+        for rule, values in metrics.items():
+            lines.append(
+                f'{METRIC_PREFIX}_{name}{{rule="{_label(rule)}"}} {float(values.get(key, 0))}'
+            )
+
+    lines.append(f"# HELP {METRIC_PREFIX}_rows_deleted Rows deleted by the last run.")
+    lines.append(f"# TYPE {METRIC_PREFIX}_rows_deleted gauge")
+
+    for rule, values in metrics.items():
+        for model, count in values["per_model"].items():
+            lines.append(
+                f'{METRIC_PREFIX}_rows_deleted{{rule="{_label(rule)}",'
+                f'model="{_label(model)}"}} {count}'
+            )
+
+    lines.append(
+        f"# HELP {METRIC_PREFIX}_rows_deleted_breakdown Rows deleted by the last run, "
+        "per value of the rule's breakdown field."
+    )
+    lines.append(f"# TYPE {METRIC_PREFIX}_rows_deleted_breakdown gauge")
+
+    for rule, values in metrics.items():
+        for value, count in values.get("breakdown", {}).items():
+            lines.append(
+                f'{METRIC_PREFIX}_rows_deleted_breakdown{{rule="{_label(rule)}",'
+                f'value="{_label(str(value))}"}} {count}'
+            )
+
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, content: str) -> None:
+    """
+    Write a Prometheus textfile atomically, so the collector never reads half a file.
+
+    :param path:
+    :type path:
+    :param content:
+    :type content:
+    :return:
+    :rtype:
+    """
+
+    write_atomically(path=path, content=content)
@@ -0,0 +1,180 @@
+"""
+Orphan handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+# Django
+from django.db import models
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.cache import Cache
+from tnnt_housekeeping.handler.plan import reverse_relations
+
+CACHE_KEY_ORPHANED_SINCE = "orphaned-since"
+
+# Seconds after which a row no run found unreferenced again is forgotten. Longer than
+# the time between two runs, which record every unreferenced row they page through.
+ORPHANED_SINCE_TIMEOUT = 7 * 24 * 60 * 60
+
+
+@dataclass(frozen=True)
+class IdReference:
+    """
+    A reference to a model through a plain ID column instead of a foreign key,
+    e.g. `EveCharacter.corporation_id` referring to `EveCorporationInfo.corporation_id`.
+    """
+
+    model: type[models.Model]
+    field: str
+    target_field: str
+
+
+def references(
+    model: type[models.Model],
+    id_references: Iterable[IdReference] = (),
+    exclude: Iterable[type[models.Model]] = (),
+) -> list[tuple[type[models.Model], str, str]]:
+    """
+    Get everything that refers to the rows of a model.
+
+    These are the foreign keys of all installed apps pointing at the model, including
+    the through tables of many-to-many relations other models declare, and the given
+    plain ID references. Many-to-many relations the model declares itself refer to
+    other rows, not to the model's, so they are left out.
+
+    :param model:
+    :type model:
+    :param id_references: References through plain ID columns
+    :type id_references: Iterable[IdReference]
+    :param exclude: Referring models whose foreign keys don't count
+    :type exclude: Iterable[type[models.Model]]
+    :return: Referring model, its column and the model's column it refers to
+    :rtype: list[tuple[type[models.Model], str, str]]
+    """
+
+    found = []
+
+    for relation in reverse_relations(model=model):
+        related_model = relation.related_model
+
+        if related_model._meta.auto_created is model or related_model in exclude:
+            continue
+
+        found.append(
+            (related_model, relation.field.attname, relation.field.target_field.attname)
+        )
+
+    found.extend(
+        (reference.model, reference.field, reference.target_field)
+        for reference in id_references
+    )
+
+    return found
+
+
+def unreferenced(
+    model: type[models.Model],
+    id_references: Iterable[IdReference] = (),
+    exclude: Iterable[type[models.Model]] = (),
+) -> Q:
+    """
+    Get the Q object selecting the rows of a model nothing refers to any more.
+
+    Every reference is a `NOT EXISTS` subquery, so the candidates of a batch are found
+    with a single anti-join query. The referring columns need an index, or every
+    subquery scans the referring table.
+
+    :param model:
+    :type model:
+    :param id_references: References through plain ID columns, see `references()`
+    :type id_references: Iterable[IdReference]
+    :param exclude: Referring models whose foreign keys don't count
+    :type exclude: Iterable[type[models.Model]]
+    :return:
+    :rtype:
+    """
+
+    return Q(
+        *(
+            ~Exists(
+                related_model._base_manager.filter(**{field: OuterRef(target_field)})
+            )
+            for related_model, field, target_field in references(
+                model=model, id_references=id_references, exclude=exclude
+            )
+        )
+    )
+
+
+class OrphanedSince:
+    """
+    Cache-backed record of when the rows of a rule were first found unreferenced.
+
+    `last_updated` can't tell, Alliance Auth saves every corporation and alliance
+    again when it updates them from ESI. Only the rows of the page of candidates at
+    hand are looked up and recorded, each in its own cache key, keeping the time a
+    row was first found. A row not found unreferenced again for ORPHANED_SINCE_TIMEOUT,
+    e.g. because it is referenced again, is forgotten.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Initialize the OrphanedSince record of a rule.
+
+        :param name: Name of the cleanup rule
+        :type name: str
+        """
+
+        self.name = name
+
+    def _subkey(self, pk: Any) -> str:
+        """
+        Cache subkey of a row.
+
+        :param pk:
+        :type pk:
+        :return:
+        :rtype:
+        """
+
+        return f"{CACHE_KEY_ORPHANED_SINCE}:{self.name}:{pk}"
+
+    def expired(self, pks: list, grace_period: int) -> list:
+        """
+        Record a page of unreferenced rows, and get those unreferenced for longer than
+        a grace period.
+
+        :param pks: Primary keys of the unreferenced rows
+        :type pks: list
+        :param grace_period: Seconds
+        :type grace_period: int
+        :return: Primary keys of the expired rows
+        :rtype: list
+        """
+
+        now = timezone.now()
+        forgotten = now - timedelta(seconds=ORPHANED_SINCE_TIMEOUT)
+        cached = Cache.get_many(subkeys=[self._subkey(pk=pk) for pk in pks])
+        since = {}
+
+        for pk in pks:
+            recorded = cached[self._subkey(pk=pk)]
+
+            # First found and last found unreferenced
+            since[pk] = recorded[0] if recorded and recorded[1] > forgotten else now
+
+        Cache.set_many(
+            values={self._subkey(pk=pk): (since[pk], now) for pk in pks},
+            timeout=ORPHANED_SINCE_TIMEOUT,
+        )
+
+        cutoff = now - timedelta(seconds=grace_period)
+
+        return [pk for pk in pks if since[pk] <= cutoff]
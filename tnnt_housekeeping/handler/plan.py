@@ -0,0 +1,314 @@
+"""
+Deletion plan handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+# Django
+from django.db import models
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, pre_delete
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.handler.signals import is_deferrable
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+ACTION_DELETE = "delete"
+ACTION_SET_NULL = "set_null"
+
+
+def reverse_relations(model: type[models.Model]) -> Iterator:
+    """
+    Get the one-to-many and one-to-one relations other models point at a model with,
+    including the through tables of many-to-many relations.
+
+    :param model:
+    :type model:
+    :return:
+    :rtype:
+    """
+
+    for relation in model._meta.get_fields(include_hidden=True):
+        if not (relation.auto_created and not relation.concrete):
+            continue
+
+        if relation.one_to_many or relation.one_to_one:
+            yield relation
+
+
+@dataclass(frozen=True)
+class PlanStep:
+    """
+    A single set-based statement of a deletion plan.
+
+    - `lookup` is the ORM path from `model` to the primary key of the plan's root model.
+    - `depth` is the distance from the root model, 0 being the root model itself.
+    """
+
+    model: type[models.Model]
+    lookup: str
+    action: str
+    depth: int
+    field_name: str = ""
+
+    def queryset(self, pks: list) -> QuerySet:
+        """
+        Queryset selecting the rows affected by this step.
+
+        :param pks: Primary keys of the root model rows being deleted
+        :type pks: list
+        :return:
+        :rtype:
+        """
+
+        return self.model._base_manager.filter(**{f"{self.lookup}__in": pks})
+
+
+class DeletionPlan:
+    """
+    Precompiled cascade delete plan for a model.
+
+    - The relation graph pointing at the model is walked once, when the plan is built.
+    - Executing the plan issues one `DELETE ... WHERE fk IN (...)` or
+      `UPDATE ... SET fk = NULL` per related model, instead of letting Django's
+      deletion collector rediscover the graph and fetch related rows for every batch.
+    - The plan is only safe if no `on_delete` behaviour needs the collector and
+      no delete signal receiver would be skipped, see `is_safe()`.
+    """
+
+    _registry: dict = {}
+
+    def __init__(self, model: type[models.Model]) -> None:
+        """
+        Build the deletion plan for a model.
+
+        :param model: Root model of the plan
+        :type model: type[models.Model]
+        """
+
+        self.model = model
+        self.steps: list[PlanStep] = []
+        self.blockers: list[str] = []
+
+        self._walk(model=model, lookup="", depth=0, path=(model,))
+
+        # Deepest rows first, so nothing is deleted while rows still point at it
+        self.steps.sort(key=lambda step: step.depth, reverse=True)
+
+    @classmethod
+    def register(cls, model: type[models.Model]) -> "DeletionPlan":
+        """
+        Build the deletion plan for a model and keep it for later use.
+
+        :param model:
+        :type model:
+        :return:
+        :rtype:
+        """
+
+        plan = cls(model=model)
+        cls._registry[model] = plan
+
+        if plan.blockers:
+            logger.debug(
+                f"Deletion plan for {model._meta.label} needs the deletion collector: "
+                f"{'; '.join(plan.blockers)}"
+            )
+
+        return plan
+
+    @classmethod
+    def for_model(cls, model: type[models.Model]) -> "DeletionPlan | None":
+        """
+        Get the registered deletion plan for a model.
+
+        :param model:
+        :type model:
+        :return: The plan, or None if no plan has been registered for the model
+        :rtype: DeletionPlan | None
+        """
+
+        return cls._registry.get(model)
+
+    def _walk(
+        self, model: type[models.Model], lookup: str, depth: int, path: tuple
+    ) -> None:
+        """
+        Collect the plan steps for all relations pointing at a model.
+
+        :param model: Model whose rows are deleted at this depth
+        :type model: type[models.Model]
+        :param lookup: ORM path from `model` to the root model's primary key
+        :type lookup: str
+        :param depth: Distance from the root model
+        :type depth: int
+        :param path: Models on the way from the root model to `model`
+        :type path: tuple
+        :return:
+        :rtype:
+        """
+
+        self.steps.append(
+            PlanStep(
+                model=model,
+                lookup=lookup or "pk",
+                action=ACTION_DELETE,
+                depth=depth,
+            )
+        )
+
+        if model._meta.parents:
+            self.blockers.append(f"{model._meta.label} uses multi-table inheritance")
+
+        if model._meta.private_fields:
+            self.blockers.append(f"{model._meta.label} has generic relations")
+
+        for relation in reverse_relations(model=model):
+            related_model = relation.related_model
+            field = relation.field
+            related_lookup = (
+                f"{field.name}__{lookup}" if lookup else f"{field.name}__pk"
+            )
+            on_delete = relation.on_delete
+
+            if on_delete is models.DO_NOTHING:
+                continue
+
+            if on_delete is models.SET_NULL:
+                self.steps.append(
+                    PlanStep(
+                        model=related_model,
+                        lookup=related_lookup,
+                        action=ACTION_SET_NULL,
+                        depth=depth + 1,
+                        field_name=field.name,
+                    )
+                )
+
+                continue
+
+            if on_delete is not models.CASCADE:
+                self.blockers.append(
+                    f"{related_model._meta.label}.{field.name} uses "
+                    f"on_delete={getattr(on_delete, '__name__', on_delete)}"
+                )
+
+                continue
+
+            if related_model in path:
+                self.blockers.append(
+                    f"{related_model._meta.label}.{field.name} is part of a cascade cycle"
+                )
+
+                continue
+
+            self._walk(
+                model=related_model,
+                lookup=related_lookup,
+                depth=depth + 1,
+                path=path + (related_model,),
+            )
+
+    @property
+    def models(self) -> list:
+        """
+        Models whose rows are deleted when the plan is executed.
+
+        :return:
+        :rtype:
+        """
+
+        return [step.model for step in self.steps if step.action == ACTION_DELETE]
+
+    def receivers(self, deferred: bool = False) -> list:
+        """
+        Models of the plan that have delete signal receivers connected right now.
+
+        These receivers would be skipped by the set-based statements. Receivers can
+        be connected after the plan was built, so this is checked on every use.
+
+        :param deferred: Leave out models whose receivers can all be deferred, see `is_deferrable()`
+        :type deferred: bool
+        :return:
+        :rtype:
+        """
+
+        return [
+            model._meta.label
+            for model in self.models
+            if (pre_delete.has_listeners(model) or post_delete.has_listeners(model))
+            and not (deferred and is_deferrable(model=model))
+        ]
+
+    def is_safe(self, deferred: bool = False) -> bool:
+        """
+        Check whether the plan gives the same outcome as Django's deletion collector.
+
+        :param deferred: Whether deferrable receivers are reconciled after the batch instead
+        :type deferred: bool
+        :return:
+        :rtype:
+        """
+
+        if self.blockers:
+            return False
+
+        receivers = self.receivers(deferred=deferred)
+
+        if receivers:
+            logger.debug(
+                f"Deletion plan for {self.model._meta.label} would skip delete "
+                f"signal receivers of: {', '.join(receivers)}"
+            )
+
+            return False
+
+        return True
+
+    def execute(self, queryset: QuerySet, pks: list | None = None) -> dict:
+        """
+        Execute the plan for the rows of a queryset of the root model.
+
+        Must run inside a transaction. The root rows are locked and their primary
+        keys fetched first, so every statement works on the same set of rows.
+
+        :param queryset: Root model rows to delete
+        :type queryset: QuerySet
+        :param pks: Primary keys of the rows, if the caller locked them already
+        :type pks: list | None
+        :return: Deleted rows per model label
+        :rtype: dict
+        """
+
+        using = queryset.db
+        deleted = {}
+
+        if pks is None:
+            pks = list(queryset.select_for_update().values_list("pk", flat=True))
+
+        if not pks:
+            return deleted
+
+        for step in self.steps:
+            step_queryset = step.queryset(pks=pks).using(using)
+
+            if step.action == ACTION_SET_NULL:
+                step_queryset.update(**{step.field_name: None})
+
+                continue
+
+            count = step_queryset._raw_delete(using=using)
+
+            if count:
+                label = step.model._meta.label
+                deleted[label] = deleted.get(label, 0) + count
+
+        return deleted
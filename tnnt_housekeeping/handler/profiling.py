@@ -0,0 +1,246 @@
+"""
+Query profiling handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+import heapq
+import os
+import re
+import time
+import traceback
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from itertools import count
+
+# Django
+import django
+from django.db import connections
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+# Statement shapes executed at least this often are reported as N+1 candidates
+REPEATED_THRESHOLD = 10
+
+_DJANGO_DIR = os.path.dirname(django.__file__)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(sql: str) -> str:
+    """
+    Normalize a statement to its shape, without literals and with collapsed IN lists.
+
+    Statements that only differ in their parameters or in the length of their
+    IN lists have the same shape.
+
+    :param sql:
+    :type sql:
+    :return:
+    :rtype:
+    """
+
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = shape.replace("%s", "?")
+    shape = _IN_LIST.sub("IN (...)", shape)
+
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def query_origin() -> str:
+    """
+    Get the innermost frame of the current stack outside of Django and this module.
+
+    For queries issued by Django's deletion collector, this is the code that started
+    the deletion, for queries issued by signal receivers, it is the receiver.
+
+    :return: "path:line in function"
+    :rtype: str
+    """
+
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename.startswith(_DJANGO_DIR) or frame.filename == __file__:
+            continue
+
+        return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+    return "unknown"
+
+
+@dataclass
+class ShapeStats:
+    """
+    Aggregated statistics of all statements with the same shape.
+    """
+
+    shape: str
+    origin: str
+    count: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    def as_dict(self) -> dict:
+        """
+        Serializable representation, as used in the report.
+
+        :return:
+        :rtype:
+        """
+
+        return {
+            "shape": self.shape,
+            "origin": self.origin,
+            "count": self.count,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / self.count if self.count else 0.0,
+            "max_time": self.max_time,
+        }
+
+
+@dataclass
+class QueryProfiler:
+    """
+    Record the statements of a run with their duration and origin.
+
+    - Statements are aggregated by shape, only the `top` slowest are kept
+      individually, so memory use doesn't grow with the number of statements.
+    - The instance is installed as database execute wrapper, see `profile_queries()`.
+    """
+
+    top: int = 10
+    wall_time: float = 0.0
+    db_time: float = 0.0
+    queries: int = 0
+    shapes: dict = field(default_factory=dict)
+    slowest: list = field(default_factory=list)
+    _sequence: Iterator = field(default_factory=count, repr=False)
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper, recording the statement.
+
+        :param execute:
+        :type execute:
+        :param sql:
+        :type sql:
+        :param params:
+        :type params:
+        :param many:
+        :type many:
+        :param context:
+        :type context:
+        :return:
+        :rtype:
+        """
+
+        started = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql=sql, duration=time.perf_counter() - started)
+
+    def record(self, sql: str, duration: float) -> None:
+        """
+        Record a single statement.
+
+        :param sql:
+        :type sql:
+        :param duration: Seconds the statement took
+        :type duration: float
+        :return:
+        :rtype:
+        """
+
+        shape = statement_shape(sql=sql)
+        origin = query_origin()
+
+        self.queries += 1
+        self.db_time += duration
+
+        stats = self.shapes.get(shape)
+
+        if stats is None:
+            stats = self.shapes[shape] = ShapeStats(shape=shape, origin=origin)
+
+        stats.count += 1
+        stats.total_time += duration
+        stats.max_time = max(stats.max_time, duration)
+
+        # Min-heap of the slowest statements, the sequence number breaks ties
+        entry = (duration, next(self._sequence), sql, origin)
+
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def report(self) -> dict:
+        """
+        Build the top-N report of the run.
+
+        :return:
+        :rtype:
+        """
+
+        shapes = sorted(
+            self.shapes.values(), key=lambda stats: stats.total_time, reverse=True
+        )
+        repeated = sorted(
+            (stats for stats in shapes if stats.count >= REPEATED_THRESHOLD),
+            key=lambda stats: stats.count,
+            reverse=True,
+        )
+
+        return {
+            "wall_time": self.wall_time,
+            "db_time": self.db_time,
+            "python_time": max(self.wall_time - self.db_time, 0.0),
+            "queries": self.queries,
+            "distinct_shapes": len(self.shapes),
+            "slowest": [
+                {"sql": sql, "duration": duration, "origin": origin}
+                for duration, _, sql, origin in sorted(self.slowest, reverse=True)
+            ],
+            "shapes": [stats.as_dict() for stats in shapes[: self.top]],
+            "repeated": [stats.as_dict() for stats in repeated[: self.top]],
+        }
+
+
+@contextmanager
+def profile_queries(top: int = 10) -> Iterator[QueryProfiler]:
+    """
+    Profile the statements issued on all database connections.
+
+    :param top: Number of entries per list in the report
+    :type top: int
+    :return:
+    :rtype:
+    """
+
+    profiler = QueryProfiler(top=top)
+    started = time.perf_counter()
+
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profiler))
+
+            yield profiler
+    finally:
+        profiler.wall_time = time.perf_counter() - started
+
+        logger.info(
+            f"Profiled {profiler.queries} queries of {len(profiler.shapes)} shapes, "
+            f"{profiler.db_time:.2f}s DB time in {profiler.wall_time:.2f}s."
+        )
@@ -0,0 +1,182 @@
+"""
+Deferred signal receiver handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+from collections.abc import Callable
+from dataclasses import dataclass
+
+# Django
+from django.db import models
+from django.db.models import QuerySet
+from django.db.models.signals import ModelSignal, post_delete, pre_delete
+
+# Alliance Auth
+from allianceauth.authentication.models import CharacterOwnership, UserProfile
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+
+@dataclass(frozen=True)
+class DeferredReceiver:
+    """
+    A delete signal receiver whose effect is recalculating the state of a user.
+
+    In bulk mode, it doesn't run per deleted row. The users of the rows, taken from
+    `user_field`, are reconciled once per batch after it committed instead.
+    """
+
+    signal: ModelSignal
+    model: type[models.Model]
+    receiver: Callable
+    user_field: str = "user_id"
+
+
+_deferred_receivers: dict[type[models.Model], list[DeferredReceiver]] = {}
+
+
+def register_deferred_receiver(deferred: DeferredReceiver) -> DeferredReceiver:
+    """
+    Register a delete signal receiver that can be deferred in bulk mode.
+
+    :param deferred:
+    :type deferred: DeferredReceiver
+    :return:
+    :rtype: DeferredReceiver
+    """
+
+    _deferred_receivers.setdefault(deferred.model, [])
+
+    if deferred not in _deferred_receivers[deferred.model]:
+        _deferred_receivers[deferred.model].append(deferred)
+
+    return deferred
+
+
+def get_deferred_receivers(model: type[models.Model]) -> list[DeferredReceiver]:
+    """
+    Get the deferrable delete signal receivers of a model.
+
+    :param model:
+    :type model:
+    :return:
+    :rtype:
+    """
+
+    return _deferred_receivers.get(model, [])
+
+
+def live_receivers(signal: ModelSignal, model: type[models.Model]) -> list:
+    """
+    Get the receivers currently connected to a signal for a model.
+
+    :param signal:
+    :type signal:
+    :param model:
+    :type model:
+    :return:
+    :rtype:
+    """
+
+    sync_receivers, async_receivers = signal._live_receivers(model)
+
+    return [*sync_receivers, *async_receivers]
+
+
+def is_deferrable(model: type[models.Model]) -> bool:
+    """
+    Check whether all delete signal receivers of a model can be deferred.
+
+    Receivers can be connected at any time, so this is checked on every use.
+
+    :param model:
+    :type model:
+    :return:
+    :rtype:
+    """
+
+    deferred = get_deferred_receivers(model=model)
+
+    return all(
+        any(entry.signal is signal and entry.receiver == receiver for entry in deferred)
+        for signal in (pre_delete, post_delete)
+        for receiver in live_receivers(signal=signal, model=model)
+    )
+
+
+def affected_users(steps: list, queryset: QuerySet) -> set:
+    """
+    Get the users whose deferred receivers would have run for a batch.
+
+    One query per model with deferred receivers, selecting the rows the batch
+    cascades to through a subquery on the batch's primary keys.
+
+    :param steps: Steps of the deletion plan, see `DeletionPlan.steps`
+    :type steps: list
+    :param queryset: Root model rows of the batch
+    :type queryset: QuerySet
+    :return: User IDs
+    :rtype: set
+    """
+
+    user_ids = set()
+    pks = queryset.order_by().values("pk")
+
+    for step in steps:
+        for user_field in {
+            entry.user_field for entry in get_deferred_receivers(model=step.model)
+        }:
+            user_ids.update(
+                step.model._base_manager.using(queryset.db)
+                .filter(**{f"{step.lookup}__in": pks})
+                .exclude(**{user_field: None})
+                .values_list(user_field, flat=True)
+            )
+
+    return user_ids
+
+
+def reconcile_users(user_ids: set) -> None:
+    """
+    Reconcile users once, after their rows have been deleted in bulk.
+
+    Does what Alliance Auth's receivers would have done per row: a main character
+    the user no longer owns is reset, which reassesses the state on save, otherwise
+    the state is reassessed right away. A state change notifies the user and sends
+    `state_changed`, which the services sync on. Reconciling is idempotent, so
+    reconciling a user who turns out to be unaffected is harmless.
+
+    :param user_ids:
+    :type user_ids: set
+    :return:
+    :rtype:
+    """
+
+    owned = set(
+        CharacterOwnership.objects.filter(user_id__in=user_ids).values_list(
+            "user_id", "character_id"
+        )
+    )
+    profiles = UserProfile._default_manager.filter(user_id__in=user_ids).select_related(
+        "user", "state"
+    )
+
+    for profile in profiles:
+        try:
+            if (
+                profile.main_character_id is not None
+                and (profile.user_id, profile.main_character_id) not in owned
+            ):
+                profile.main_character = None
+                profile.save(update_fields=["main_character"])
+            else:
+                profile.assign_state()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Failed to reconcile {profile.user}: {e}", exc_info=True)
+
+    logger.debug(f"Reconciled {len(user_ids)} users.")
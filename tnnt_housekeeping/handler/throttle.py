@@ -0,0 +1,97 @@
+"""
+Adaptive throttle handler for TN-NT Housekeeping.
+"""
+
+# Standard Library
+from dataclasses import dataclass
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.providers import AppLogger
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+
+@dataclass
+class AdaptiveThrottle:  # pylint: disable=too-many-instance-attributes
+    """
+    AIMD controller steering the batch size and the pause between batches
+    towards a target commit latency.
+
+    - A batch committed within the target latency grows the batch size by `increase`
+      rows and shortens the pause by `target_latency`.
+    - A slower batch halves the batch size and doubles the pause, starting at
+      `target_latency`, so the database gets room to breathe right away.
+    - The batch size stays between `min_batch_size` and `max_batch_size`,
+      the pause never exceeds `max_sleep`.
+    """
+
+    batch_size: int
+    target_latency: float
+    min_batch_size: int = 1
+    max_batch_size: int = 5000
+    max_sleep: float = 5.0
+    increase: int = 0
+    decrease: float = 0.5
+    sleep: float = 0.0
+
+    def __post_init__(self) -> None:
+        """
+        Clamp the initial batch size and derive the additive step.
+
+        :return:
+        :rtype:
+        """
+
+        if self.target_latency <= 0:
+            raise ValueError("Argument 'target_latency' must be positive")
+
+        if not 1 <= self.min_batch_size <= self.max_batch_size:
+            raise ValueError(
+                "Arguments 'min_batch_size' and 'max_batch_size' must be a valid range"
+            )
+
+        self.batch_size = self._clamp(self.batch_size)
+
+        # A tenth of the starting point, so growing back from a halving takes a few batches
+        if self.increase < 1:
+            self.increase = max(self.batch_size // 10, 1)
+
+    def _clamp(self, batch_size: int) -> int:
+        """
+        Keep a batch size within the configured range.
+
+        :param batch_size:
+        :type batch_size:
+        :return:
+        :rtype:
+        """
+
+        return min(max(int(batch_size), self.min_batch_size), self.max_batch_size)
+
+    def observe(self, latency: float) -> None:
+        """
+        Adjust the batch size and the pause after a committed batch.
+
+        :param latency: Wall-clock seconds the batch took to commit
+        :type latency: float
+        :return:
+        :rtype:
+        """
+
+        if latency <= self.target_latency:
+            self.batch_size = self._clamp(self.batch_size + self.increase)
+            self.sleep = max(self.sleep - self.target_latency, 0.0)
+
+            return
+
+        self.batch_size = self._clamp(self.batch_size * self.decrease)
+        self.sleep = min(max(self.sleep * 2, self.target_latency), self.max_sleep)
+
+        logger.debug(
+            f"Batch took {latency:.3f}s (target {self.target_latency:.3f}s), "
+            f"backing off to {self.batch_size} rows and {self.sleep:.2f}s pauses."
+        )
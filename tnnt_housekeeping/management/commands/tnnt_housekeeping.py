@@ -0,0 +1,122 @@
+"""
+Run a housekeeping tier from the command line
+"""
+
+# Standard Library
+import json
+
+# Django
+from django.core.management.base import BaseCommand, CommandError
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.estimate import estimate_rule
+from tnnt_housekeeping.rules import get_rules
+from tnnt_housekeeping.tasks import tier_housekeeping
+from tnnt_housekeeping.tiers import DAILY, get_tier
+
+
+class Command(BaseCommand):
+    """
+    Run a housekeeping tier in this process, optionally with a query profile,
+    or estimate its impact without deleting anything
+    """
+
+    help = (
+        "Run the housekeeping tasks of a tier in this process. The tier is skipped "
+        "if it is not due or already running on a worker."
+    )
+
+    def add_arguments(self, parser):
+        """
+        Add the command arguments.
+
+        :param parser:
+        :type parser:
+        :return:
+        :rtype:
+        """
+
+        parser.add_argument(
+            "--tier", default=DAILY.name, help="Name of the housekeeping tier"
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Profile the queries of the run and print the report",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help=(
+                "Don't delete anything, print the candidates, cascade fan-out and "
+                "query plan of every cleanup rule of the tier instead"
+            ),
+        )
+        parser.add_argument(
+            "--output", help="Write the result as JSON to this file instead"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Run the housekeeping tier.
+
+        :param args:
+        :type args:
+        :param options:
+        :type options:
+        :return:
+        :rtype:
+        """
+
+        try:
+            tier = get_tier(name=options["tier"])
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        if options["dry_run"]:
+            self._write(
+                result={
+                    rule.name: estimate_rule(rule=rule).as_dict()
+                    for rule in get_rules(tier=tier.name)
+                },
+                output=options["output"],
+            )
+
+            return
+
+        result = tier_housekeeping(tier=tier.name, profile=options["profile"])
+
+        if result is None:
+            self.stdout.write(
+                self.style.WARNING(  # pylint: disable=no-member
+                    f"{tier.name.capitalize()} housekeeping is not due or already running."
+                )
+            )
+
+            return
+
+        self._write(result=result, output=options["output"])
+
+    def _write(self, result: dict, output: str | None) -> None:
+        """
+        Print the result as JSON, or write it to a file.
+
+        :param result:
+        :type result:
+        :param output: Path of the file, None to print the result
+        :type output: str | None
+        :return:
+        :rtype:
+        """
+
+        content = json.dumps(result, indent=2)
+
+        if output:
+            with open(output, "w", encoding="utf-8") as file:
+                file.write(content)
+
+            self.stdout.write(
+                self.style.SUCCESS(f"Wrote {output}")  # pylint: disable=no-member
+            )
+        else:
+            self.stdout.write(content)
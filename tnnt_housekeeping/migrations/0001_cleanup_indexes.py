@@ -0,0 +1,27 @@
+# Django
+from django.db import migrations
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.indexes import CreateSupportingIndex
+
+
+class Migration(migrations.Migration):
+    # Indexes are created concurrently on PostgreSQL, which can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ("eveonline", "0021_alter_eveallianceinfo_options_and_more"),
+    ]
+
+    operations = [
+        CreateSupportingIndex(
+            model="eveonline.EveCorporationInfo",
+            fields=["ceo_id"],
+            name="tnnt_hk_corp_ceo_id_idx",
+        ),
+        CreateSupportingIndex(
+            model="eveonline.EveCharacter",
+            fields=["corporation_id"],
+            name="tnnt_hk_char_corp_id_idx",
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Django
+from django.db import migrations
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.indexes import CreateSupportingIndex
+
+
+class Migration(migrations.Migration):
+    # Indexes are created concurrently on PostgreSQL, which can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ("authentication", "0025_v5squash"),
+        ("tnnt_housekeeping", "0001_cleanup_indexes"),
+    ]
+
+    operations = [
+        CreateSupportingIndex(
+            model="authentication.OwnershipRecord",
+            fields=["created"],
+            name="tnnt_hk_ownrec_created_idx",
+        ),
+    ]
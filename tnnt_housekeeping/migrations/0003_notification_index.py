@@ -0,0 +1,23 @@
+# Django
+from django.db import migrations
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.indexes import CreateSupportingIndex
+
+
+class Migration(migrations.Migration):
+    # Indexes are created concurrently on PostgreSQL, which can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ("notifications", "0006_v5squash"),
+        ("tnnt_housekeeping", "0002_ownership_record_index"),
+    ]
+
+    operations = [
+        CreateSupportingIndex(
+            model="notifications.Notification",
+            fields=["timestamp"],
+            name="tnnt_hk_notif_timestamp_idx",
+        ),
+    ]
@@ -0,0 +1,502 @@
+"""
+Cleanup rules for TN-NT Housekeeping
+"""
+
+# Standard Library
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import partial
+from typing import Any
+
+# Django
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Exists, OuterRef, Q, QuerySet
+from django.db.models.constants import LOOKUP_SEP
+from django.utils import timezone
+
+# Alliance Auth
+from allianceauth.authentication.models import OwnershipRecord
+from allianceauth.eveonline.models import (
+    EveAllianceInfo,
+    EveCharacter,
+    EveCorporationInfo,
+)
+from allianceauth.hooks import get_hooks
+from allianceauth.notifications.models import Notification
+from allianceauth.services.hooks import get_extension_logger
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __title__
+from tnnt_housekeeping.app_settings import (
+    TNNT_HOUSEKEEPING_NOTIFICATION_READ_RETENTION,
+    TNNT_HOUSEKEEPING_NOTIFICATION_RETENTION,
+    TNNT_HOUSEKEEPING_ORPHAN_GRACE_PERIOD,
+    TNNT_HOUSEKEEPING_OWNERSHIP_RECORD_RETENTION,
+)
+from tnnt_housekeeping.handler.dirty import track
+from tnnt_housekeeping.handler.orphans import IdReference, OrphanedSince, unreferenced
+from tnnt_housekeeping.providers import AppLogger
+from tnnt_housekeeping.tiers import DAILY, get_tier
+
+logger = AppLogger(my_logger=get_extension_logger(__name__), prefix=__title__)
+
+# Name of the Alliance Auth hook other apps register their cleanup rules with
+RULES_HOOK = "tnnt_housekeeping_cleanup_rules_hook"
+
+COST_LIGHT = "light"
+COST_HEAVY = "heavy"
+COSTS = (COST_LIGHT, COST_HEAVY)
+
+
+@dataclass(frozen=True)
+class CleanupRule:  # pylint: disable=too-many-instance-attributes
+    """
+    A cleanup rule, deleting the rows of a model that match a predicate.
+
+    - `predicate` returns the `Q` object selecting the candidate rows. It is called
+      on every run, so it can depend on the current time.
+    - `description` names the candidate rows in log messages, e.g. "closed corporations".
+    - `batch_size` overrides TNNT_HOUSEKEEPING_BATCH_SIZE for this rule.
+    - `target_latency` overrides TNNT_HOUSEKEEPING_TARGET_LATENCY for this rule,
+      so a rule on a busy table can be paced even when the others aren't.
+    - Within a tier, light rules run before heavy ones, so a heavy rule using up
+      the time budget doesn't hold back the cheap ones.
+    - `index_fields` are the fields an index should support the predicate with.
+      By default, the model's own fields the predicate filters on are used.
+    - `matches` is the predicate evaluated on a single saved row, in Python. With it,
+      rows saved into the candidates are tracked in the rule's dirty set, and runs
+      only look at them, with a full scan every TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL.
+    - `breakdown` is a field of the model the deleted rows are counted by, e.g. a level.
+    - `before_delete` is called with every batch before it is deleted, see
+      `BatchedDeletion`. A callable it returns runs once the batch committed.
+    - `select` is called with the primary keys of every page of candidates and
+      returns those to delete, see `BatchedDeletion`.
+    """
+
+    name: str
+    model: type[models.Model]
+    predicate: Callable[[], Q]
+    description: str
+    tier: str = DAILY.name
+    batch_size: int | None = None
+    target_latency: float | None = None
+    cost: str = COST_LIGHT
+    index_fields: tuple[str, ...] | None = None
+    matches: Callable[[models.Model], bool] | None = None
+    breakdown: str | None = None
+    before_delete: Callable[[QuerySet], Callable[[], Any] | None] | None = None
+    select: Callable[[list], list] | None = None
+
+    def candidates(self) -> QuerySet:
+        """
+        Get the candidate rows of the rule.
+
+        :return:
+        :rtype:
+        """
+
+        return self.model.objects.filter(self.predicate())
+
+    def indexed_fields(self) -> tuple[str, ...]:
+        """
+        Get the fields of the model an index should support the predicate with.
+
+        Lookups spanning relations and expressions, e.g. `Exists`, are left out,
+        they can't be supported by an index on the model's own table.
+
+        :return:
+        :rtype:
+        """
+
+        if self.index_fields is not None:
+            return self.index_fields
+
+        fields = []
+        pending = [self.predicate()]
+
+        while pending:
+            for child in pending.pop(0).children:
+                if isinstance(child, Q):
+                    pending.append(child)
+
+                    continue
+
+                if not isinstance(child, tuple):
+                    continue
+
+                name = child[0].split(LOOKUP_SEP)[0]
+                field = (
+                    self.model._meta.pk
+                    if name == "pk"
+                    else self.model._meta.get_field(name)
+                )
+
+                if field.concrete and field.name not in fields:
+                    fields.append(field.name)
+
+        return tuple(fields)
+
+
+_rules: dict[str, CleanupRule] = {}
+_hooks_discovered = False  # pylint: disable=invalid-name
+
+
+def register_rule(rule: CleanupRule) -> CleanupRule:
+    """
+    Register a cleanup rule.
+
+    :param rule:
+    :type rule:
+    :return:
+    :rtype:
+    """
+
+    if rule.cost not in COSTS:
+        raise ValueError(f"Unknown cost class of rule {rule.name}: {rule.cost}")
+
+    # Raises a ValueError for unknown tiers
+    get_tier(name=rule.tier)
+
+    if rule.name in _rules and _rules[rule.name] != rule:
+        raise ValueError(f"A different cleanup rule {rule.name} is already registered")
+
+    _rules[rule.name] = rule
+
+    track(rule=rule)
+
+    return rule
+
+
+def _discover_rules() -> None:
+    """
+    Register the cleanup rules provided by other apps through the rules hook, once.
+
+    A hook function returns a single rule or an iterable of rules. A failing hook is
+    logged and skipped, so it doesn't keep the rules of the other apps from being
+    registered.
+
+    :return:
+    :rtype:
+    """
+
+    global _hooks_discovered  # pylint: disable=global-statement
+
+    if _hooks_discovered:
+        return
+
+    for hook in get_hooks(RULES_HOOK):
+        try:
+            provided = hook()
+            rules = [provided] if isinstance(provided, CleanupRule) else provided
+
+            for rule in rules:
+                register_rule(rule=rule)
+
+                logger.debug(
+                    f"Registered cleanup rule {rule.name} from {hook.__module__}"
+                )
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(
+                f"Error registering the cleanup rules from {hook.__module__}: {e}",
+                exc_info=True,
+            )
+
+    _hooks_discovered = True
+
+
+def get_rule(name: str) -> CleanupRule:
+    """
+    Get a registered cleanup rule by its name.
+
+    :param name:
+    :type name:
+    :return:
+    :rtype:
+    """
+
+    _discover_rules()
+
+    try:
+        return _rules[name]
+    except KeyError:
+        raise ValueError(f"Unknown cleanup rule: {name}") from None
+
+
+def get_rules(tier: str | None = None) -> list[CleanupRule]:
+    """
+    Get the registered cleanup rules, light ones first, in the order they were registered.
+
+    :param tier: Only get the rules of this tier
+    :type tier: str | None
+    :return:
+    :rtype:
+    """
+
+    _discover_rules()
+
+    rules: Iterable[CleanupRule] = _rules.values()
+
+    if tier is not None:
+        rules = (rule for rule in rules if rule.tier == tier)
+
+    return sorted(rules, key=lambda rule: COSTS.index(rule.cost))
+
+
+CORPORATION_CLEANUP = register_rule(
+    CleanupRule(
+        name="corporation_cleanup",
+        model=EveCorporationInfo,
+        # Corporations with CEO ID 1 (indicating closed corporations)
+        predicate=lambda: Q(ceo_id=1),
+        description="closed corporations",
+        matches=lambda corporation: corporation.ceo_id == 1,
+    )
+)
+CHARACTER_CLEANUP = register_rule(
+    CleanupRule(
+        name="character_cleanup",
+        model=EveCharacter,
+        # Characters in corporation ID 1000001 (Doomheim)
+        predicate=lambda: Q(corporation_id=1000001),
+        description="characters in Doomheim",
+        matches=lambda character: character.corporation_id == 1000001,
+    )
+)
+
+
+CORPORATION_ID_REFERENCES = (
+    IdReference(
+        model=EveCharacter, field="corporation_id", target_field="corporation_id"
+    ),
+)
+ALLIANCE_ID_REFERENCES = (
+    IdReference(model=EveCharacter, field="alliance_id", target_field="alliance_id"),
+)
+
+
+def kept_alliances() -> Q:
+    """
+    Predicate of the alliances that are kept for more than their member corporations
+    without references of their own.
+
+    These are referred to by something other than a corporation, or have a member
+    corporation something refers to. Only looking one level deep, corporations
+    without references can't keep each other alive through their alliance.
+
+    :return:
+    :rtype:
+    """
+
+    return ~unreferenced(
+        model=EveAllianceInfo,
+        id_references=ALLIANCE_ID_REFERENCES,
+        exclude=(EveCorporationInfo,),
+    ) | Exists(
+        EveCorporationInfo._base_manager.filter(
+            ~unreferenced(
+                model=EveCorporationInfo, id_references=CORPORATION_ID_REFERENCES
+            ),
+            alliance_id=OuterRef("pk"),
+        )
+    )
+
+
+def unreferenced_corporations() -> Q:
+    """
+    Predicate of the corporations no character, state, group or other row refers to.
+
+    Membership of a kept alliance counts as reference, Alliance Auth creates the
+    member corporations of an alliance again when it populates it.
+
+    :return:
+    :rtype:
+    """
+
+    return unreferenced(
+        model=EveCorporationInfo, id_references=CORPORATION_ID_REFERENCES
+    ) & ~Exists(
+        EveAllianceInfo._base_manager.filter(
+            kept_alliances(), pk=OuterRef("alliance_id")
+        )
+    )
+
+
+def unreferenced_alliances() -> Q:
+    """
+    Predicate of the alliances no character, corporation, state or other row refers to.
+
+    The executor corporation of an alliance doesn't count as reference, or a
+    corporation and its alliance would keep each other.
+
+    :return:
+    :rtype:
+    """
+
+    return unreferenced(model=EveAllianceInfo, id_references=ALLIANCE_ID_REFERENCES)
+
+
+def orphan_rule(
+    name: str,
+    model: type[models.Model],
+    unreferenced_rows: Callable[[], Q],
+    description: str,
+) -> CleanupRule:
+    """
+    Build the cleanup rule of the rows of a model that have been unreferenced for longer
+    than TNNT_HOUSEKEEPING_ORPHAN_GRACE_PERIOD.
+
+    Every page of unreferenced rows is found with the anti-join of the predicate.
+    Its rows are recorded, see `OrphanedSince`, and those recorded for longer than
+    the grace period are deleted.
+
+    :param name: Name of the cleanup rule
+    :type name: str
+    :param model:
+    :type model:
+    :param unreferenced_rows: Predicate of the unreferenced rows
+    :type unreferenced_rows: Callable[[], Q]
+    :param description:
+    :type description:
+    :return:
+    :rtype:
+    """
+
+    orphaned_since = OrphanedSince(name=name)
+
+    return CleanupRule(
+        name=name,
+        model=model,
+        predicate=unreferenced_rows,
+        description=description,
+        cost=COST_HEAVY,
+        # Paged through in primary key order, the anti-joins use the indexes
+        # of the referring columns
+        index_fields=(),
+        select=lambda pks: orphaned_since.expired(
+            pks=pks, grace_period=TNNT_HOUSEKEEPING_ORPHAN_GRACE_PERIOD
+        ),
+    )
+
+
+# Orphaned corporations go first, so an alliance losing its last corporation
+# is recorded as orphan in the same run
+ORPHANED_CORPORATION_CLEANUP = register_rule(
+    orphan_rule(
+        name="orphaned_corporation_cleanup",
+        model=EveCorporationInfo,
+        unreferenced_rows=unreferenced_corporations,
+        description="orphaned corporations",
+    )
+)
+ORPHANED_ALLIANCE_CLEANUP = register_rule(
+    orphan_rule(
+        name="orphaned_alliance_cleanup",
+        model=EveAllianceInfo,
+        unreferenced_rows=unreferenced_alliances,
+        description="orphaned alliances",
+    )
+)
+
+
+def superseded_ownership_records() -> Q:
+    """
+    Predicate of the ownership records older than TNNT_HOUSEKEEPING_OWNERSHIP_RECORD_RETENTION
+    that are not the newest record of their character.
+
+    The newest record is found per row with an `EXISTS` subquery on a newer record of the
+    same character, so every batch only looks at its own page of the primary key order,
+    never at the whole table.
+
+    :return:
+    :rtype:
+    """
+
+    return Q(
+        Exists(
+            OwnershipRecord._default_manager.filter(
+                Q(created__gt=OuterRef("created"))
+                | Q(created=OuterRef("created"), pk__gt=OuterRef("pk")),
+                character_id=OuterRef("character_id"),
+            )
+        ),
+        created__lt=timezone.now()
+        - timedelta(seconds=TNNT_HOUSEKEEPING_OWNERSHIP_RECORD_RETENTION),
+    )
+
+
+OWNERSHIP_RECORD_CLEANUP = register_rule(
+    CleanupRule(
+        name="ownership_record_cleanup",
+        model=OwnershipRecord,
+        predicate=superseded_ownership_records,
+        description="superseded ownership records",
+        cost=COST_HEAVY,
+        # Small, paced batches, so the hourly ownership check is never held up
+        # by the locks of a long delete
+        batch_size=250,
+        target_latency=0.25,
+    )
+)
+
+
+def expired_notifications() -> Q:
+    """
+    Predicate of the read notifications older than
+    TNNT_HOUSEKEEPING_NOTIFICATION_READ_RETENTION, and of all notifications older than
+    TNNT_HOUSEKEEPING_NOTIFICATION_RETENTION.
+
+    :return:
+    :rtype:
+    """
+
+    now = timezone.now()
+
+    return Q(
+        viewed=True,
+        timestamp__lt=now
+        - timedelta(seconds=TNNT_HOUSEKEEPING_NOTIFICATION_READ_RETENTION),
+    ) | Q(
+        timestamp__lt=now - timedelta(seconds=TNNT_HOUSEKEEPING_NOTIFICATION_RETENTION)
+    )
+
+
+def invalidate_unread_counts(queryset: QuerySet) -> Callable[[], Any] | None:
+    """
+    Get the callback invalidating the cached unread notification counts of the users
+    a batch deletes unread notifications of.
+
+    Alliance Auth invalidates them in `Notification.delete()`, which deleting in bulk
+    doesn't call. The keys of the batch are deleted with a single cache call.
+
+    :param queryset: Notifications of the batch
+    :type queryset: QuerySet
+    :return:
+    :rtype:
+    """
+
+    keys = [
+        # pylint: disable=protected-access
+        Notification.objects._user_notification_cache_key(user_pk)
+        for user_pk in queryset.filter(viewed=False)
+        .order_by()
+        .values_list("user_id", flat=True)
+        .distinct()
+    ]
+
+    return partial(cache.delete_many, keys) if keys else None
+
+
+NOTIFICATION_CLEANUP = register_rule(
+    CleanupRule(
+        name="notification_cleanup",
+        model=Notification,
+        predicate=expired_notifications,
+        description="old notifications",
+        # Both sides of the predicate filter on the timestamp
+        index_fields=("timestamp",),
+        breakdown="level",
+        before_delete=invalidate_unread_counts,
+    )
+)
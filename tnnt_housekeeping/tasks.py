@@ -2,32 +2,98 @@
 Housekeeping tasks for TN-NT-Auth.
 """
 
+# Standard Library
+import json
+import math
+import os
+import time
+from collections.abc import Callable, Collection
+from dataclasses import dataclass
+from typing import Any
+from uuid import uuid4
+
 # Third Party
-from celery import shared_task
+from celery import group, shared_task
 from celery_once import QueueOnce
 
 # Django
+from django.db import router
+from django.db.models import Q, QuerySet
 from django.utils import timezone
 
 # Alliance Auth
-from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
 from allianceauth.services.hooks import get_extension_logger
 
 # TN-NT Auth Housekeeping
 from tnnt_housekeeping import __title__
+from tnnt_housekeeping.app_settings import (
+    TNNT_HOUSEKEEPING_ARCHIVE_DIR,
+    TNNT_HOUSEKEEPING_BATCH_SIZE,
+    TNNT_HOUSEKEEPING_CLAIM_TIMEOUT,
+    TNNT_HOUSEKEEPING_DEFER_SIGNALS,
+    TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL,
+    TNNT_HOUSEKEEPING_IMPACT_ACTION,
+    TNNT_HOUSEKEEPING_IMPACT_THRESHOLD,
+    TNNT_HOUSEKEEPING_MAX_BATCH_SIZE,
+    TNNT_HOUSEKEEPING_MAX_BATCH_SLEEP,
+    TNNT_HOUSEKEEPING_METRICS_TEXTFILE,
+    TNNT_HOUSEKEEPING_MIN_BATCH_SIZE,
+    TNNT_HOUSEKEEPING_PROFILE_DIR,
+    TNNT_HOUSEKEEPING_READ_DATABASE,
+    TNNT_HOUSEKEEPING_SHARD_PRIORITY,
+    TNNT_HOUSEKEEPING_SHARD_TIMEOUT,
+    TNNT_HOUSEKEEPING_SHARDS,
+    TNNT_HOUSEKEEPING_TARGET_LATENCY,
+    TNNT_HOUSEKEEPING_TIME_BUDGET,
+)
+from tnnt_housekeeping.handler.archive import Archive
 from tnnt_housekeeping.handler.cache import Cache
+from tnnt_housekeeping.handler.deletion import (
+    BatchedDeletion,
+    DeletionResult,
+    pk_quantile_ranges,
+    pk_ranges,
+)
+from tnnt_housekeeping.handler.dirty import DirtySet
+from tnnt_housekeeping.handler.estimate import (
+    IMPACT_ACTION_REFUSE,
+    ImpactEstimate,
+    estimate_rule,
+)
+from tnnt_housekeeping.handler.files import write_atomically
+from tnnt_housekeeping.handler.idset import IdSet
+from tnnt_housekeeping.handler.metrics import (
+    RuleMetrics,
+    collect_metrics,
+    load_metrics,
+    render_prometheus,
+    store_metrics,
+    write_textfile,
+)
+from tnnt_housekeeping.handler.profiling import profile_queries
+from tnnt_housekeeping.handler.throttle import AdaptiveThrottle
 from tnnt_housekeeping.providers import AppLogger
+from tnnt_housekeeping.rules import CleanupRule, get_rule, get_rules
+from tnnt_housekeeping.tiers import DAILY, HOURLY, Tier, due_tiers, get_tier, get_tiers
 
 logger = AppLogger(my_logger=get_extension_logger(name=__name__), prefix=__title__)
 
-CACHE_KEY_HOURLY_HOUSEKEEPING = "hourly-housekeeping-last-run"
-CACHE_KEY_DAILY_HOUSEKEEPING = "daily-housekeeping-last-run"
+CACHE_KEY_HOURLY_HOUSEKEEPING = HOURLY.cache_key
+CACHE_KEY_DAILY_HOUSEKEEPING = DAILY.cache_key
+CACHE_KEY_DAILY_HOUSEKEEPING_CLAIM = DAILY.claim_cache_key
+CACHE_KEY_SHARDED_HOUSEKEEPING = DAILY.sharded_cache_key
+CACHE_KEY_SUPPRESSED_DISPATCHES = "suppressed-dispatches"
+CACHE_KEY_CLEANUP_CURSOR = "cleanup-cursor"
+CACHE_KEY_TUNED_BATCH_SIZE = "tuned-batch-size"
+CACHE_KEY_FULL_SCAN = "full-scan"
+CACHE_KEY_SHARDED_DIRTY_HEADS = "dirty-heads"
+CACHE_KEY_SHARDED_FULL_SCANS = "full-scans"
 
 
 @shared_task(base=QueueOnce, once={"graceful": True, "timeout": 300})
 def housekeeping() -> None:
     """
-    Main housekeeping task that runs every minute and performs both hourly and daily housekeeping tasks.
+    Main housekeeping task that runs every minute and dispatches the housekeeping tiers that are due.
 
     :return:
     :rtype:
@@ -35,111 +101,1011 @@ def housekeeping() -> None:
 
     logger.info("Starting main housekeeping task.")
 
-    # hourly_housekeeping.delay()
-    daily_housekeeping.delay()
-
-
-# @shared_task(base=QueueOnce, once={"graceful": True, "timeout": 300})
-# def hourly_housekeeping():
-#     """
-#     This function performs hourly housekeeping tasks.
-#
-#     :return:
-#     :rtype:
-#     """
-#
-#     logger.info("Starting hourly housekeeping tasks.")
-#
-#     cache_subkey = CACHE_KEY_HOURLY_HOUSEKEEPING
-#     cached = Cache(subkey=cache_subkey).get()
-#
-#     if cached:
-#         logger.debug(
-#             "Hourly housekeeping tasks have already been run recently. Skipping."
-#         )
-#
-#         return
-#
-#     # Trigger all hourly hooks for TN-NT Housekeeping
-#
-#     # Update the cache to indicate that hourly housekeeping tasks have been run
-#     Cache(subkey=cache_subkey).set_hourly(value=timezone.now())
+    tiers = [tier for tier in get_tiers() if get_rules(tier=tier.name)]
+
+    # Only enqueue the tiers that are due, instead of letting them find out themselves
+    due = due_tiers(tiers=tiers)
+
+    if len(due) < len(tiers):
+        suppressed = Cache(subkey=CACHE_KEY_SUPPRESSED_DISPATCHES).incr(
+            timeout=None, delta=len(tiers) - len(due)
+        )
+
+        logger.debug(
+            f"{len(tiers) - len(due)} housekeeping tiers are not due. "
+            f"Skipping dispatch ({suppressed} suppressed so far)."
+        )
+
+    for tier in due:
+        tier_housekeeping.delay(tier=tier.name)
+
+
+@shared_task(base=QueueOnce, once={"graceful": True, "timeout": 300})
+def tier_housekeeping(tier: str, profile: bool = False) -> dict | None:
+    """
+    This function performs the housekeeping tasks of a tier.
+
+    :param tier: Name of the housekeeping tier
+    :type tier: str
+    :param profile: Profile the queries of the run, see `_profile_tier_housekeeping`
+    :type profile: bool
+    :return: Deleted rows per cleanup, or None when skipped
+    :rtype: dict | None
+    """
+
+    tier = get_tier(name=tier)
+
+    logger.info(f"Starting {tier.name} housekeeping tasks.")
+
+    owner = uuid4().hex
+    claim = Cache(subkey=tier.claim_cache_key)
+
+    if not claim.claim(owner=owner, timeout=TNNT_HOUSEKEEPING_CLAIM_TIMEOUT):
+        logger.debug(
+            f"{tier.name.capitalize()} housekeeping tasks are already running "
+            "on another worker. Skipping."
+        )
+
+        return None
+
+    def heartbeat():
+        return claim.extend(owner=owner, timeout=TNNT_HOUSEKEEPING_CLAIM_TIMEOUT)
+
+    try:
+        if profile:
+            return _profile_tier_housekeeping(tier=tier, heartbeat=heartbeat)
+
+        return _run_tier_housekeeping(tier=tier, heartbeat=heartbeat)
+    finally:
+        claim.release(owner=owner)
+
+
+def _profile_tier_housekeeping(tier: Tier, heartbeat: Callable[[], Any]) -> dict:
+    """
+    Perform the housekeeping tasks of a tier while profiling their queries.
+
+    The report is returned together with the results, and written to
+    TNNT_HOUSEKEEPING_PROFILE_DIR if that is set.
+
+    :param tier: Housekeeping tier
+    :type tier: Tier
+    :param heartbeat: Extends the tier's claim, called after every deleted batch
+    :type heartbeat: Callable[[], Any]
+    :return: Deleted rows per cleanup and the profile report
+    :rtype: dict
+    """
+
+    with profile_queries() as profiler:
+        results = _run_tier_housekeeping(tier=tier, heartbeat=heartbeat)
+
+    report = profiler.report()
+
+    if TNNT_HOUSEKEEPING_PROFILE_DIR:
+        path = os.path.join(
+            TNNT_HOUSEKEEPING_PROFILE_DIR,
+            f"{tier.name}-housekeeping-{timezone.now():%Y%m%dT%H%M%S}.json",
+        )
+
+        try:
+            write_atomically(path=path, content=json.dumps(report, indent=2))
+
+            logger.info(f"Wrote the profile report to {path}.")
+        except OSError as e:
+            logger.warning(f"Error writing the profile report to {path}: {e}")
+
+    return {"results": results, "profile": report}
 
 
 @shared_task(base=QueueOnce, once={"graceful": True, "timeout": 300})
-def daily_housekeeping() -> None:
+def daily_housekeeping(profile: bool = False) -> dict | None:
     """
     This function performs daily housekeeping tasks.
 
-    :return:
-    :rtype:
+    Kept for existing periodic task entries, see `tier_housekeeping`.
+
+    :param profile: Profile the queries of the run
+    :type profile: bool
+    :return: Deleted rows per cleanup, or None when skipped
+    :rtype: dict | None
     """
 
-    logger.info("Starting daily housekeeping tasks.")
+    return tier_housekeeping(tier=DAILY.name, profile=profile)
+
 
-    cache_subkey = CACHE_KEY_DAILY_HOUSEKEEPING
-    cached = Cache(subkey=cache_subkey).get()
+def _run_tier_housekeeping(tier: Tier, heartbeat: Callable[[], Any]) -> dict | None:
+    """
+    Perform the housekeeping tasks of a tier, while holding the tier's claim.
+
+    :param tier: Housekeeping tier
+    :type tier: Tier
+    :param heartbeat: Extends the tier's claim, called before every rule and after every
+        deleted batch. Returns False once the claim is lost.
+    :type heartbeat: Callable[[], Any]
+    :return: Deleted rows per cleanup, or None when skipped
+    :rtype: dict | None
+    """
 
-    if cached:
+    # Checks the tier's marker and its sharded run marker in one go
+    if not due_tiers(tiers=[tier]):
         logger.debug(
-            "Daily housekeeping tasks have already been run recently. Skipping."
+            f"{tier.name.capitalize()} housekeeping tasks have already been run "
+            "recently or are still in progress. Skipping."
         )
 
-        return
+        return None
+
+    rules = get_rules(tier=tier.name)
+    oversized = _oversized_rules(rules=rules)
+
+    if oversized and TNNT_HOUSEKEEPING_IMPACT_ACTION == IMPACT_ACTION_REFUSE:
+        for name, estimate in oversized.items():
+            logger.error(
+                f"Refusing to run {name}, it would delete an estimated {estimate.total} "
+                f"rows ({TNNT_HOUSEKEEPING_IMPACT_THRESHOLD} allowed): "
+                f"{dict(estimate.deleted)}"
+            )
+
+        rules = [rule for rule in rules if rule.name not in oversized]
+    elif oversized and TNNT_HOUSEKEEPING_SHARDS <= 1:
+        largest = max(estimate.total for estimate in oversized.values())
+        shards = max(math.ceil(largest / TNNT_HOUSEKEEPING_IMPACT_THRESHOLD), 2)
+
+        logger.warning(
+            f"{', '.join(oversized)} would delete up to an estimated {largest} rows "
+            f"({TNNT_HOUSEKEEPING_IMPACT_THRESHOLD} allowed), switching to "
+            f"{shards} shards."
+        )
+
+        return dispatch_sharded_housekeeping(
+            tier=tier, shards=shards, rules=rules, oversized=oversized
+        )
+
+    if TNNT_HOUSEKEEPING_SHARDS > 1:
+        return dispatch_sharded_housekeeping(
+            tier=tier,
+            shards=TNNT_HOUSEKEEPING_SHARDS,
+            rules=rules,
+            oversized=oversized,
+        )
+
+    deadline = (
+        time.monotonic() + TNNT_HOUSEKEEPING_TIME_BUDGET
+        if TNNT_HOUSEKEEPING_TIME_BUDGET is not None
+        else None
+    )
+    results = {}
+    claimed = True
 
-    # Trigger all daily hooks for TN-NT Housekeeping
-    DailyTasks.corporation_cleanup()  # Perform daily corporation cleanup tasks
-    DailyTasks.character_cleanup()  # Perform daily character cleanup tasks
+    # Run all cleanup rules of the tier, light ones first
+    for rule in rules:
+        time_budget = None if deadline is None else deadline - time.monotonic()
 
-    # Update the cache to indicate that daily housekeeping tasks have been run
-    Cache(subkey=cache_subkey).set_daily(value=timezone.now())
+        # A lost claim may be held by another worker by now, which runs the rules itself
+        claimed = claimed and heartbeat() is not False
 
+        if not claimed:
+            logger.warning(f"Lost the {tier.name} claim, postponing {rule.name}.")
 
-class DailyTasks:
+            results[rule.name] = DeletionResult(finished=False)
+
+            continue
+
+        if time_budget is not None and time_budget <= 0:
+            logger.info(f"No time budget left for {rule.name}, postponing it.")
+
+            results[rule.name] = DeletionResult(finished=False)
+
+            continue
+
+        results[rule.name] = run_rule(
+            rule=rule, heartbeat=heartbeat, time_budget=time_budget
+        )
+
+    if all(result.finished for result in results.values()):
+        # Update the cache to indicate that the tier's housekeeping tasks have been run
+        tier.set_marker(value=timezone.now())
+    else:
+        logger.info(
+            f"{tier.name.capitalize()} housekeeping tasks ran out of time, "
+            "continuing with the next run."
+        )
+
+    return {cleanup: result.as_dict() for cleanup, result in results.items()}
+
+
+def _oversized_rules(rules: list[CleanupRule]) -> dict[str, ImpactEstimate]:
     """
-    Class to handle daily housekeeping tasks.
+    Estimate the impact of cleanup rules and get those exceeding TNNT_HOUSEKEEPING_IMPACT_THRESHOLD.
+
+    :param rules: Cleanup rules
+    :type rules: list[CleanupRule]
+    :return: Impact estimate per rule name, empty if no threshold is set
+    :rtype: dict[str, ImpactEstimate]
     """
 
-    @staticmethod
-    def corporation_cleanup() -> None:
-        """
-        Perform daily corporation cleanup tasks.
+    if TNNT_HOUSEKEEPING_IMPACT_THRESHOLD is None:
+        return {}
 
-        :return:
-        :rtype:
-        """
+    estimates = (estimate_rule(rule=rule, explain=False) for rule in rules)
 
-        logger.info("Starting daily corporation cleanup tasks.")
+    return {
+        estimate.rule: estimate
+        for estimate in estimates
+        if estimate.total > TNNT_HOUSEKEEPING_IMPACT_THRESHOLD
+    }
 
-        # Find corporations with CEO ID 1 (indicating closed corporations)
-        closed_corps = EveCorporationInfo.objects.filter(ceo_id=1)
-        count = closed_corps.count()
 
-        logger.info(f"Found {count} closed corporations to delete.")
+def dispatch_sharded_housekeeping(
+    tier: Tier,
+    shards: int,
+    rules: list[CleanupRule] | None = None,
+    oversized: Collection[str] = (),
+) -> dict:
+    """
+    Split the cleanup rules of a tier into primary key range shards and dispatch them as a group.
 
-        try:
-            closed_corps.delete()
-        except Exception as e:  # pylint: disable=broad-except
-            logger.error(f"Error deleting closed corporations: {e}")
+    Alliance Auth doesn't configure a Celery result backend, so there is no chord.
+    Every shard stores its result in the cache and bumps a counter instead, and the
+    last shard to finish triggers `finalize_sharded_housekeeping`.
+
+    Rules with a dirty set, and no full scan due, are split by their dirty primary keys
+    instead. Each shard carries its part as encoded `IdSet`, and the dirty set is
+    drained once all shards of the rule have finished. The other rules with a dirty
+    set scan fully, which is remembered once all shards of the rule have finished.
+
+    Rules above TNNT_HOUSEKEEPING_IMPACT_THRESHOLD are split into ranges of about the
+    same number of candidates instead of equal width. Their cascades can still be
+    clustered, so the impact of each range is estimated again, and ranges still above
+    the threshold are refused.
+
+    :param tier: Housekeeping tier
+    :type tier: Tier
+    :param shards: Number of shards per cleanup
+    :type shards: int
+    :param rules: Cleanup rules to dispatch, defaults to all rules of the tier
+    :type rules: list[CleanupRule] | None
+    :param oversized: Names of the rules above TNNT_HOUSEKEEPING_IMPACT_THRESHOLD
+    :type oversized: Collection[str]
+    :return: Run ID and number of dispatched shards
+    :rtype: dict
+    """
+
+    run_id = uuid4().hex
+
+    if rules is None:
+        rules = get_rules(tier=tier.name)
+
+    ranges = []
+    dirty_heads = {}
+    full_scans = {}
+
+    for rule in rules:
+        dirty = _dirty_snapshot(rule=rule)
+
+        if dirty is not None and not dirty[1]:
+            DirtySet(name=rule.name).drain(head=dirty[0])
+
+            continue
+
+        # Taken before the split, the full scan covers every row marked before it
+        full_scan_head = (
+            DirtySet(name=rule.name).head()
+            if dirty is None and rule.matches is not None
+            else None
+        )
+        rule_ranges = _split_rule(
+            rule=rule,
+            shards=shards,
+            pks=dirty[1] if dirty is not None else None,
+            by_count=rule.name in oversized,
+        )
+
+        if rule.name in oversized:
+            accepted = _within_impact_threshold(rule=rule, ranges=rule_ranges)
+
+            # The dirty set is kept, and the full scan due, while refused rows are left
+            if len(accepted) < len(rule_ranges):
+                ranges.extend(accepted)
+
+                continue
+
+        if dirty is not None:
+            dirty_heads[rule.name] = dirty[0]
+        elif full_scan_head is not None:
+            full_scans[rule.name] = full_scan_head
+
+        ranges.extend(rule_ranges)
+
+    if not ranges:
+        logger.info("No cleanup candidates found, nothing to dispatch.")
+
+        for cleanup, head in full_scans.items():
+            _finish_full_scan(rule=get_rule(name=cleanup), dirty_head=head)
+
+        tier.set_marker(value=timezone.now())
+
+        return {"run_id": run_id, "shards": 0}
+
+    Cache(subkey=tier.sharded_cache_key).set(
+        value=run_id, timeout=TNNT_HOUSEKEEPING_SHARD_TIMEOUT
+    )
+
+    if dirty_heads:
+        Cache(
+            subkey=f"{tier.sharded_cache_key}:{run_id}:{CACHE_KEY_SHARDED_DIRTY_HEADS}"
+        ).set(value=dirty_heads, timeout=TNNT_HOUSEKEEPING_SHARD_TIMEOUT)
+
+    if full_scans:
+        Cache(
+            subkey=f"{tier.sharded_cache_key}:{run_id}:{CACHE_KEY_SHARDED_FULL_SCANS}"
+        ).set(value=full_scans, timeout=TNNT_HOUSEKEEPING_SHARD_TIMEOUT)
+
+    logger.info(
+        f"Dispatching {len(ranges)} {tier.name} housekeeping shards for run {run_id}."
+    )
+
+    group(
+        housekeeping_shard.si(
+            run_id=run_id,
+            shard=shard,
+            shards=len(ranges),
+            cleanup=cleanup,
+            pk_min=pk_min,
+            pk_max=pk_max,
+            tier=tier.name,
+            pks=pks,
+        )
+        for shard, (cleanup, pk_min, pk_max, pks) in enumerate(ranges)
+    ).apply_async(priority=TNNT_HOUSEKEEPING_SHARD_PRIORITY)
+
+    return {"run_id": run_id, "shards": len(ranges)}
+
+
+def _split_rule(
+    rule: CleanupRule, shards: int, pks: set | None, by_count: bool
+) -> list[tuple]:
+    """
+    Split the candidates of a rule into shard ranges.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :param shards: Number of shards
+    :type shards: int
+    :param pks: Dirty primary keys of the rule, None for a full scan
+    :type pks: set | None
+    :param by_count: Split a full scan into ranges of about the same number of
+        candidates instead of equal width
+    :type by_count: bool
+    :return: Shard ranges, as (name, first pk, last pk, encoded IdSet)
+    :rtype: list[tuple]
+    """
+
+    if pks is not None:
+        return [
+            (rule.name, chunk.starts[0], chunk.ends[-1], chunk.encode())
+            for chunk in IdSet(ids=pks).chunks(count=shards)
+        ]
+
+    split = pk_quantile_ranges if by_count else pk_ranges
+
+    return [
+        (rule.name, pk_min, pk_max, None)
+        for pk_min, pk_max in split(
+            queryset=rule.candidates().using(TNNT_HOUSEKEEPING_READ_DATABASE),
+            shards=shards,
+        )
+    ]
+
+
+def _within_impact_threshold(rule: CleanupRule, ranges: list[tuple]) -> list[tuple]:
+    """
+    Estimate the impact of every shard range of a rule, and refuse those still above
+    TNNT_HOUSEKEEPING_IMPACT_THRESHOLD.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :param ranges: Shard ranges of the rule, as (name, first pk, last pk, encoded IdSet)
+    :type ranges: list[tuple]
+    :return: The ranges within the threshold
+    :rtype: list[tuple]
+    """
+
+    accepted = []
+
+    for shard_range in ranges:
+        _, pk_min, pk_max, pks = shard_range
+        q = Q(pk__range=(pk_min, pk_max))
+
+        if pks is not None:
+            q &= IdSet.decode(encoded=pks).q()
+
+        estimate = estimate_rule(rule=rule, explain=False, q=q)
+
+        if estimate.total > TNNT_HOUSEKEEPING_IMPACT_THRESHOLD:
+            logger.error(
+                f"Refusing to run {rule.name} for primary keys {pk_min} to {pk_max}, "
+                f"it would delete an estimated {estimate.total} rows "
+                f"({TNNT_HOUSEKEEPING_IMPACT_THRESHOLD} allowed): "
+                f"{dict(estimate.deleted)}"
+            )
+
+            continue
+
+        accepted.append(shard_range)
+
+    return accepted
+
+
+@shared_task
+def housekeeping_shard(  # pylint: disable=too-many-arguments
+    run_id: str,
+    shard: int,
+    shards: int,
+    *,
+    cleanup: str,
+    pk_min: int,
+    pk_max: int,
+    tier: str = DAILY.name,
+    pks: str | None = None,
+) -> dict:
+    """
+    Run a single cleanup for a primary key range of a sharded run.
+
+    :param run_id: ID of the sharded run
+    :type run_id: str
+    :param shard: Number of this shard
+    :type shard: int
+    :param shards: Total number of shards of the run
+    :type shards: int
+    :param cleanup: Name of the cleanup rule
+    :type cleanup: str
+    :param pk_min: First primary key of the range
+    :type pk_min: int
+    :param pk_max: Last primary key of the range
+    :type pk_max: int
+    :param tier: Name of the housekeeping tier the run belongs to
+    :type tier: str
+    :param pks: Only clean up these primary keys of the range, as encoded `IdSet`
+    :type pks: str | None
+    :return: Deleted rows per model
+    :rtype: dict
+    """
+
+    sharded_cache_key = get_tier(name=tier).sharded_cache_key
+    rule = get_rule(name=cleanup)
+
+    if rule.tier != tier:
+        raise ValueError(f"Cleanup rule {rule.name} doesn't belong to tier {tier}")
+
+    # The metrics are published once merged with those of the other shards
+    result, metrics = _run_rule(
+        rule=rule,
+        pk_range=(pk_min, pk_max),
+        pks=IdSet.decode(encoded=pks) if pks is not None else None,
+    )
+    result = result.as_dict()
+
+    Cache(subkey=f"{sharded_cache_key}:{run_id}:{shard}").set(
+        value={"cleanup": cleanup, **result, "metrics": metrics.as_dict()},
+        timeout=TNNT_HOUSEKEEPING_SHARD_TIMEOUT,
+    )
+    finished = Cache(subkey=f"{sharded_cache_key}:{run_id}:done").incr(
+        timeout=TNNT_HOUSEKEEPING_SHARD_TIMEOUT
+    )
+
+    if finished == shards:
+        finalize_sharded_housekeeping.apply_async(
+            kwargs={"run_id": run_id, "shards": shards, "tier": tier},
+            priority=TNNT_HOUSEKEEPING_SHARD_PRIORITY,
+        )
+
+    return result
+
+
+@shared_task
+def finalize_sharded_housekeeping(
+    run_id: str, shards: int, tier: str = DAILY.name
+) -> dict:
+    """
+    Aggregate the shard results and metrics of a sharded run.
+
+    Only when every shard reported its result, none of them failed, the dirty sets
+    are drained, the full scans remembered and the tier's marker set. Otherwise, the
+    tier is due again and the next run picks up what this one left.
+
+    :param run_id: ID of the sharded run
+    :type run_id: str
+    :param shards: Total number of shards of the run
+    :type shards: int
+    :param tier: Name of the housekeeping tier the run belongs to
+    :type tier: str
+    :return: Deleted rows per cleanup
+    :rtype: dict
+    """
+
+    tier = get_tier(name=tier)
+    results, metrics, complete = _collect_shard_results(
+        tier=tier, run_id=run_id, shards=shards
+    )
+
+    for rule_metrics in metrics.values():
+        _publish_metrics(metrics=rule_metrics)
+
+    # A missing shard may belong to any rule, so it leaves every dirty set as it is
+    succeeded = {
+        cleanup
+        for cleanup, result in results.items()
+        if complete and result.finished and not result.failed
+    }
+    dirty_heads_cache = Cache(
+        subkey=f"{tier.sharded_cache_key}:{run_id}:{CACHE_KEY_SHARDED_DIRTY_HEADS}"
+    )
+    full_scans_cache = Cache(
+        subkey=f"{tier.sharded_cache_key}:{run_id}:{CACHE_KEY_SHARDED_FULL_SCANS}"
+    )
+
+    for cleanup, head in (dirty_heads_cache.get() or {}).items():
+        if cleanup in succeeded:
+            DirtySet(name=cleanup).drain(head=head)
+
+    for cleanup, head in (full_scans_cache.get() or {}).items():
+        # A rule without candidates got no shard, its full scan is done as well
+        if complete and (cleanup in succeeded or cleanup not in results):
+            _finish_full_scan(rule=get_rule(name=cleanup), dirty_head=head)
+
+    dirty_heads_cache.delete()
+    full_scans_cache.delete()
+
+    if complete and len(succeeded) == len(results):
+        # Update the cache to indicate that the tier's housekeeping tasks have been run
+        tier.set_marker(value=timezone.now())
+    else:
+        logger.warning(
+            f"Sharded {tier.name} housekeeping run {run_id} is incomplete, "
+            "continuing with the next run."
+        )
+
+    results = {cleanup: result.as_dict() for cleanup, result in results.items()}
+
+    logger.info(f"Sharded {tier.name} housekeeping run {run_id} finished: {results}")
+
+    Cache(subkey=f"{tier.sharded_cache_key}:{run_id}:done").delete()
+    Cache(subkey=tier.sharded_cache_key).delete()
+
+    return results
+
+
+def _collect_shard_results(
+    tier: Tier, run_id: str, shards: int
+) -> tuple[dict[str, DeletionResult], dict[str, RuleMetrics], bool]:
+    """
+    Collect and merge the results and metrics the shards of a sharded run stored.
+
+    :param tier: Housekeeping tier
+    :type tier: Tier
+    :param run_id: ID of the sharded run
+    :type run_id: str
+    :param shards: Total number of shards of the run
+    :type shards: int
+    :return: Deleted rows and metrics per cleanup, and whether every shard reported
+    :rtype: tuple[dict[str, DeletionResult], dict[str, RuleMetrics], bool]
+    """
 
-    @staticmethod
-    def character_cleanup() -> None:
-        """
-        Perform daily character cleanup tasks.
+    results = {}
+    metrics = {}
+    complete = True
 
-        :return:
-        :rtype:
-        """
+    for shard in range(shards):
+        shard_cache = Cache(subkey=f"{tier.sharded_cache_key}:{run_id}:{shard}")
+        shard_result = shard_cache.get()
+        shard_cache.delete()
 
-        logger.info("Starting daily character cleanup tasks.")
+        if not shard_result:
+            logger.warning(f"Result of shard {shard} of run {run_id} is missing.")
 
-        # Find all characters in corporation ID 1000001 (Doomheim)
-        delete_characters = EveCharacter.objects.filter(corporation_id=1000001)
-        count = delete_characters.count()
+            complete = False
 
-        logger.info(f"Found {count} characters to delete.")
+            continue
 
+        results.setdefault(shard_result["cleanup"], DeletionResult()).merge(
+            DeletionResult.from_dict(data=shard_result)
+        )
+
+        shard_metrics = RuleMetrics.from_dict(data=shard_result["metrics"])
+
+        if shard_result["cleanup"] in metrics:
+            metrics[shard_result["cleanup"]].merge(shard_metrics)
+        else:
+            metrics[shard_result["cleanup"]] = shard_metrics
+
+    return results, metrics, complete
+
+
+def run_rule(
+    rule: CleanupRule,
+    pk_range: tuple | None = None,
+    heartbeat: Callable[[], Any] | None = None,
+    time_budget: float | None = None,
+    pks: IdSet | None = None,
+) -> DeletionResult:
+    """
+    Run a cleanup rule through the batched deletion, and publish its metrics.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :param pk_range: Only clean up this inclusive primary key range
+    :type pk_range: tuple | None
+    :param heartbeat: Called after every deleted batch
+    :type heartbeat: Callable[[], Any] | None
+    :param time_budget: Wall-clock seconds the rule may take
+    :type time_budget: float | None
+    :param pks: Only clean up these primary keys, together with `pk_range`
+    :type pks: IdSet | None
+    :return: Deleted rows per model
+    :rtype: DeletionResult
+    """
+
+    result, metrics = _run_rule(
+        rule=rule,
+        pk_range=pk_range,
+        heartbeat=heartbeat,
+        time_budget=time_budget,
+        pks=pks,
+    )
+
+    _publish_metrics(metrics=metrics)
+
+    return result
+
+
+def _run_rule(
+    rule: CleanupRule,
+    pk_range: tuple | None = None,
+    heartbeat: Callable[[], Any] | None = None,
+    time_budget: float | None = None,
+    pks: IdSet | None = None,
+) -> tuple[DeletionResult, RuleMetrics]:
+    """
+    Run a cleanup rule through the batched deletion.
+
+    Without a primary key range, the rule resumes from the cursor saved by a
+    previous run that ran out of time, and saves its own cursor if it does too.
+    A rule with a dirty set only looks at the rows in it, unless a full scan is due.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :param pk_range: Only clean up this inclusive primary key range
+    :type pk_range: tuple | None
+    :param heartbeat: Called after every deleted batch
+    :type heartbeat: Callable[[], Any] | None
+    :param time_budget: Wall-clock seconds the rule may take
+    :type time_budget: float | None
+    :param pks: Only clean up these primary keys, together with `pk_range`
+    :type pks: IdSet | None
+    :return: Deleted rows per model, and the metrics of the run
+    :rtype: tuple[DeletionResult, RuleMetrics]
+    """
+
+    logger.info(f"Starting cleanup of {rule.description}.")
+
+    scope = _scope_run(rule=rule, pk_range=pk_range, pks=pks)
+    throttle = _throttle(rule=rule)
+    archive = _archive(rule=rule)
+    deletion = BatchedDeletion(
+        queryset=scope.queryset,
+        batch_size=rule.batch_size,
+        heartbeat=heartbeat,
+        time_budget=time_budget,
+        cursor=scope.cursor,
+        throttle=throttle,
+        read_using=TNNT_HOUSEKEEPING_READ_DATABASE,
+        defer_signals=TNNT_HOUSEKEEPING_DEFER_SIGNALS,
+        archive=archive,
+        breakdown=rule.breakdown,
+        before_delete=rule.before_delete,
+        select=rule.select,
+    )
+
+    with collect_metrics(
+        rule=rule.name, using=_metrics_databases(rule=rule), pk_range=pk_range
+    ) as metrics:
         try:
-            delete_characters.delete()
+            deletion.run()
         except Exception as e:  # pylint: disable=broad-except
-            logger.error(f"Error deleting characters in Doomheim: {e}")
+            deletion.result.failed = True
+
+            logger.error(f"Error deleting {rule.description}: {e}")
+
+    _finish_run(rule=rule, scope=scope, deletion=deletion)
+
+    if throttle is not None:
+        Cache(subkey=f"{CACHE_KEY_TUNED_BATCH_SIZE}:{rule.name}").set(
+            value=throttle.batch_size, timeout=None
+        )
+
+        logger.debug(f"Tuned batch size of {rule.name}: {throttle.batch_size}")
+
+    _log_result(rule=rule, result=deletion.result, archive=archive)
+
+    metrics.add_result(result=deletion.result)
+
+    return deletion.result, metrics
+
+
+@dataclass
+class RunScope:
+    """
+    The candidates a single run of a cleanup rule looks at, and where they come from.
+
+    - `dirty` is the snapshot of the dirty set the run is limited to, if any.
+    - `cursor_cache` is set for full scans, which save their cursor when they run out
+      of time, and `cursor` is the primary key a resumed full scan continues after.
+    - `dirty_head` is the head position of the dirty set when a full scan started
+      from scratch.
+    """
+
+    queryset: QuerySet
+    dirty: tuple[int, set] | None = None
+    cursor_cache: Cache | None = None
+    cursor: Any = None
+    dirty_head: int | None = None
+
+
+def _scope_run(
+    rule: CleanupRule, pk_range: tuple | None, pks: IdSet | None
+) -> RunScope:
+    """
+    Get the candidates a run of a rule looks at.
+
+    A shard looks at its primary key range, a rule with a dirty set at the rows in it,
+    unless a full scan is due. A full scan resumes from the cursor saved by a previous
+    run that ran out of time.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :param pk_range: Only clean up this inclusive primary key range
+    :type pk_range: tuple | None
+    :param pks: Only clean up these primary keys, together with `pk_range`
+    :type pks: IdSet | None
+    :return:
+    :rtype: RunScope
+    """
+
+    queryset = rule.candidates()
+
+    if pk_range is not None:
+        queryset = queryset.filter(pk__range=pk_range)
+
+        return RunScope(
+            queryset=queryset.filter(pks.q()) if pks is not None else queryset
+        )
+
+    if (dirty := _dirty_snapshot(rule=rule)) is not None:
+        logger.info(f"Checking {len(dirty[1])} changed rows for {rule.name}.")
+
+        # Restarts from scratch when it runs out of time, the set is small
+        return RunScope(queryset=queryset.filter(pk__in=dirty[1]), dirty=dirty)
+
+    scope = RunScope(
+        queryset=queryset,
+        cursor_cache=Cache(subkey=f"{CACHE_KEY_CLEANUP_CURSOR}:{rule.name}"),
+    )
+    scope.cursor = scope.cursor_cache.get() or None
+
+    if scope.cursor is not None:
+        logger.info(f"Resuming {rule.name} after primary key {scope.cursor}.")
+    elif rule.matches is not None:
+        # A full scan from scratch covers every row marked dirty before it started
+        scope.dirty_head = DirtySet(name=rule.name).head()
+
+    return scope
+
+
+def _finish_run(rule: CleanupRule, scope: RunScope, deletion: BatchedDeletion) -> None:
+    """
+    Drain the dirty set a run was limited to, or save or clear the cursor of a full
+    scan, and remember it once it finished.
+
+    :param rule: Cleanup rule
+    :type rule: CleanupRule
+    :param scope: Candidates the run looked at
+    :type scope: RunScope
+    :param deletion: Batched deletion of the run
+    :type deletion: BatchedDeletion
+    :return:
+    :rtype:
+    """
+
+    result = deletion.result
+
+    if scope.dirty is not None:
+        # A failed run leaves the dirty set for the next one
+        if result.finished and not result.failed:
+            DirtySet(name=rule.name).drain(head=scope.dirty[0])
+    elif scope.cursor_cache is not None:
+        if not result.finished:
+            scope.cursor_cache.set(
+                value=deletion.cursor,
+                timeout=get_tier(name=rule.tier).seconds_until_due(),
+            )
+
+            return
+
+        scope.cursor_cache.delete()
+
+        if not result.failed:
+            _finish_full_scan(rule=rule, dirty_head=scope.dirty_head)
+
+
+def _archive(rule: CleanupRule) -> Archive | None:
+    """
+    Get the archive of the rows a rule run deletes, if TNNT_HOUSEKEEPING_ARCHIVE_DIR is set.
+
+    :param rule:
+    :type rule:
+    :return:
+    :rtype:
+    """
+
+    if TNNT_HOUSEKEEPING_ARCHIVE_DIR is None:
+        return None
+
+    return Archive(name=rule.name, directory=TNNT_HOUSEKEEPING_ARCHIVE_DIR)
+
+
+def _metrics_databases(rule: CleanupRule) -> list[str]:
+    """
+    Get the aliases of the databases a rule run uses, whose queries are measured.
+
+    :param rule:
+    :type rule:
+    :return:
+    :rtype:
+    """
+
+    using = [router.db_for_write(rule.model)]
+
+    if TNNT_HOUSEKEEPING_READ_DATABASE is not None:
+        using.append(TNNT_HOUSEKEEPING_READ_DATABASE)
+
+    return using
+
+
+def _log_result(
+    rule: CleanupRule, result: DeletionResult, archive: Archive | None
+) -> None:
+    """
+    Log what a rule run archived and deleted.
+
+    :param rule:
+    :type rule:
+    :param result:
+    :type result:
+    :param archive:
+    :type archive:
+    :return:
+    :rtype:
+    """
+
+    if archive is not None and archive.rows:
+        logger.info(f"Archived {archive.rows} rows to {archive.path}.")
+
+    logger.info(
+        f"Deleted {result.deleted(rule.model._meta.label)} {rule.description} "
+        f"({result.total} rows in total: {dict(result.per_model)})."
+    )
+
+    if result.breakdown:
+        logger.info(
+            f"Deleted {rule.description} per {rule.breakdown}: {dict(result.breakdown)}."
+        )
+
+
+def _dirty_snapshot(rule: CleanupRule) -> tuple[int, set] | None:
+    """
+    Get the dirty set of a rule, unless the rule's next run must be a full scan.
+
+    A full scan is due when the rule has no dirty set, when the last full scan
+    is older than TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL, or when too many rows
+    changed for the dirty set to be cheaper.
+
+    :param rule:
+    :type rule:
+    :return: Head position and primary keys of the dirty set, None for a full scan
+    :rtype: tuple[int, set] | None
+    """
+
+    if rule.matches is None or not TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL:
+        return None
+
+    if not Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:{rule.name}").get():
+        logger.info(f"Full scan of {rule.name} is due.")
+
+        return None
+
+    return DirtySet(name=rule.name).snapshot()
+
+
+def _finish_full_scan(rule: CleanupRule, dirty_head: int | None) -> None:
+    """
+    Remember a finished full scan of a rule with a dirty set, until the next one is due.
+
+    :param rule:
+    :type rule:
+    :param dirty_head: Head position of the dirty set when the scan started from scratch
+    :type dirty_head: int | None
+    :return:
+    :rtype:
+    """
+
+    if rule.matches is None or not TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL:
+        return
+
+    Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:{rule.name}").set(
+        value=timezone.now(), timeout=TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL
+    )
+
+    if dirty_head is not None:
+        DirtySet(name=rule.name).drain(head=dirty_head)
+
+
+def _throttle(rule: CleanupRule) -> AdaptiveThrottle | None:
+    """
+    Get the adaptive throttle for a rule run, if the rule or TNNT_HOUSEKEEPING_TARGET_LATENCY
+    sets a target latency.
+
+    It starts from the batch size tuned by the rule's previous run, or else from
+    the rule's own batch size.
+
+    :param rule:
+    :type rule:
+    :return:
+    :rtype:
+    """
+
+    target_latency = rule.target_latency or TNNT_HOUSEKEEPING_TARGET_LATENCY
+
+    if target_latency is None:
+        return None
+
+    tuned = Cache(subkey=f"{CACHE_KEY_TUNED_BATCH_SIZE}:{rule.name}").get()
+
+    return AdaptiveThrottle(
+        batch_size=tuned or rule.batch_size or TNNT_HOUSEKEEPING_BATCH_SIZE,
+        target_latency=target_latency,
+        min_batch_size=TNNT_HOUSEKEEPING_MIN_BATCH_SIZE,
+        max_batch_size=TNNT_HOUSEKEEPING_MAX_BATCH_SIZE,
+        max_sleep=TNNT_HOUSEKEEPING_MAX_BATCH_SLEEP,
+    )
+
+
+def _publish_metrics(metrics: RuleMetrics) -> None:
+    """
+    Store the metrics of a rule run, and write the Prometheus textfile if configured.
+
+    Failing to publish metrics never fails the cleanup.
+
+    :param metrics:
+    :type metrics:
+    :return:
+    :rtype:
+    """
+
+    logger.info(
+        f"Cleanup rule {metrics.rule}: {metrics.total} rows in {metrics.wall_time:.2f}s "
+        f"({metrics.rows_per_second:.0f} rows/s, {metrics.queries} queries taking "
+        f"{metrics.db_time:.2f}s, {metrics.batch_latency:.3f}s per batch)."
+    )
+
+    try:
+        store_metrics(metrics=metrics)
+
+        if TNNT_HOUSEKEEPING_METRICS_TEXTFILE:
+            write_textfile(
+                path=TNNT_HOUSEKEEPING_METRICS_TEXTFILE,
+                content=render_prometheus(
+                    metrics=load_metrics(rules=[rule.name for rule in get_rules()])
+                ),
+            )
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning(f"Error publishing metrics of {metrics.rule}: {e}")
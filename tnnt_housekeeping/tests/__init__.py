@@ -6,24 +6,22 @@ Initializing our tests
 import socket
 
 # Django
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+
+# Alliance Auth
+from allianceauth.eveonline.models import (
+    EveAllianceInfo,
+    EveCharacter,
+    EveCorporationInfo,
+)
 
 
 class SocketAccessError(Exception):
     """Error raised when a test script accesses the network"""
 
 
-class BaseTestCase(TestCase):
-    """Variation of Django's TestCase class that prevents any network use.
-
-    Example:
-
-        .. code-block:: python
-
-            class TestMyStuff(BaseTestCase):
-                def test_should_do_what_i_need(self): ...
-
-    """
+class NetworkGuardMixin:
+    """Mixin for test cases that prevents any network use."""
 
     @classmethod
     def setUpClass(cls):
@@ -39,3 +37,103 @@ class BaseTestCase(TestCase):
     @staticmethod
     def guard(*args, **kwargs):
         raise SocketAccessError("Attempted to access network")
+
+
+class BaseTestCase(NetworkGuardMixin, TestCase):
+    """Variation of Django's TestCase class that prevents any network use.
+
+    Example:
+
+        .. code-block:: python
+
+            class TestMyStuff(BaseTestCase):
+                def test_should_do_what_i_need(self): ...
+
+    """
+
+
+class BaseTransactionTestCase(NetworkGuardMixin, TransactionTestCase):
+    """Variation of Django's TransactionTestCase class that prevents any network use.
+
+    For tests that need real commits, e.g. of every batch of a deletion.
+    """
+
+
+def create_character(
+    character_id: int, corporation_id: int = 1000001, using: str = "default"
+) -> EveCharacter:
+    """
+    Create an EveCharacter, in Doomheim by default.
+
+    The character ID is the primary key as well, so it is the same on every database.
+
+    :param character_id:
+    :type character_id:
+    :param corporation_id:
+    :type corporation_id:
+    :param using: Database alias
+    :type using:
+    :return:
+    :rtype:
+    """
+
+    return EveCharacter.objects.using(using).create(
+        pk=character_id,
+        character_id=character_id,
+        character_name=f"Character {character_id}",
+        corporation_id=corporation_id,
+        corporation_name=f"Corporation {corporation_id}",
+        corporation_ticker="TICK",
+    )
+
+
+def create_corporation(
+    corporation_id: int,
+    ceo_id: int = 90000001,
+    alliance: EveAllianceInfo | None = None,
+) -> EveCorporationInfo:
+    """
+    Create an EveCorporationInfo with a member.
+
+    :param corporation_id:
+    :type corporation_id:
+    :param ceo_id:
+    :type ceo_id:
+    :param alliance:
+    :type alliance:
+    :return:
+    :rtype:
+    """
+
+    return EveCorporationInfo.objects.create(
+        corporation_id=corporation_id,
+        corporation_name=f"Corporation {corporation_id}",
+        corporation_ticker="TICK",
+        member_count=1,
+        ceo_id=ceo_id,
+        alliance=alliance,
+    )
+
+
+def create_doomheim_characters(count: int, offset: int = 0) -> list[EveCharacter]:
+    """
+    Create characters in Doomheim with a single query.
+
+    :param count:
+    :type count:
+    :param offset: Added to the character IDs, to create more of them later
+    :type offset:
+    :return:
+    :rtype:
+    """
+
+    return EveCharacter.objects.bulk_create(
+        EveCharacter(
+            character_id=90000000 + offset + index,
+            character_name=f"Character {offset + index}",
+            corporation_id=1000001,
+            corporation_name="Doomheim",
+            corporation_ticker="666",
+        )
+        for index in range(count)
+    )
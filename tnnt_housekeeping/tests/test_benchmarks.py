@@ -0,0 +1,327 @@
+"""
+Benchmarks for the cleanup throughput on synthetic datasets.
+
+Skipped unless TNNT_HOUSEKEEPING_BENCHMARK is set, e.g.:
+
+    TNNT_HOUSEKEEPING_BENCHMARK=1 python runtests.py tnnt_housekeeping.tests.test_benchmarks
+
+- TNNT_HOUSEKEEPING_BENCHMARK_SIZES: Comma separated number of characters per dataset
+- TNNT_HOUSEKEEPING_BENCHMARK_BATCH_SIZES: Comma separated batch sizes
+- TNNT_HOUSEKEEPING_BENCHMARK_SEED: Seed of the dataset generator
+- TNNT_HOUSEKEEPING_BENCHMARK_OUTPUT: Path of the JSON results file
+"""
+
+# Standard Library
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import skipUnless
+from unittest.mock import patch
+
+# Django
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+
+# Alliance Auth
+from allianceauth.authentication.models import (
+    CharacterOwnership,
+    UserProfile,
+    get_guest_state,
+)
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping import __version__
+from tnnt_housekeeping.handler.archive import Archive
+from tnnt_housekeeping.handler.deletion import BatchedDeletion
+from tnnt_housekeeping.handler.metrics import collect_metrics
+from tnnt_housekeeping.handler.plan import DeletionPlan
+from tnnt_housekeeping.rules import CHARACTER_CLEANUP, CORPORATION_CLEANUP
+from tnnt_housekeeping.tests import BaseTransactionTestCase
+
+BENCHMARK = os.environ.get("TNNT_HOUSEKEEPING_BENCHMARK")
+SIZES = os.environ.get("TNNT_HOUSEKEEPING_BENCHMARK_SIZES", "1000,10000")
+BATCH_SIZES = os.environ.get("TNNT_HOUSEKEEPING_BENCHMARK_BATCH_SIZES", "100,500,2000")
+SEED = int(os.environ.get("TNNT_HOUSEKEEPING_BENCHMARK_SEED", "42"))
+OUTPUT = os.environ.get("TNNT_HOUSEKEEPING_BENCHMARK_OUTPUT", "benchmark-results.json")
+
+# Deletion strategies, see `run_strategy()`
+STRATEGY_UNBATCHED = "unbatched"
+STRATEGY_COLLECTOR = "batched-collector"
+STRATEGY_PLAN = "batched-plan"
+STRATEGY_ARCHIVE = "batched-plan-archive"
+
+
+def _int_list(value: str) -> list[int]:
+    """
+    Parse a comma separated list of integers.
+
+    :param value:
+    :type value:
+    :return:
+    :rtype:
+    """
+
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def generate_dataset(size: int, seed: int) -> dict:
+    """
+    Generate a synthetic dataset of characters, corporations, users and ownerships.
+
+    - About half the corporations are closed (CEO ID 1).
+    - About half the characters are in Doomheim, the others in one of the corporations.
+    - About half the characters are owned by their own user, as main character.
+
+    The same size and seed always generate the same dataset.
+
+    :param size: Number of characters
+    :type size: int
+    :param seed: Seed of the random generator
+    :type seed: int
+    :return: Number of generated rows per model
+    :rtype: dict
+    """
+
+    rng = random.Random(seed)
+    guest_state = get_guest_state()
+
+    corporations = EveCorporationInfo.objects.bulk_create(
+        EveCorporationInfo(
+            corporation_id=98000000 + index,
+            corporation_name=f"Corporation {index}",
+            corporation_ticker=f"C{index % 10000}",
+            member_count=rng.randint(1, 500),
+            ceo_id=1 if rng.random() < 0.5 else 90000000 + index,
+        )
+        for index in range(max(size // 10, 1))
+    )
+    corporation_ids = [corporation.corporation_id for corporation in corporations]
+
+    characters = EveCharacter.objects.bulk_create(
+        EveCharacter(
+            character_id=90000000 + index,
+            character_name=f"Character {index}",
+            corporation_id=(
+                1000001 if rng.random() < 0.5 else rng.choice(corporation_ids)
+            ),
+            corporation_name="Corporation",
+            corporation_ticker="CORP",
+        )
+        for index in range(size)
+    )
+    owned = [character for character in characters if rng.random() < 0.5]
+
+    users = User.objects.bulk_create(
+        User(username=f"benchmark-{character.character_id}") for character in owned
+    )
+    UserProfile.objects.bulk_create(
+        UserProfile(user=user, state=guest_state, main_character=character)
+        for user, character in zip(users, owned)
+    )
+    CharacterOwnership.objects.bulk_create(
+        CharacterOwnership(
+            character=character, user=user, owner_hash=f"{character.character_id}"
+        )
+        for user, character in zip(users, owned)
+    )
+
+    return {
+        "eveonline.EveCorporationInfo": len(corporations),
+        "eveonline.EveCharacter": len(characters),
+        "auth.User": len(users),
+        "authentication.CharacterOwnership": len(owned),
+    }
+
+
+def delete_dataset() -> None:
+    """
+    Delete what is left of a generated dataset.
+
+    :return:
+    :rtype:
+    """
+
+    User.objects.filter(username__startswith="benchmark-").delete()
+    EveCharacter.objects.all().delete()
+    EveCorporationInfo.objects.all().delete()
+
+
+def run_strategy(queryset, strategy: str, batch_size: int | None) -> tuple:
+    """
+    Delete the rows of a queryset with a deletion strategy.
+
+    - unbatched: A single `QuerySet.delete()`, as the cleanups did before batching.
+    - batched-collector: BatchedDeletion, always with Django's deletion collector.
+    - batched-plan: BatchedDeletion in bulk mode, with the deletion plan if it is safe.
+    - batched-plan-archive: batched-plan, archiving every batch to a temporary directory.
+
+    :param queryset:
+    :type queryset:
+    :param strategy:
+    :type strategy:
+    :param batch_size:
+    :type batch_size:
+    :return: Deleted rows per model label, and the number of batches
+    :rtype: tuple
+    """
+
+    if strategy == STRATEGY_UNBATCHED:
+        _, per_model = queryset.delete()
+
+        return per_model, 1
+
+    if strategy == STRATEGY_COLLECTOR:
+        with patch.object(DeletionPlan, "for_model", return_value=None):
+            result = BatchedDeletion(queryset=queryset, batch_size=batch_size).run()
+    elif strategy == STRATEGY_ARCHIVE:
+        with tempfile.TemporaryDirectory() as directory:
+            result = BatchedDeletion(
+                queryset=queryset,
+                batch_size=batch_size,
+                defer_signals=True,
+                archive=Archive(name="benchmark", directory=directory),
+            ).run()
+    else:
+        result = BatchedDeletion(
+            queryset=queryset, batch_size=batch_size, defer_signals=True
+        ).run()
+
+    return dict(result.per_model), result.batches
+
+
+@skipUnless(BENCHMARK, "Set TNNT_HOUSEKEEPING_BENCHMARK to run the benchmarks")
+class TestCleanupBenchmarks(BaseTransactionTestCase):
+    """
+    Benchmarks for the cleanup throughput on synthetic datasets.
+    """
+
+    def measure(  # pylint: disable=too-many-arguments
+        self, size: int, rule, strategy: str, batch_size: int | None, seed: int
+    ) -> dict:
+        """
+        Measure a single strategy on a fresh dataset.
+
+        Every batch commits, as it does in production. What is left of the dataset
+        is deleted afterwards, so every measurement starts from the same data.
+        Memory is traced while the strategy runs, which slows it down, the times
+        compare the strategies with each other.
+
+        :param size:
+        :type size:
+        :param rule:
+        :type rule:
+        :param strategy:
+        :type strategy:
+        :param batch_size:
+        :type batch_size:
+        :param seed:
+        :type seed:
+        :return:
+        :rtype:
+        """
+
+        generated = generate_dataset(size=size, seed=seed)
+        queryset = rule.candidates()
+        candidates = queryset.count()
+        plan = DeletionPlan.for_model(model=rule.model)
+
+        tracemalloc.start()
+
+        try:
+            with collect_metrics(rule=rule.name) as metrics:
+                per_model, batches = run_strategy(
+                    queryset=queryset, strategy=strategy, batch_size=batch_size
+                )
+
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertFalse(queryset.exists())
+
+        delete_dataset()
+
+        total = sum(per_model.values())
+
+        return {
+            "size": size,
+            "rule": rule.name,
+            "strategy": strategy,
+            "batch_size": batch_size,
+            "plan_used": strategy in (STRATEGY_PLAN, STRATEGY_ARCHIVE)
+            and plan is not None
+            and plan.is_safe(deferred=True),
+            "generated": generated,
+            "candidates": candidates,
+            "batches": batches,
+            "rows_deleted": total,
+            "per_model": per_model,
+            "wall_time": metrics.wall_time,
+            "db_time": metrics.db_time,
+            "queries": metrics.queries,
+            "queries_per_candidate": metrics.queries / candidates if candidates else 0,
+            "rows_per_second": total / metrics.wall_time if metrics.wall_time else 0,
+            "peak_memory_kb": peak_memory // 1024,
+        }
+
+    def test_cleanup_throughput(self):
+        """
+        Measure every deletion strategy and batch size for every dataset size.
+
+        :return:
+        :rtype:
+        """
+
+        results = []
+        configurations = [(STRATEGY_UNBATCHED, None)] + [
+            (strategy, batch_size)
+            for strategy in (STRATEGY_COLLECTOR, STRATEGY_PLAN, STRATEGY_ARCHIVE)
+            for batch_size in _int_list(BATCH_SIZES)
+        ]
+
+        for size in sorted(_int_list(SIZES)):
+            for rule in (CORPORATION_CLEANUP, CHARACTER_CLEANUP):
+                for strategy, batch_size in configurations:
+                    started = time.perf_counter()
+                    result = self.measure(
+                        size=size,
+                        rule=rule,
+                        strategy=strategy,
+                        batch_size=batch_size,
+                        seed=SEED,
+                    )
+                    results.append(result)
+
+                    sys.stdout.write(
+                        f"\n{size:>8} {rule.name:<20} {strategy:<20} "
+                        f"{batch_size or '-':>6} {result['wall_time']:>9.3f}s "
+                        f"{result['queries']:>8} queries "
+                        f"{result['rows_per_second']:>10.0f} rows/s "
+                        f"({time.perf_counter() - started:.1f}s incl. setup)"
+                    )
+
+        with open(OUTPUT, "w", encoding="utf-8") as output:
+            json.dump(
+                {
+                    "meta": {
+                        "version": __version__,
+                        "django": django.get_version(),
+                        "python": platform.python_version(),
+                        "database": connection.vendor,
+                        "seed": SEED,
+                        "timestamp": time.time(),
+                    },
+                    "results": results,
+                },
+                output,
+                indent=2,
+            )
+
+        sys.stdout.write(f"\nWrote {len(results)} results to {OUTPUT}\n")
@@ -0,0 +1,90 @@
+"""
+Unit tests for the management commands of tnnt_housekeeping.
+"""
+
+# Standard Library
+import json
+from io import StringIO
+from unittest.mock import patch
+
+# Django
+from django.core.management import CommandError, call_command
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.rules import get_rules
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+class TestTnntHousekeepingCommand(BaseTestCase):
+    """
+    Unit tests for the tnnt_housekeeping management command.
+    """
+
+    @patch("tnnt_housekeeping.management.commands.tnnt_housekeeping.tier_housekeeping")
+    def test_runs_the_tier_with_profiling(self, mock_tier_housekeeping):
+        """
+        Test that the command runs the tier in process and prints the result as JSON.
+
+        :param mock_tier_housekeeping:
+        :type mock_tier_housekeeping:
+        :return:
+        :rtype:
+        """
+
+        mock_tier_housekeeping.return_value = {"results": {}, "profile": {"queries": 3}}
+        stdout = StringIO()
+
+        call_command("tnnt_housekeeping", "--profile", stdout=stdout)
+
+        mock_tier_housekeeping.assert_called_once_with(tier="daily", profile=True)
+        self.assertEqual(json.loads(stdout.getvalue())["profile"]["queries"], 3)
+
+    @patch("tnnt_housekeeping.management.commands.tnnt_housekeeping.tier_housekeeping")
+    def test_reports_a_skipped_run(self, mock_tier_housekeeping):
+        """
+        Test that the command says so when the tier is not due.
+
+        :param mock_tier_housekeeping:
+        :type mock_tier_housekeeping:
+        :return:
+        :rtype:
+        """
+
+        mock_tier_housekeeping.return_value = None
+        stdout = StringIO()
+
+        call_command("tnnt_housekeeping", stdout=stdout)
+
+        self.assertIn("not due", stdout.getvalue())
+
+    def test_rejects_unknown_tiers(self):
+        """
+        Test that the command fails for a tier that is not registered.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(CommandError):
+            call_command("tnnt_housekeeping", "--tier", "fortnightly")
+
+    @patch("tnnt_housekeeping.management.commands.tnnt_housekeeping.tier_housekeeping")
+    def test_dry_run_prints_the_estimates(self, mock_tier_housekeeping):
+        """
+        Test that a dry run prints an estimate per rule of the tier, without running it.
+
+        :param mock_tier_housekeeping:
+        :type mock_tier_housekeeping:
+        :return:
+        :rtype:
+        """
+
+        stdout = StringIO()
+
+        call_command("tnnt_housekeeping", "--dry-run", stdout=stdout)
+
+        mock_tier_housekeeping.assert_not_called()
+        self.assertEqual(
+            set(json.loads(stdout.getvalue())),
+            {rule.name for rule in get_rules(tier="daily")},
+        )
@@ -0,0 +1,151 @@
+"""
+Unit tests for the archive handler in tnnt_housekeeping.handler.archive.
+"""
+
+# Standard Library
+import gzip
+import json
+import os
+import tempfile
+from collections import Counter
+from unittest.mock import patch
+
+# Django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+
+# Alliance Auth
+from allianceauth.authentication.models import CharacterOwnership
+from allianceauth.eveonline.models import EveCharacter
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.archive import Archive
+from tnnt_housekeeping.handler.deletion import BatchedDeletion
+from tnnt_housekeeping.rules import CHARACTER_CLEANUP
+from tnnt_housekeeping.tasks import run_rule
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+def read_archive(path: str) -> list:
+    """
+    Read all records of an archive file.
+
+    :param path:
+    :type path:
+    :return:
+    :rtype:
+    """
+
+    with gzip.open(path, mode="rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+class TestArchive(BaseTestCase):
+    """
+    Unit tests for the Archive class.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username="owner")
+
+        for character_id in range(1, 6):
+            character = EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            )
+            CharacterOwnership.objects.create(
+                character=character, user=user, owner_hash=f"{character_id}"
+            )
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = Archive(name="test", directory=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_archives_every_batch_with_its_cascaded_rows(self):
+        """
+        Test that the rows of all batches are archived before deleting them,
+        the cascaded ones included, and read back as a single stream.
+
+        :return:
+        :rtype:
+        """
+
+        result = BatchedDeletion(
+            queryset=EveCharacter.objects.filter(corporation_id=1000001),
+            batch_size=2,
+            archive=self.archive,
+        ).run()
+
+        records = read_archive(path=self.archive.path)
+        characters = [
+            record for record in records if record["model"] == "eveonline.EveCharacter"
+        ]
+
+        self.assertEqual(result.batches, 3)
+        self.assertEqual(
+            Counter(record["model"] for record in records), result.per_model
+        )
+        self.assertEqual(self.archive.rows, result.total)
+        self.assertEqual(
+            sorted(record["fields"]["character_id"] for record in characters),
+            [1, 2, 3, 4, 5],
+        )
+        self.assertNotIn("id", characters[0]["fields"])
+        self.assertIn("archived", characters[0])
+
+    def test_archives_nothing_without_candidates(self):
+        """
+        Test that no archive file is created when nothing is deleted.
+
+        :return:
+        :rtype:
+        """
+
+        BatchedDeletion(
+            queryset=EveCharacter.objects.filter(corporation_id=98000001),
+            archive=self.archive,
+        ).run()
+
+        self.assertFalse(os.path.exists(self.archive.path))
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_rule_runs_archive_to_the_configured_directory(self):
+        """
+        Test that run_rule archives to TNNT_HOUSEKEEPING_ARCHIVE_DIR, in a daily file per rule.
+
+        :return:
+        :rtype:
+        """
+
+        cache.clear()
+
+        with (
+            patch(
+                "tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_ARCHIVE_DIR",
+                self.directory.name,
+            ),
+            patch("tnnt_housekeeping.tasks.logger") as mock_logger,
+        ):
+            result = run_rule(rule=CHARACTER_CLEANUP)
+
+        (filename,) = os.listdir(self.directory.name)
+
+        self.assertRegex(filename, r"^character_cleanup-\d{4}-\d{2}-\d{2}\.jsonl\.gz$")
+        self.assertEqual(
+            len(read_archive(path=os.path.join(self.directory.name, filename))),
+            result.total,
+        )
+        self.assertIn(
+            f"Archived {result.total} rows",
+            " ".join(str(call.args[0]) for call in mock_logger.info.call_args_list),
+        )
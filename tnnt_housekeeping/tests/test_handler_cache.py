@@ -6,7 +6,7 @@ Unit tests for the Cache handler in tnnt_housekeeping.handler.cache.
 from unittest.mock import patch
 
 # Django
-from django.utils.timezone import now
+from django.core.cache import cache
 
 # TN-NT Auth Housekeeping
 from tnnt_housekeeping.handler.cache import Cache
@@ -50,9 +50,9 @@ class TestHandlerCache(BaseTestCase):
             Cache(subkey="")
 
     @patch("tnnt_housekeeping.handler.cache.cache.set")
-    def test_sets_hourly_cache_with_correct_key_and_timeout(self, mock_cache_set):
+    def test_sets_cache_with_custom_timeout(self, mock_cache_set):
         """
-        Test that set_hourly sets the cache with the correct key and a timeout of 3600 seconds.
+        Test that set sets the cache with the correct key and the given timeout.
 
         :param mock_cache_set:
         :type mock_cache_set:
@@ -61,126 +61,226 @@ class TestHandlerCache(BaseTestCase):
         """
 
         cache_handler = Cache(subkey="test_key")
-        cache_handler.set_hourly(value="test_value")
+        cache_handler.set(value="test_value", timeout=42)
 
         mock_cache_set.assert_called_once_with(
-            key="tnnt-housekeeping:test_key", value="test_value", timeout=3600
+            key="tnnt-housekeeping:test_key", value="test_value", timeout=42
         )
 
-    @patch("tnnt_housekeeping.handler.cache.cache.set")
-    def test_sets_daily_cache_with_correct_key_and_calculated_timeout(
-        self, mock_cache_set
-    ):
+    def test_increments_counter_and_creates_it_if_missing(self):
         """
-        Test that set_daily sets the cache with the correct key and a timeout calculated until 11:30 AM the next day.
+        Test that incr creates the counter with the given timeout and increments it.
 
-        :param mock_cache_set:
-        :type mock_cache_set:
         :return:
         :rtype:
         """
 
-        with patch(
-            "tnnt_housekeeping.handler.cache.Cache._get_max_cache_time",
-            return_value=86400,
-        ):
-            cache_handler = Cache(subkey="test_key")
-            cache_handler.set_daily(value="test_value")
+        self.mock_cache.incr.return_value = 1
 
-            mock_cache_set.assert_called_once_with(
-                key="tnnt-housekeeping:test_key", value="test_value", timeout=86400
-            )
+        result = Cache(subkey="counter").incr(timeout=60)
 
-    @patch("tnnt_housekeeping.handler.cache.cache.get")
-    def test_retrieves_existing_cache_value(self, mock_cache_get):
+        self.assertEqual(result, 1)
+        self.mock_cache.add.assert_called_once_with(
+            key="tnnt-housekeeping:counter", value=0, timeout=60
+        )
+        self.mock_cache.incr.assert_called_once_with(
+            key="tnnt-housekeeping:counter", delta=1
+        )
+
+    def test_gets_many_keys_with_a_single_read(self):
         """
-        Test that get retrieves the existing cache value when the cache key exists.
+        Test that get_many reads all subkeys at once and returns False for missing keys.
 
-        :param mock_cache_get:
-        :type mock_cache_get:
         :return:
         :rtype:
         """
 
-        mock_cache_get.return_value = "existing_value"
-        cache_handler = Cache(subkey="existing_key")
-        result = cache_handler.get()
+        self.mock_cache.get_many.return_value = {"tnnt-housekeeping:first": "value"}
 
-        self.assertEqual(result, "existing_value")
-        mock_cache_get.assert_called_once_with(
-            key="tnnt-housekeeping:existing_key", default=False
+        result = Cache.get_many(subkeys=["first", "second"])
+
+        self.assertEqual(result, {"first": "value", "second": False})
+        self.mock_cache.get_many.assert_called_once_with(
+            keys=["tnnt-housekeeping:first", "tnnt-housekeeping:second"]
         )
 
-    @patch("tnnt_housekeeping.handler.cache.cache.get")
-    def test_returns_default_when_cache_key_does_not_exist(self, mock_cache_get):
+    def test_sets_many_keys_with_a_single_write(self):
         """
-        Test that get returns the default value (False) when the cache key does not exist.
+        Test that set_many writes all subkeys at once with the same timeout.
 
-        :param mock_cache_get:
-        :type mock_cache_get:
         :return:
         :rtype:
         """
 
-        mock_cache_get.return_value = False
-        cache_handler = Cache(subkey="nonexistent_key")
-        result = cache_handler.get()
+        Cache.set_many(values={"first": 1, "second": 2}, timeout=60)
 
-        self.assertFalse(result)
-        mock_cache_get.assert_called_once_with(
-            key="tnnt-housekeeping:nonexistent_key", default=False
+        self.mock_cache.set_many.assert_called_once_with(
+            data={"tnnt-housekeeping:first": 1, "tnnt-housekeeping:second": 2},
+            timeout=60,
         )
 
-    @patch("tnnt_housekeeping.handler.cache.now")
-    def test_returns_seconds_until_next_day_target_time(self, mock_now):
+    def test_deletes_cache_key(self):
+        """
+        Test that delete removes the cache key.
+
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey="test_key").delete()
+
+        self.mock_cache.delete.assert_called_once_with(key="tnnt-housekeeping:test_key")
+
+    def test_claims_cache_key_atomically(self):
         """
-        Test that _get_max_cache_time returns the correct number of seconds until 11:30 AM the next day when the current time is before 11:30 AM.
+        Test that claim uses an atomic add with the owner as value.
 
-        :param mock_now:
-        :type mock_now:
         :return:
         :rtype:
         """
 
-        mock_now.return_value = now().replace(
-            hour=10, minute=0, second=0, microsecond=0
+        self.mock_cache.add.return_value = True
+
+        result = Cache(subkey="claim").claim(owner="worker-1", timeout=300)
+
+        self.assertTrue(result)
+        self.mock_cache.add.assert_called_once_with(
+            key="tnnt-housekeeping:claim", value="worker-1", timeout=300
         )
-        result = Cache._get_max_cache_time()
 
-        self.assertEqual(result, 5400)  # 1.5 hours in seconds
+    def test_claim_is_refused_when_already_held(self):
+        """
+        Test that claim returns False when the key is already held.
+
+        :return:
+        :rtype:
+        """
+
+        self.mock_cache.add.return_value = False
+
+        self.assertFalse(Cache(subkey="claim").claim(owner="worker-2", timeout=300))
 
-    @patch("tnnt_housekeeping.handler.cache.now")
-    def test_returns_seconds_until_target_time_next_day_when_past_target(
-        self, mock_now
-    ):
+    def test_extends_claim_held_by_owner(self):
         """
-        Test that _get_max_cache_time returns the correct number of seconds until 11:30 AM the next day when the current time is after 11:30 AM.
+        Test that extend touches the key when the owner still holds the claim.
 
-        :param mock_now:
-        :type mock_now:
         :return:
         :rtype:
         """
 
-        mock_now.return_value = now().replace(
-            hour=12, minute=0, second=0, microsecond=0
+        self.mock_cache.get.return_value = "worker-1"
+        self.mock_cache.touch.return_value = True
+
+        result = Cache(subkey="claim").extend(owner="worker-1", timeout=300)
+
+        self.assertTrue(result)
+        self.mock_cache.touch.assert_called_once_with(
+            key="tnnt-housekeeping:claim", timeout=300
         )
-        result = Cache._get_max_cache_time()
 
-        self.assertGreater(result, 0)
+    def test_does_not_extend_claim_held_by_someone_else(self):
+        """
+        Test that extend leaves a claim alone which has been taken over by another owner.
 
-    @patch("tnnt_housekeeping.handler.cache.now")
-    def test_handles_midnight_correctly(self, mock_now):
+        :return:
+        :rtype:
         """
-        Test that _get_max_cache_time returns the correct number of seconds until 11:30 AM the next day when the current time is at midnight.
 
-        :param mock_now:
-        :type mock_now:
+        self.mock_cache.get.return_value = "worker-2"
+
+        result = Cache(subkey="claim").extend(owner="worker-1", timeout=300)
+
+        self.assertFalse(result)
+        self.mock_cache.touch.assert_not_called()
+
+    def test_releases_only_own_claim(self):
+        """
+        Test that release only deletes the key when the owner still holds the claim.
+
+        :return:
+        :rtype:
+        """
+
+        self.mock_cache.get.return_value = "worker-2"
+        Cache(subkey="claim").release(owner="worker-1")
+        self.mock_cache.delete.assert_not_called()
+
+        self.mock_cache.get.return_value = "worker-1"
+        Cache(subkey="claim").release(owner="worker-1")
+        self.mock_cache.delete.assert_called_once_with(key="tnnt-housekeeping:claim")
+
+    def test_extend_and_release_are_atomic_on_redis(self):
+        """
+        Test that on Redis, extend and release compare the owner and act in one script,
+        without reading the key first.
+
         :return:
         :rtype:
         """
 
-        mock_now.return_value = now().replace(hour=0, minute=0, second=0, microsecond=0)
-        result = Cache._get_max_cache_time()
+        self._cache_patcher.stop()
+        claim = Cache(subkey="atomic-claim")
+
+        try:
+            claim.claim(owner="worker-1", timeout=60)
+
+            with (
+                patch.object(cache, "get") as mock_get,
+                patch.object(cache, "touch") as mock_touch,
+            ):
+                self.assertFalse(claim.extend(owner="worker-2", timeout=300))
+                self.assertTrue(claim.extend(owner="worker-1", timeout=300))
+                claim.release(owner="worker-2")
+
+                mock_get.assert_not_called()
+                mock_touch.assert_not_called()
+
+            self.assertGreater(cache.ttl(claim._get_cache_key()), 60)
+            self.assertEqual(claim.get(), "worker-1")
+
+            claim.release(owner="worker-1")
+
+            self.assertFalse(claim.get())
+        finally:
+            cache.delete(claim._get_cache_key())
+            self._cache_patcher.start()
+
+    @patch("tnnt_housekeeping.handler.cache.cache.get")
+    def test_retrieves_existing_cache_value(self, mock_cache_get):
+        """
+        Test that get retrieves the existing cache value when the cache key exists.
+
+        :param mock_cache_get:
+        :type mock_cache_get:
+        :return:
+        :rtype:
+        """
 
-        self.assertGreater(result, 0)
+        mock_cache_get.return_value = "existing_value"
+        cache_handler = Cache(subkey="existing_key")
+        result = cache_handler.get()
+
+        self.assertEqual(result, "existing_value")
+        mock_cache_get.assert_called_once_with(
+            key="tnnt-housekeeping:existing_key", default=False
+        )
+
+    @patch("tnnt_housekeeping.handler.cache.cache.get")
+    def test_returns_default_when_cache_key_does_not_exist(self, mock_cache_get):
+        """
+        Test that get returns the default value (False) when the cache key does not exist.
+
+        :param mock_cache_get:
+        :type mock_cache_get:
+        :return:
+        :rtype:
+        """
+
+        mock_cache_get.return_value = False
+        cache_handler = Cache(subkey="nonexistent_key")
+        result = cache_handler.get()
+
+        self.assertFalse(result)
+        mock_cache_get.assert_called_once_with(
+            key="tnnt-housekeeping:nonexistent_key", default=False
+        )
@@ -0,0 +1,579 @@
+"""
+Unit tests for the deletion handler in tnnt_housekeeping.handler.deletion.
+"""
+
+# Standard Library
+from unittest.mock import Mock, patch
+
+# Django
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError
+from django.db.models import QuerySet
+
+# Alliance Auth
+from allianceauth.authentication.models import CharacterOwnership
+from allianceauth.eveonline.models import EveCharacter
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.deletion import (
+    BatchedDeletion,
+    DeletionResult,
+    backoff,
+    is_retryable,
+    pk_quantile_ranges,
+    pk_ranges,
+)
+from tnnt_housekeeping.tests import BaseTestCase, create_character
+
+
+class TestBatchedDeletion(BaseTestCase):
+    """
+    Unit tests for the BatchedDeletion class in tnnt_housekeeping.handler.deletion.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for character_id in range(1, 8):
+            create_character(character_id=character_id, corporation_id=1000001)
+
+        create_character(character_id=100, corporation_id=98000001)
+
+    def test_raises_type_error_when_batch_size_is_not_integer(self):
+        """
+        Test that initializing BatchedDeletion with a non-integer batch size raises a TypeError.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(TypeError):
+            BatchedDeletion(queryset=EveCharacter.objects.all(), batch_size="10")
+
+    def test_raises_value_error_when_batch_size_is_not_positive(self):
+        """
+        Test that initializing BatchedDeletion with a batch size below 1 raises a ValueError.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(ValueError):
+            BatchedDeletion(queryset=EveCharacter.objects.all(), batch_size=0)
+
+    def test_yields_primary_keys_in_ascending_pages(self):
+        """
+        Test that batches yields the candidate primary keys in ascending pages of batch_size.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        expected = list(queryset.order_by("pk").values_list("pk", flat=True))
+
+        batches = list(BatchedDeletion(queryset=queryset, batch_size=3).batches())
+
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        self.assertEqual([pk for batch in batches for pk in batch], expected)
+
+    def test_deletes_all_matching_rows_in_batches(self):
+        """
+        Test that run deletes all matching rows and leaves the other rows alone.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+
+        result = BatchedDeletion(queryset=queryset, batch_size=3).run()
+
+        self.assertEqual(result.batches, 3)
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 7)
+        self.assertFalse(queryset.exists())
+        self.assertTrue(EveCharacter.objects.filter(character_id=100).exists())
+
+    def test_only_deletes_the_selected_rows_of_every_page(self):
+        """
+        Test that only the primary keys `select` returns are deleted, and the cursor
+        still moves past the whole page.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+        select = Mock(side_effect=lambda page: page[:1])
+
+        deletion = BatchedDeletion(queryset=queryset, batch_size=3, select=select)
+        result = deletion.run()
+
+        self.assertEqual(select.call_count, 3)
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 3)
+        self.assertEqual(
+            list(queryset.order_by("pk").values_list("pk", flat=True)),
+            pks[1:3] + pks[4:6],
+        )
+        self.assertEqual(deletion.cursor, pks[-1])
+
+    def test_calls_heartbeat_after_every_batch(self):
+        """
+        Test that run calls the heartbeat once per committed batch.
+
+        :return:
+        :rtype:
+        """
+
+        heartbeat = Mock()
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+
+        BatchedDeletion(queryset=queryset, batch_size=3, heartbeat=heartbeat).run()
+
+        self.assertEqual(heartbeat.call_count, 3)
+
+    def test_stops_at_batch_boundary_when_heartbeat_fails(self):
+        """
+        Test that run stops after the batch whose heartbeat returned False, e.g. because
+        the claim expired, and marks the result as unfinished.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+        heartbeat = Mock(side_effect=[True, False])
+
+        deletion = BatchedDeletion(queryset=queryset, batch_size=3, heartbeat=heartbeat)
+        result = deletion.run()
+
+        self.assertFalse(result.finished)
+        self.assertEqual(result.batches, 2)
+        self.assertEqual(deletion.cursor, pks[5])
+        self.assertEqual(queryset.count(), 1)
+
+    def test_stops_at_batch_boundary_when_time_budget_is_used_up(self):
+        """
+        Test that run stops after the first batch when the time budget is used up, and a new run resumes from the cursor.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+
+        deletion = BatchedDeletion(queryset=queryset, batch_size=3, time_budget=0)
+        result = deletion.run()
+
+        self.assertFalse(result.finished)
+        self.assertEqual(result.batches, 1)
+        self.assertEqual(deletion.cursor, pks[2])
+        self.assertEqual(queryset.count(), 4)
+
+        resumed = BatchedDeletion(queryset=queryset, batch_size=3, cursor=pks[2])
+        result = resumed.run()
+
+        self.assertTrue(result.finished)
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 4)
+        self.assertFalse(queryset.exists())
+
+    def test_is_finished_when_last_page_is_short(self):
+        """
+        Test that run reports finished when the budget is used up on the last, short page.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+
+        result = BatchedDeletion(queryset=queryset, batch_size=10, time_budget=0).run()
+
+        self.assertTrue(result.finished)
+        self.assertFalse(queryset.exists())
+
+    def test_does_nothing_when_there_are_no_candidates(self):
+        """
+        Test that run issues a single query and deletes nothing when no rows match.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1)
+
+        with self.assertNumQueries(1):
+            result = BatchedDeletion(queryset=queryset, batch_size=3).run()
+
+        self.assertEqual(result.batches, 0)
+        self.assertEqual(result.total, 0)
+
+    def test_counts_cascaded_rows_per_model(self):
+        """
+        Test that run reports the deleted rows per model, including cascaded ownerships.
+
+        :return:
+        :rtype:
+        """
+
+        user = User.objects.create_user(username="Bruce Wayne")
+        CharacterOwnership.objects.create(
+            character=EveCharacter.objects.get(character_id=1),
+            owner_hash="abc123",
+            user=user,
+        )
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+
+        result = BatchedDeletion(queryset=queryset, batch_size=5).run()
+
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 7)
+        self.assertEqual(result.deleted("authentication.CharacterOwnership"), 1)
+        self.assertEqual(result.deleted("authentication.OwnershipRecord"), 1)
+        self.assertEqual(result.total, 9)
+        self.assertEqual(
+            result.as_dict()["per_model"],
+            {
+                "eveonline.EveCharacter": 7,
+                "authentication.CharacterOwnership": 1,
+                "authentication.OwnershipRecord": 1,
+            },
+        )
+
+    def test_counts_the_breakdown_of_the_locked_rows(self):
+        """
+        Test that the breakdown counts the rows locked for deletion, not those of the
+        batch before a concurrent change moved one of them out of the candidates.
+
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        select_for_update = QuerySet.select_for_update
+
+        def change_then_lock(qs, *args, **kwargs):
+            # Another transaction moves a character out while the lock is awaited
+            EveCharacter.objects.filter(character_id=1).update(corporation_id=98000001)
+
+            return select_for_update(qs, *args, **kwargs)
+
+        with patch.object(
+            QuerySet, "select_for_update", autospec=True, side_effect=change_then_lock
+        ):
+            result = BatchedDeletion(
+                queryset=queryset, batch_size=10, breakdown="corporation_name"
+            ).run()
+
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 6)
+        self.assertEqual(result.breakdown, {"Corporation 1000001": 6})
+
+
+@patch("tnnt_housekeeping.handler.deletion.time.sleep")
+@patch.object(BatchedDeletion, "in_outer_transaction", return_value=False)
+class TestBatchRetry(BaseTestCase):
+    """
+    Unit tests for the retry of batches failing with a deadlock or lock timeout.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for character_id in range(1, 5):
+            create_character(character_id=character_id, corporation_id=1000001)
+
+    def test_detects_retryable_errors(self, mock_outer, mock_sleep):
+        """
+        Test that deadlocks and lock timeouts are retryable, other errors aren't.
+
+        :param mock_outer:
+        :type mock_outer:
+        :param mock_sleep:
+        :type mock_sleep:
+        :return:
+        :rtype:
+        """
+
+        postgres_deadlock = OperationalError("deadlock detected")
+        postgres_deadlock.__cause__ = Exception("deadlock detected")
+        postgres_deadlock.__cause__.sqlstate = "40P01"
+        postgres_syntax = OperationalError("syntax error")
+        postgres_syntax.__cause__ = Exception("syntax error")
+        postgres_syntax.__cause__.sqlstate = "42601"
+
+        self.assertTrue(is_retryable(error=OperationalError(1213, "Deadlock found")))
+        self.assertTrue(is_retryable(error=OperationalError(1205, "Lock wait timeout")))
+        self.assertTrue(is_retryable(error=postgres_deadlock))
+        self.assertFalse(is_retryable(error=postgres_syntax))
+        self.assertFalse(is_retryable(error=OperationalError(2006, "Gone away")))
+        self.assertFalse(is_retryable(error=IntegrityError(1213, "Not a lock error")))
+
+    def test_backoff_is_capped(self, mock_outer, mock_sleep):
+        """
+        Test that the backoff never exceeds the maximum.
+
+        :param mock_outer:
+        :type mock_outer:
+        :param mock_sleep:
+        :type mock_sleep:
+        :return:
+        :rtype:
+        """
+
+        with patch("tnnt_housekeeping.handler.deletion.random.uniform") as mock_uniform:
+            backoff(attempt=1)
+            backoff(attempt=20)
+
+        self.assertEqual(mock_uniform.call_args_list[0].args, (0, 0.5))
+        self.assertEqual(mock_uniform.call_args_list[1].args, (0, 10))
+
+    def test_retries_a_deadlocked_batch(self, mock_outer, mock_sleep):
+        """
+        Test that a batch failing with a deadlock is retried, and the run carries on.
+
+        :param mock_outer:
+        :type mock_outer:
+        :param mock_sleep:
+        :type mock_sleep:
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        deletion = BatchedDeletion(queryset=queryset, batch_size=2)
+        delete_batch = deletion.delete_batch
+        failures = [OperationalError(1213, "Deadlock found"), None, None]
+
+        def flaky_delete_batch(pks):
+            failure = failures.pop(0)
+
+            if failure is not None:
+                raise failure
+
+            return delete_batch(pks=pks)
+
+        with patch.object(deletion, "delete_batch", side_effect=flaky_delete_batch):
+            result = deletion.run()
+
+        self.assertEqual(result.retries, 1)
+        self.assertEqual(result.batches, 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertFalse(queryset.exists())
+
+    def test_gives_up_after_the_last_attempt(self, mock_outer, mock_sleep):
+        """
+        Test that the error is raised once all attempts failed, keeping earlier batches.
+
+        :param mock_outer:
+        :type mock_outer:
+        :param mock_sleep:
+        :type mock_sleep:
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        deletion = BatchedDeletion(queryset=queryset, batch_size=2)
+        delete_batch = deletion.delete_batch
+        calls = []
+
+        def deadlocked_after_first_batch(pks):
+            calls.append(pks)
+
+            if len(calls) > 1:
+                raise OperationalError(1205, "Lock wait timeout exceeded")
+
+            return delete_batch(pks=pks)
+
+        with (
+            patch.object(
+                deletion, "delete_batch", side_effect=deadlocked_after_first_batch
+            ),
+            self.assertRaises(OperationalError),
+        ):
+            deletion.run()
+
+        # 1 successful batch, then 5 attempts of the second one
+        self.assertEqual(len(calls), 6)
+        self.assertEqual(deletion.result.batches, 1)
+        self.assertEqual(deletion.result.retries, 4)
+        self.assertEqual(queryset.count(), 2)
+
+    def test_does_not_retry_other_errors(self, mock_outer, mock_sleep):
+        """
+        Test that other errors and errors inside an outer transaction are raised right away.
+
+        :param mock_outer:
+        :type mock_outer:
+        :param mock_sleep:
+        :type mock_sleep:
+        :return:
+        :rtype:
+        """
+
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+
+        for error, outer in (
+            (OperationalError(2006, "MySQL server has gone away"), False),
+            (OperationalError(1213, "Deadlock found"), True),
+        ):
+            mock_outer.return_value = outer
+            deletion = BatchedDeletion(queryset=queryset, batch_size=2)
+
+            with (
+                self.subTest(error=error, outer=outer),
+                patch.object(
+                    deletion, "delete_batch", side_effect=error
+                ) as mock_delete,
+                self.assertRaises(OperationalError),
+            ):
+                deletion.run()
+
+            mock_delete.assert_called_once()
+
+        mock_sleep.assert_not_called()
+
+
+class TestDeletionResult(BaseTestCase):
+    """
+    Unit tests for the DeletionResult class in tnnt_housekeeping.handler.deletion.
+    """
+
+    def test_adds_batches_and_skips_empty_counts(self):
+        """
+        Test that add sums up the batches and ignores models without deleted rows.
+
+        :return:
+        :rtype:
+        """
+
+        result = DeletionResult()
+        result.add(per_model={"eveonline.EveCharacter": 2, "eveonline.Other": 0})
+        result.add(per_model={"eveonline.EveCharacter": 3})
+
+        self.assertEqual(
+            result.as_dict(),
+            {
+                "batches": 2,
+                "total": 5,
+                "per_model": {"eveonline.EveCharacter": 5},
+                "finished": True,
+                "retries": 0,
+                "failed": False,
+                "breakdown": {},
+            },
+        )
+
+    def test_merges_results_of_other_runs(self):
+        """
+        Test that merge adds up batches and rows of a result restored with from_dict.
+
+        :return:
+        :rtype:
+        """
+
+        result = DeletionResult()
+        result.add(per_model={"eveonline.EveCharacter": 2})
+        result.merge(
+            DeletionResult.from_dict(
+                data={
+                    "batches": 2,
+                    "total": 4,
+                    "per_model": {
+                        "eveonline.EveCharacter": 3,
+                        "authentication.CharacterOwnership": 1,
+                    },
+                }
+            )
+        )
+
+        self.assertEqual(result.batches, 3)
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 5)
+        self.assertEqual(result.total, 6)
+
+
+class TestPkRanges(BaseTestCase):
+    """
+    Unit tests for the pk_ranges function in tnnt_housekeeping.handler.deletion.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for character_id in range(1, 11):
+            create_character(character_id=character_id, corporation_id=1000001)
+
+    def test_splits_primary_key_range_into_shards(self):
+        """
+        Test that pk_ranges covers the primary key range with consecutive, non-overlapping ranges.
+
+        :return:
+        :rtype:
+        """
+
+        pks = list(EveCharacter.objects.order_by("pk").values_list("pk", flat=True))
+
+        ranges = pk_ranges(queryset=EveCharacter.objects.all(), shards=3)
+
+        self.assertEqual(
+            ranges,
+            [
+                (pks[0], pks[3]),
+                (pks[4], pks[7]),
+                (pks[8], pks[9]),
+            ],
+        )
+
+    def test_splits_clustered_candidates_by_count(self):
+        """
+        Test that pk_quantile_ranges gives ranges of about the same number of candidates,
+        where pk_ranges puts a cluster into a single range.
+
+        :return:
+        :rtype:
+        """
+
+        pks = list(EveCharacter.objects.order_by("pk").values_list("pk", flat=True))
+        clustered = EveCharacter.objects.filter(pk__in=[*pks[:6], pks[-1]])
+
+        self.assertEqual(
+            pk_ranges(queryset=clustered, shards=2),
+            [(pks[0], pks[4]), (pks[5], pks[9])],
+        )
+        self.assertEqual(
+            pk_quantile_ranges(queryset=clustered, shards=2),
+            [(pks[0], pks[3]), (pks[4], pks[-1])],
+        )
+        self.assertEqual(
+            pk_quantile_ranges(queryset=EveCharacter.objects.all(), shards=3),
+            [(pks[0], pks[3]), (pks[4], pks[7]), (pks[8], pks[9])],
+        )
+        self.assertEqual(
+            pk_quantile_ranges(
+                queryset=EveCharacter.objects.filter(corporation_id=1), shards=3
+            ),
+            [],
+        )
+
+    def test_returns_empty_list_without_candidates(self):
+        """
+        Test that pk_ranges returns an empty list when no rows match.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(
+            pk_ranges(queryset=EveCharacter.objects.filter(corporation_id=1), shards=3),
+            [],
+        )
+
+    def test_raises_value_error_when_shards_is_not_positive(self):
+        """
+        Test that pk_ranges raises a ValueError for less than one shard.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(ValueError):
+            pk_ranges(queryset=EveCharacter.objects.all(), shards=0)
@@ -0,0 +1,165 @@
+"""
+Unit tests for the dirty set handler in tnnt_housekeeping.handler.dirty.
+"""
+
+# Standard Library
+from unittest.mock import patch
+
+# Django
+from django.core.cache import cache
+from django.db import transaction
+from django.test import override_settings
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCorporationInfo
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.dirty import DirtySet, mark_dirty
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestDirtySet(BaseTestCase):
+    """
+    Unit tests for the DirtySet class.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_keeps_keys_added_after_the_snapshot_for_the_next_drain(self):
+        """
+        Test that a drain only marks the keys of its snapshot as handled.
+
+        :return:
+        :rtype:
+        """
+
+        dirty = DirtySet(name="test")
+        dirty.add(pk=1)
+        dirty.add(pk=2)
+        dirty.add(pk=1)
+
+        head, pks = dirty.snapshot()
+
+        dirty.add(pk=3)
+        dirty.drain(head=head)
+
+        self.assertEqual((head, pks), (3, {1, 2}))
+        self.assertEqual(dirty.snapshot(), (4, {3}))
+        self.assertEqual(dirty.head(), 4)
+
+    @patch("tnnt_housekeeping.handler.dirty.TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL", 0)
+    @patch("tnnt_housekeeping.handler.dirty.Cache")
+    def test_adds_nothing_without_full_scan_interval(self, mock_cache):
+        """
+        Test that no keys are written when every run scans fully.
+
+        :param mock_cache:
+        :type mock_cache:
+        :return:
+        :rtype:
+        """
+
+        DirtySet(name="test").add(pk=1)
+
+        mock_cache.assert_not_called()
+
+    @patch("tnnt_housekeeping.handler.dirty.MAX_DIRTY_PKS", 1)
+    def test_snapshot_gives_up_on_too_many_keys(self):
+        """
+        Test that a snapshot is None when a full scan is cheaper.
+
+        :return:
+        :rtype:
+        """
+
+        dirty = DirtySet(name="test")
+        dirty.add(pk=1)
+        dirty.add(pk=2)
+
+        self.assertIsNone(dirty.snapshot())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestMarkDirty(BaseTestCase):
+    """
+    Unit tests for the post_save receiver marking rows dirty.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.corporation = EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Corporation",
+            corporation_ticker="CORP",
+            member_count=1,
+            ceo_id=2002,
+        )
+
+    def test_marks_rows_saved_into_the_candidates(self):
+        """
+        Test that only a save matching the rule adds the row to its dirty set.
+
+        :return:
+        :rtype:
+        """
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.corporation.member_count = 2
+            self.corporation.save()
+
+        self.assertEqual(DirtySet(name="corporation_cleanup").head(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.corporation.ceo_id = 1
+            self.corporation.save()
+
+        self.assertEqual(
+            DirtySet(name="corporation_cleanup").snapshot(), (1, {self.corporation.pk})
+        )
+
+    def test_ignores_rolled_back_and_raw_saves(self):
+        """
+        Test that rolled back saves and fixture loading leave the dirty set alone.
+
+        :return:
+        :rtype:
+        """
+
+        self.corporation.ceo_id = 1
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.corporation.save()
+
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+
+            mark_dirty(sender=EveCorporationInfo, instance=self.corporation, raw=True)
+
+        self.assertEqual(DirtySet(name="corporation_cleanup").head(), 0)
+
+    def test_never_fails_the_save(self):
+        """
+        Test that an error marking a row is logged, and the save goes through.
+
+        :return:
+        :rtype:
+        """
+
+        with (
+            patch("tnnt_housekeeping.handler.dirty.DirtySet", side_effect=RuntimeError),
+            patch("tnnt_housekeeping.handler.dirty.logger") as mock_logger,
+        ):
+            self.corporation.ceo_id = 1
+            self.corporation.save()
+
+        mock_logger.error.assert_called_once()
+        self.assertEqual(EveCorporationInfo.objects.get().ceo_id, 1)
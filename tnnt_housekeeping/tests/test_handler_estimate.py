@@ -0,0 +1,139 @@
+"""
+Unit tests for the impact estimate handler in tnnt_housekeeping.handler.estimate.
+"""
+
+# Standard Library
+from unittest.mock import patch
+
+# Django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Alliance Auth
+from allianceauth.authentication.models import OwnershipRecord, State, UserProfile
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.checks import check_impact_action
+from tnnt_housekeeping.handler.estimate import estimate_rule
+from tnnt_housekeeping.rules import CHARACTER_CLEANUP, CORPORATION_CLEANUP
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+class TestEstimateRule(BaseTestCase):
+    """
+    Unit tests for the estimate_rule function in tnnt_housekeeping.handler.estimate.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        state = State.objects.create(name="Estimate State", priority=75)
+
+        for character_id in range(1, 4):
+            character = EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            )
+            user = User.objects.create(username=f"user-{character_id}")
+            state.member_characters.add(character)
+            OwnershipRecord.objects.create(
+                character=character, user=user, owner_hash=f"hash-{character_id}"
+            )
+            UserProfile.objects.filter(user=user).update(main_character=character)
+
+        EveCharacter.objects.create(
+            character_id=10,
+            character_name="Alive Character",
+            corporation_id=2001,
+            corporation_name="Corporation",
+            corporation_ticker="CORP",
+        )
+
+        for corporation_id, ceo_id in ((2001, 10), (2002, 1)):
+            corporation = EveCorporationInfo.objects.create(
+                corporation_id=corporation_id,
+                corporation_name=f"Corporation {corporation_id}",
+                corporation_ticker="CORP",
+                member_count=1,
+                ceo_id=ceo_id,
+            )
+            state.member_corporations.add(corporation)
+
+    def test_counts_the_cascade_fan_out_per_model(self):
+        """
+        Test that the estimate counts the candidates, cascaded and nulled rows per model.
+
+        :return:
+        :rtype:
+        """
+
+        estimate = estimate_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertEqual(estimate.candidates, 3)
+        self.assertEqual(estimate.deleted["eveonline.EveCharacter"], 3)
+        self.assertEqual(estimate.deleted["authentication.OwnershipRecord"], 3)
+        self.assertEqual(estimate.deleted["authentication.State_member_characters"], 3)
+        self.assertEqual(estimate.set_null["authentication.UserProfile"], 3)
+        self.assertEqual(estimate.total, 9)
+        self.assertTrue(estimate.explain)
+        self.assertEqual(EveCharacter.objects.count(), 4)
+        self.assertEqual(OwnershipRecord.objects.count(), 3)
+
+    def test_loads_no_rows(self):
+        """
+        Test that the estimate only issues counts, one per plan step, and the EXPLAIN.
+
+        :return:
+        :rtype:
+        """
+
+        with CaptureQueriesContext(connection) as context:
+            estimate = estimate_rule(rule=CORPORATION_CLEANUP)
+
+        statements = [query["sql"] for query in context.captured_queries]
+
+        self.assertEqual(estimate.candidates, 1)
+        self.assertEqual(
+            estimate.deleted["authentication.State_member_corporations"], 1
+        )
+        self.assertTrue(
+            all("COUNT(*)" in sql for sql in statements[:-1]), msg=statements
+        )
+        self.assertIn("EXPLAIN", statements[-1])
+        self.assertEqual(
+            set(estimate.as_dict()),
+            {
+                "rule",
+                "candidates",
+                "total",
+                "deleted",
+                "set_null",
+                "blockers",
+                "explain",
+            },
+        )
+
+
+class TestCheckImpactAction(BaseTestCase):
+    """
+    Unit tests for the check_impact_action system check in tnnt_housekeeping.checks.
+    """
+
+    def test_reports_unknown_impact_action(self):
+        """
+        Test that the system check reports an impact action that doesn't exist.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(check_impact_action(), [])
+
+        with patch("tnnt_housekeeping.checks.TNNT_HOUSEKEEPING_IMPACT_ACTION", "split"):
+            (error,) = check_impact_action()
+
+        self.assertEqual(error.id, "tnnt_housekeeping.E002")
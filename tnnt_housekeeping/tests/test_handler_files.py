@@ -0,0 +1,63 @@
+"""
+Unit tests for the file handler in tnnt_housekeeping.handler.files.
+"""
+
+# Standard Library
+import os
+import tempfile
+from unittest.mock import patch
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.files import write_atomically
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+class TestWriteAtomically(BaseTestCase):
+    """
+    Unit tests for the write_atomically function.
+    """
+
+    def test_replaces_the_file(self):
+        """
+        Test that write_atomically replaces the file and leaves no temporary files behind.
+
+        :return:
+        :rtype:
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+
+            write_atomically(path=path, content="first")
+            write_atomically(path=path, content="second")
+
+            with open(path, encoding="utf-8") as file:
+                self.assertEqual(file.read(), "second")
+
+            self.assertEqual(os.listdir(directory), ["report.json"])
+
+    def test_removes_the_temporary_file_on_errors(self):
+        """
+        Test that a failing write keeps the previous file and removes the temporary one.
+
+        :return:
+        :rtype:
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            write_atomically(path=path, content="first")
+
+            with (
+                patch(
+                    "tnnt_housekeeping.handler.files.os.replace",
+                    side_effect=OSError("Read-only file system"),
+                ),
+                self.assertRaises(OSError),
+            ):
+                write_atomically(path=path, content="second")
+
+            with open(path, encoding="utf-8") as file:
+                self.assertEqual(file.read(), "first")
+
+            self.assertEqual(os.listdir(directory), ["report.json"])
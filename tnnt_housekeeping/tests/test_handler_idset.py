@@ -0,0 +1,137 @@
+"""
+Unit tests for the compact ID set handler in tnnt_housekeeping.handler.idset.
+"""
+
+# Standard Library
+import json
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.idset import IdSet
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+class TestIdSet(BaseTestCase):
+    """
+    Unit tests for the IdSet class.
+    """
+
+    def test_merges_consecutive_ids_into_runs(self):
+        """
+        Test that IDs are sorted, deduplicated and kept as runs of consecutive IDs.
+
+        :return:
+        :rtype:
+        """
+
+        id_set = IdSet(ids=[9, 3, 1, 2, 3, 7, 8])
+
+        self.assertEqual(list(id_set.ranges()), [(1, 3), (7, 9)])
+        self.assertEqual(list(id_set), [1, 2, 3, 7, 8, 9])
+        self.assertEqual(len(id_set), 6)
+
+    def test_round_trips_through_the_encoding(self):
+        """
+        Test that sparse, consecutive and mixed sets decode to the set they were encoded from.
+
+        :return:
+        :rtype:
+        """
+
+        for ids in (
+            [],
+            [0],
+            [5, 17, 1000000, 2**40],
+            [1, 2, 3, 10, 20, 21],
+            range(100, 5000, 3),
+        ):
+            with self.subTest(ids=ids):
+                id_set = IdSet(ids=ids)
+                encoded = id_set.encode()
+
+                self.assertIsInstance(json.loads(json.dumps(encoded)), str)
+                self.assertEqual(IdSet.decode(encoded=encoded), id_set)
+
+    def test_encoding_is_compact(self):
+        """
+        Test that a contiguous range takes a few bytes, and sparse IDs with small
+        gaps take far less than a JSON list.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertLess(len(IdSet.from_range(start=1, end=200000).encode()), 16)
+
+        ids = list(range(1000000, 1200000, 7))
+
+        self.assertLess(len(IdSet(ids=ids).encode()), len(json.dumps(ids)) / 5)
+
+    def test_splits_into_chunks_of_about_the_same_size(self):
+        """
+        Test that chunks split runs where needed and cover the set exactly once.
+
+        :return:
+        :rtype:
+        """
+
+        id_set = IdSet(ids=[*range(1, 8), 20, 30])
+        chunks = id_set.chunks(count=3)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 3])
+        self.assertEqual([list(chunk) for chunk in chunks][1], [4, 5, 6])
+        self.assertEqual([pk for chunk in chunks for pk in chunk], list(id_set))
+        self.assertEqual(IdSet(ids=[1]).chunks(count=3), [IdSet(ids=[1])])
+        self.assertEqual(IdSet().chunks(count=3), [])
+
+        with self.assertRaises(ValueError):
+            id_set.chunks(count=0)
+
+    def test_filters_a_queryset(self):
+        """
+        Test that q() matches exactly the IDs of the set, and nothing for an empty set.
+
+        :return:
+        :rtype:
+        """
+
+        pks = [
+            EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            ).pk
+            for character_id in range(1, 8)
+        ]
+        wanted = [*pks[0:4], pks[5]]
+
+        self.assertEqual(
+            sorted(
+                EveCharacter.objects.filter(IdSet(ids=wanted).q()).values_list(
+                    "pk", flat=True
+                )
+            ),
+            wanted,
+        )
+        self.assertFalse(EveCharacter.objects.filter(IdSet().q()).exists())
+
+    def test_rejects_invalid_input(self):
+        """
+        Test that negative IDs and malformed or truncated encodings raise ValueError.
+
+        :return:
+        :rtype:
+        """
+
+        truncated = IdSet(ids=[1, 2, 3, 500]).encode()
+
+        for encoded in ("", "0", "truncated", truncated[:-2]):
+            with self.subTest(encoded=encoded), self.assertRaises(ValueError):
+                IdSet.decode(encoded=encoded)
+
+        with self.assertRaises(ValueError):
+            IdSet(ids=[-1])
@@ -0,0 +1,192 @@
+"""
+Unit tests for the supporting index handler in tnnt_housekeeping.handler.indexes.
+"""
+
+# Standard Library
+from unittest.mock import MagicMock, patch
+
+# Django
+from django.apps import apps
+from django.db import connection
+from django.db.migrations.state import ProjectState
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.checks import check_cleanup_indexes
+from tnnt_housekeeping.handler.indexes import (
+    CreateSupportingIndex,
+    index_columns,
+    is_supported,
+)
+from tnnt_housekeeping.tests import BaseTestCase
+
+OPERATION = CreateSupportingIndex(
+    model="eveonline.EveCharacter",
+    fields=["corporation_id"],
+    name="tnnt_hk_char_corp_id_idx",
+)
+
+
+def schema_editor_for(db_connection) -> MagicMock:
+    """
+    Schema editor executing its statements on a connection, without taking over
+    the transaction handling of the test case.
+
+    :param db_connection:
+    :type db_connection:
+    :return:
+    :rtype:
+    """
+
+    schema_editor = MagicMock(
+        connection=db_connection, quote_name=connection.ops.quote_name
+    )
+    schema_editor.execute.side_effect = lambda sql: connection.cursor().execute(sql)
+
+    return schema_editor
+
+
+class TestSupportingIndexes(BaseTestCase):
+    """
+    Unit tests for the supporting index handler in tnnt_housekeeping.handler.indexes.
+    """
+
+    def setUp(self):
+        self.state = ProjectState.from_apps(apps)
+
+    def test_migration_supports_the_builtin_rules(self):
+        """
+        Test that the built-in rules are supported by an index after migrating,
+        and the system check doesn't complain.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertTrue(
+            is_supported(
+                model=EveCharacter, fields=("corporation_id",), using="default"
+            )
+        )
+        self.assertTrue(
+            is_supported(model=EveCorporationInfo, fields=("ceo_id",), using="default")
+        )
+        self.assertIn(
+            "tnnt_hk_char_corp_id_idx",
+            index_columns(model=EveCharacter, using="default"),
+        )
+        self.assertEqual(check_cleanup_indexes(databases=["default"]), [])
+
+    def test_backwards_drops_and_forwards_creates_the_index(self):
+        """
+        Test that migrating backwards drops the index, which the system check reports,
+        and migrating forwards creates it again.
+
+        :return:
+        :rtype:
+        """
+
+        schema_editor = schema_editor_for(db_connection=connection)
+
+        OPERATION.database_backwards(
+            "tnnt_housekeeping", schema_editor, self.state, self.state
+        )
+
+        self.assertNotIn(
+            "tnnt_hk_char_corp_id_idx",
+            index_columns(model=EveCharacter, using="default"),
+        )
+        (warning,) = check_cleanup_indexes(databases=["default"])
+        self.assertEqual(warning.id, "tnnt_housekeeping.W001")
+        self.assertEqual(warning.obj, "character_cleanup")
+
+        OPERATION.database_forwards(
+            "tnnt_housekeeping", schema_editor, self.state, self.state
+        )
+
+        self.assertEqual(
+            index_columns(model=EveCharacter, using="default")[
+                "tnnt_hk_char_corp_id_idx"
+            ],
+            ["corporation_id", "id"],
+        )
+
+        # Nothing left to drop a second time
+        schema_editor.execute.reset_mock()
+        OPERATION.database_backwards(
+            "tnnt_housekeeping", schema_editor, self.state, self.state
+        )
+        OPERATION.database_backwards(
+            "tnnt_housekeeping", schema_editor, self.state, self.state
+        )
+        schema_editor.execute.assert_called_once()
+
+    def test_forwards_skips_supported_predicates(self):
+        """
+        Test that no index is created if an existing one already supports the predicate.
+
+        :return:
+        :rtype:
+        """
+
+        schema_editor = schema_editor_for(db_connection=connection)
+
+        OPERATION.database_forwards(
+            "tnnt_housekeeping", schema_editor, self.state, self.state
+        )
+
+        schema_editor.execute.assert_not_called()
+
+    @patch("tnnt_housekeeping.handler.indexes.is_supported", return_value=False)
+    def test_creates_the_index_online(self, mock_is_supported):
+        """
+        Test that the index is created without blocking writes on PostgreSQL and MySQL.
+
+        :param mock_is_supported:
+        :type mock_is_supported:
+        :return:
+        :rtype:
+        """
+
+        for vendor, expected in (
+            ("postgresql", "CREATE INDEX CONCURRENTLY"),
+            ("mysql", "ALGORITHM=INPLACE LOCK=NONE"),
+        ):
+            with self.subTest(vendor=vendor):
+                schema_editor = schema_editor_for(
+                    db_connection=MagicMock(vendor=vendor, alias="default")
+                )
+                schema_editor.execute.side_effect = None
+
+                OPERATION.database_forwards(
+                    "tnnt_housekeeping", schema_editor, self.state, self.state
+                )
+
+                self.assertIn(expected, schema_editor.execute.call_args.args[0])
+
+    def test_mysql_implies_the_primary_key(self):
+        """
+        Test that a single-column index is enough on MySQL, where InnoDB appends the primary key.
+
+        :return:
+        :rtype:
+        """
+
+        with patch(
+            "tnnt_housekeeping.handler.indexes.index_columns",
+            return_value={"upstream_idx": ["ceo_id"]},
+        ):
+            self.assertFalse(
+                is_supported(
+                    model=EveCorporationInfo, fields=("ceo_id",), using="default"
+                )
+            )
+
+            with patch.object(connection, "vendor", "mysql"):
+                self.assertTrue(
+                    is_supported(
+                        model=EveCorporationInfo, fields=("ceo_id",), using="default"
+                    )
+                )
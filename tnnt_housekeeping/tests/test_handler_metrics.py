@@ -0,0 +1,253 @@
+"""
+Unit tests for the metrics handler in tnnt_housekeeping.handler.metrics.
+"""
+
+# Standard Library
+import os
+import tempfile
+from collections import Counter
+from unittest.mock import patch
+
+# Django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.deletion import DeletionResult
+from tnnt_housekeeping.handler.metrics import (
+    RuleMetrics,
+    collect_metrics,
+    load_metrics,
+    render_prometheus,
+    store_metrics,
+    write_textfile,
+)
+from tnnt_housekeeping.rules import CHARACTER_CLEANUP
+from tnnt_housekeeping.tasks import run_rule
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestMetrics(BaseTestCase):
+    """
+    Unit tests for the metrics handler in tnnt_housekeeping.handler.metrics.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_collects_queries_and_db_time(self):
+        """
+        Test that collect_metrics counts and times the statements issued inside it.
+
+        :return:
+        :rtype:
+        """
+
+        with collect_metrics(rule="test_rule") as metrics:
+            User.objects.count()
+            User.objects.exists()
+
+        self.assertEqual(metrics.queries, 2)
+        self.assertGreater(metrics.db_time, 0)
+        self.assertGreaterEqual(metrics.wall_time, metrics.db_time)
+
+        # Statements after the block are not counted
+        User.objects.count()
+
+        self.assertEqual(metrics.queries, 2)
+
+    def test_derives_throughput_from_the_result(self):
+        """
+        Test that rows per second and batch latency are derived from the deletion result.
+
+        :return:
+        :rtype:
+        """
+
+        metrics = RuleMetrics(rule="test_rule", wall_time=2.0)
+        metrics.add_result(
+            result=DeletionResult(
+                batches=4,
+                per_model=Counter({"eveonline.EveCharacter": 6, "other.Model": 2}),
+                finished=False,
+            )
+        )
+
+        self.assertEqual(metrics.total, 8)
+        self.assertEqual(metrics.rows_per_second, 4.0)
+        self.assertEqual(metrics.batch_latency, 0.5)
+        self.assertFalse(metrics.as_dict()["finished"])
+        self.assertEqual(RuleMetrics(rule="empty").rows_per_second, 0.0)
+
+    def test_merges_the_metrics_of_parallel_shards(self):
+        """
+        Test that merged shard metrics sum up the counts, and span from the first start
+        to the last end, and survive the round trip through their dictionary.
+
+        :return:
+        :rtype:
+        """
+
+        first = RuleMetrics(
+            rule="test_rule",
+            timestamp=100.0,
+            wall_time=2.0,
+            queries=5,
+            batches=1,
+            per_model={"eveonline.EveCharacter": 3},
+            pk_range=(1, 10),
+            breakdown={"info": 3},
+        )
+        second = RuleMetrics(
+            rule="test_rule",
+            timestamp=101.0,
+            wall_time=3.0,
+            queries=7,
+            batches=2,
+            per_model={"eveonline.EveCharacter": 4, "other.Model": 1},
+            finished=False,
+            pk_range=(11, 20),
+            breakdown={"info": 1, "danger": 4},
+        )
+
+        first.merge(RuleMetrics.from_dict(data=second.as_dict()))
+
+        self.assertEqual(first.timestamp, 100.0)
+        self.assertEqual(first.wall_time, 4.0)
+        self.assertEqual(first.queries, 12)
+        self.assertEqual(first.batches, 3)
+        self.assertEqual(
+            first.per_model, {"eveonline.EveCharacter": 7, "other.Model": 1}
+        )
+        self.assertEqual(first.breakdown, {"info": 4, "danger": 4})
+        self.assertFalse(first.finished)
+        self.assertIsNone(first.pk_range)
+
+    def test_stores_and_loads_metrics_per_rule(self):
+        """
+        Test that the metrics of each rule are stored in the cache and loaded together.
+
+        :return:
+        :rtype:
+        """
+
+        store_metrics(metrics=RuleMetrics(rule="first", queries=3))
+
+        metrics = load_metrics(rules=["first", "second"])
+
+        self.assertEqual(list(metrics), ["first"])
+        self.assertEqual(metrics["first"]["queries"], 3)
+
+    def test_renders_prometheus_text_format(self):
+        """
+        Test that the metrics are rendered as Prometheus gauges with rule and model labels.
+
+        :return:
+        :rtype:
+        """
+
+        metrics = RuleMetrics(rule="character_cleanup", wall_time=2.0, queries=7)
+        metrics.add_result(
+            result=DeletionResult(
+                batches=1,
+                per_model=Counter({"eveonline.EveCharacter": 10}),
+                breakdown=Counter({"1000001": 10}),
+            )
+        )
+
+        content = render_prometheus(metrics={"character_cleanup": metrics.as_dict()})
+
+        self.assertIn("# TYPE tnnt_housekeeping_rule_wall_seconds gauge", content)
+        self.assertIn(
+            'tnnt_housekeeping_rule_queries{rule="character_cleanup"} 7.0', content
+        )
+        self.assertIn(
+            'tnnt_housekeeping_rule_rows_per_second{rule="character_cleanup"} 5.0',
+            content,
+        )
+        self.assertIn(
+            'tnnt_housekeeping_rule_rows_deleted{rule="character_cleanup",'
+            'model="eveonline.EveCharacter"} 10',
+            content,
+        )
+        self.assertIn(
+            'tnnt_housekeeping_rule_rows_deleted_breakdown{rule="character_cleanup",'
+            'value="1000001"} 10',
+            content,
+        )
+        self.assertTrue(content.endswith("\n"))
+
+    def test_writes_textfile_atomically(self):
+        """
+        Test that write_textfile replaces the file and leaves no temporary files behind.
+
+        :return:
+        :rtype:
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "housekeeping.prom")
+
+            write_textfile(path=path, content="first\n")
+            write_textfile(path=path, content="second\n")
+
+            with open(path, encoding="utf-8") as textfile:
+                self.assertEqual(textfile.read(), "second\n")
+
+            self.assertEqual(os.listdir(directory), ["housekeeping.prom"])
+
+    def test_run_rule_publishes_its_metrics(self):
+        """
+        Test that run_rule stores its metrics and writes the configured textfile.
+
+        :return:
+        :rtype:
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "housekeeping.prom")
+
+            with patch(
+                "tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_METRICS_TEXTFILE", path
+            ):
+                run_rule(rule=CHARACTER_CLEANUP)
+
+            with open(path, encoding="utf-8") as textfile:
+                content = textfile.read()
+
+        metrics = load_metrics(rules=[CHARACTER_CLEANUP.name])
+
+        # Cursor-less run without candidates: a single page query
+        self.assertEqual(metrics["character_cleanup"]["queries"], 1)
+        self.assertEqual(metrics["character_cleanup"]["batches"], 0)
+        self.assertIn(
+            'tnnt_housekeeping_rule_finished{rule="character_cleanup"} 1.0', content
+        )
+
+    @patch("tnnt_housekeeping.tasks.write_textfile")
+    def test_publishing_errors_do_not_fail_the_cleanup(self, mock_write_textfile):
+        """
+        Test that an error writing the textfile is logged, not raised.
+
+        :param mock_write_textfile:
+        :type mock_write_textfile:
+        :return:
+        :rtype:
+        """
+
+        mock_write_textfile.side_effect = OSError("Read-only file system")
+
+        with (
+            patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_METRICS_TEXTFILE", "x"),
+            patch("tnnt_housekeeping.tasks.logger") as mock_logger,
+        ):
+            result = run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertTrue(result.finished)
+        mock_logger.warning.assert_called_once_with(
+            "Error publishing metrics of character_cleanup: Read-only file system"
+        )
@@ -0,0 +1,454 @@
+"""
+Unit tests for the orphan handler in tnnt_housekeeping.handler.orphans,
+and the orphaned corporation and alliance cleanups.
+"""
+
+# Standard Library
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+# Django
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+
+# Alliance Auth
+from allianceauth.authentication.models import State
+from allianceauth.eveonline.models import (
+    EveAllianceInfo,
+    EveCharacter,
+    EveCorporationInfo,
+)
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.orphans import (
+    ORPHANED_SINCE_TIMEOUT,
+    IdReference,
+    OrphanedSince,
+    references,
+    unreferenced,
+)
+from tnnt_housekeeping.rules import (
+    ORPHANED_ALLIANCE_CLEANUP,
+    ORPHANED_CORPORATION_CLEANUP,
+    CleanupRule,
+)
+from tnnt_housekeeping.tasks import run_rule
+from tnnt_housekeeping.tests import BaseTestCase, create_corporation
+
+
+def create_alliance(alliance_id: int) -> EveAllianceInfo:
+    """
+    Create an alliance.
+
+    :param alliance_id:
+    :type alliance_id:
+    :return:
+    :rtype:
+    """
+
+    return EveAllianceInfo.objects.create(
+        alliance_id=alliance_id,
+        alliance_name=f"Alliance {alliance_id}",
+        alliance_ticker="ALLY",
+        executor_corp_id=98000001,
+    )
+
+
+def record_orphans(rule: CleanupRule, days_ago: int) -> None:
+    """
+    Record the rows a rule finds unreferenced now as orphaned since a number of days.
+
+    :param rule:
+    :type rule:
+    :param days_ago:
+    :type days_ago:
+    :return:
+    :rtype:
+    """
+
+    with patch(
+        "django.utils.timezone.now",
+        return_value=timezone.now() - timedelta(days=days_ago),
+    ):
+        OrphanedSince(name=rule.name).expired(
+            pks=list(rule.candidates().values_list("pk", flat=True)), grace_period=0
+        )
+
+
+class TestUnreferenced(BaseTestCase):
+    """
+    Unit tests for finding the rows nothing refers to.
+    """
+
+    def test_finds_foreign_keys_and_many_to_many_relations(self):
+        """
+        Test that foreign keys and the through tables of many-to-many relations
+        pointing at a model are references, as well as the given ID references.
+
+        :return:
+        :rtype:
+        """
+
+        found = references(
+            model=EveAllianceInfo,
+            id_references=[
+                IdReference(
+                    model=EveCharacter, field="alliance_id", target_field="alliance_id"
+                )
+            ],
+        )
+
+        self.assertIn((EveCorporationInfo, "alliance_id", "id"), found)
+        self.assertIn(
+            (State.member_alliances.through, "eveallianceinfo_id", "id"), found
+        )
+        self.assertIn((EveCharacter, "alliance_id", "alliance_id"), found)
+
+    def test_many_to_many_relations_of_the_model_are_no_references(self):
+        """
+        Test that the many-to-many relations a model declares itself, which refer
+        to other rows, don't count as references to the model's rows.
+
+        :return:
+        :rtype:
+        """
+
+        found = references(model=State)
+
+        self.assertNotIn(State.member_alliances.through, [model for model, *_ in found])
+
+    def test_selects_rows_with_a_single_anti_join_query(self):
+        """
+        Test that the unreferenced rows are found with one query.
+
+        :return:
+        :rtype:
+        """
+
+        alliance = create_alliance(alliance_id=99000001)
+        create_corporation(corporation_id=98000001, alliance=alliance)
+        orphan = create_alliance(alliance_id=99000002)
+
+        with self.assertNumQueries(1):
+            found = list(
+                EveAllianceInfo.objects.filter(unreferenced(model=EveAllianceInfo))
+            )
+
+        self.assertEqual(found, [orphan])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestOrphanedSince(BaseTestCase):
+    """
+    Unit tests for the OrphanedSince class.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_keeps_the_time_a_row_was_first_found(self):
+        """
+        Test that rows are expired a grace period after they were first found,
+        however often they are found again.
+
+        :return:
+        :rtype:
+        """
+
+        orphaned_since = OrphanedSince(name="test")
+        now = timezone.now()
+
+        with patch("django.utils.timezone.now", return_value=now):
+            self.assertEqual(orphaned_since.expired(pks=[1], grace_period=60), [])
+
+        with patch(
+            "django.utils.timezone.now", return_value=now + timedelta(seconds=30)
+        ):
+            self.assertEqual(orphaned_since.expired(pks=[1, 2], grace_period=60), [])
+
+        with patch(
+            "django.utils.timezone.now", return_value=now + timedelta(seconds=60)
+        ):
+            self.assertEqual(orphaned_since.expired(pks=[1, 2], grace_period=60), [1])
+
+    def test_only_records_the_given_rows(self):
+        """
+        Test that a page of rows is looked up and recorded with one cache access each,
+        with a timeout.
+
+        :return:
+        :rtype:
+        """
+
+        with patch("tnnt_housekeeping.handler.orphans.Cache") as mock_cache:
+            mock_cache.get_many.return_value = {
+                "orphaned-since:test:1": False,
+                "orphaned-since:test:2": False,
+            }
+
+            OrphanedSince(name="test").expired(pks=[1, 2], grace_period=0)
+
+        mock_cache.get_many.assert_called_once_with(
+            subkeys=["orphaned-since:test:1", "orphaned-since:test:2"]
+        )
+        mock_cache.set_many.assert_called_once()
+        self.assertEqual(
+            set(mock_cache.set_many.call_args.kwargs["values"]),
+            {"orphaned-since:test:1", "orphaned-since:test:2"},
+        )
+        self.assertEqual(
+            mock_cache.set_many.call_args.kwargs["timeout"], ORPHANED_SINCE_TIMEOUT
+        )
+
+    def test_forgets_rows_not_found_again(self):
+        """
+        Test that a row not found unreferenced for ORPHANED_SINCE_TIMEOUT, e.g. because
+        it was referenced in between, starts over.
+
+        :return:
+        :rtype:
+        """
+
+        orphaned_since = OrphanedSince(name="test")
+        now = timezone.now()
+
+        orphaned_since.expired(pks=[1], grace_period=0)
+
+        with patch(
+            "django.utils.timezone.now",
+            return_value=now + timedelta(seconds=ORPHANED_SINCE_TIMEOUT + 1),
+        ):
+            self.assertEqual(orphaned_since.expired(pks=[1], grace_period=60), [])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+# Rows recorded weeks ago are kept, as if they had been found by the runs in between
+@patch("tnnt_housekeeping.handler.orphans.ORPHANED_SINCE_TIMEOUT", 90 * 24 * 60 * 60)
+class TestOrphanedCleanups(BaseTestCase):
+    """
+    Test cases for the orphaned corporation and alliance cleanups.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def later(self, days: int):
+        """
+        Pretend a number of days have passed.
+
+        :param days:
+        :type days:
+        :return:
+        :rtype:
+        """
+
+        return patch(
+            "django.utils.timezone.now",
+            return_value=timezone.now() + timedelta(days=days),
+        )
+
+    def test_deletes_corporations_nothing_refers_to(self):
+        """
+        Test that only corporations without characters, states or other references,
+        and orphaned for longer than the grace period, are deleted.
+
+        :return:
+        :rtype:
+        """
+
+        orphan = create_corporation(corporation_id=98000001)
+        with_character = create_corporation(corporation_id=98000002)
+        with_state = create_corporation(corporation_id=98000003)
+        EveCharacter.objects.create(
+            character_id=90000001,
+            character_name="Character",
+            corporation_id=with_character.corporation_id,
+            corporation_name=with_character.corporation_name,
+            corporation_ticker=with_character.corporation_ticker,
+        )
+        State.objects.create(
+            name="Corporation State", priority=75
+        ).member_corporations.add(with_state)
+        record_orphans(rule=ORPHANED_CORPORATION_CLEANUP, days_ago=60)
+        recent = create_corporation(corporation_id=98000004)
+
+        result = run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCorporationInfo"), 1)
+        self.assertFalse(EveCorporationInfo.objects.filter(pk=orphan.pk).exists())
+        self.assertEqual(
+            set(EveCorporationInfo.objects.values_list("pk", flat=True)),
+            {with_character.pk, with_state.pk, recent.pk},
+        )
+
+    def test_grace_period_starts_when_orphaned_not_when_updated(self):
+        """
+        Test that updating an orphaned corporation from ESI, as Alliance Auth does
+        hourly, doesn't restart its grace period.
+
+        :return:
+        :rtype:
+        """
+
+        corporation = create_corporation(corporation_id=98000001)
+
+        result = run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+
+        self.assertEqual(result.total, 0)
+
+        with (
+            self.later(days=20),
+            patch.object(EveCorporationInfo, "provider") as mock_provider,
+        ):
+            mock_provider.get_corporation.return_value = Mock(
+                members=1, ceo_id=90000001, alliance_id=None
+            )
+
+            EveCorporationInfo.objects.update_corporation(
+                corp_id=corporation.corporation_id
+            )
+
+            result = run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+
+        self.assertEqual(result.total, 0)
+
+        with self.later(days=31):
+            result = run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCorporationInfo"), 1)
+        self.assertFalse(EveCorporationInfo.objects.exists())
+
+    def test_referenced_rows_are_forgotten(self):
+        """
+        Test that a row referenced again is forgotten, and its grace period starts
+        over once it is orphaned again.
+
+        :return:
+        :rtype:
+        """
+
+        corporation = create_corporation(corporation_id=98000001)
+        record_orphans(rule=ORPHANED_CORPORATION_CLEANUP, days_ago=60)
+        character = EveCharacter.objects.create(
+            character_id=90000001,
+            character_name="Character",
+            corporation_id=corporation.corporation_id,
+            corporation_name=corporation.corporation_name,
+            corporation_ticker=corporation.corporation_ticker,
+        )
+
+        result = run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+
+        self.assertEqual(result.total, 0)
+
+        character.delete()
+
+        # Not found unreferenced for longer than ORPHANED_SINCE_TIMEOUT
+        with self.later(days=31):
+            result = run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+
+        self.assertEqual(result.total, 0)
+        self.assertTrue(EveCorporationInfo.objects.filter(pk=corporation.pk).exists())
+
+    def test_members_of_a_kept_alliance_are_kept(self):
+        """
+        Test that the member corporations of an alliance something else refers to,
+        or with a member corporation something refers to, are kept, and the members
+        of an alliance only they refer to are not.
+
+        :return:
+        :rtype:
+        """
+
+        with_character = create_alliance(alliance_id=99000001)
+        EveCharacter.objects.create(
+            character_id=90000001,
+            character_name="Character",
+            corporation_id=98000009,
+            corporation_name="Corporation",
+            corporation_ticker="CORP",
+            alliance_id=with_character.alliance_id,
+        )
+        kept_by_alliance = create_corporation(
+            corporation_id=98000001, alliance=with_character
+        )
+        with_state_member = create_alliance(alliance_id=99000002)
+        State.objects.create(
+            name="Corporation State", priority=75
+        ).member_corporations.add(
+            create_corporation(corporation_id=98000002, alliance=with_state_member)
+        )
+        kept_by_member = create_corporation(
+            corporation_id=98000003, alliance=with_state_member
+        )
+        orphaned_alliance = create_alliance(alliance_id=99000003)
+        create_corporation(corporation_id=98000004, alliance=orphaned_alliance)
+        create_corporation(corporation_id=98000005, alliance=orphaned_alliance)
+        record_orphans(rule=ORPHANED_CORPORATION_CLEANUP, days_ago=60)
+
+        result = run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCorporationInfo"), 2)
+        self.assertTrue(
+            EveCorporationInfo.objects.filter(pk=kept_by_alliance.pk).exists()
+        )
+        self.assertTrue(
+            EveCorporationInfo.objects.filter(pk=kept_by_member.pk).exists()
+        )
+        self.assertFalse(
+            EveCorporationInfo.objects.filter(alliance=orphaned_alliance).exists()
+        )
+
+    def test_alliances_are_orphaned_by_their_last_corporation(self):
+        """
+        Test that an alliance whose last corporation is deleted as orphan is
+        recorded as orphan in the same run, and deleted after the grace period,
+        and an alliance of a main character is kept.
+
+        :return:
+        :rtype:
+        """
+
+        alliance = create_alliance(alliance_id=99000001)
+        create_corporation(corporation_id=98000001, alliance=alliance)
+        with_character = create_alliance(alliance_id=99000002)
+        EveCharacter.objects.create(
+            character_id=90000001,
+            character_name="Character",
+            corporation_id=98000002,
+            corporation_name="Corporation",
+            corporation_ticker="CORP",
+            alliance_id=with_character.alliance_id,
+        )
+        record_orphans(rule=ORPHANED_CORPORATION_CLEANUP, days_ago=60)
+
+        run_rule(rule=ORPHANED_CORPORATION_CLEANUP)
+        result = run_rule(rule=ORPHANED_ALLIANCE_CLEANUP)
+
+        self.assertEqual(result.total, 0)
+
+        with self.later(days=31):
+            result = run_rule(rule=ORPHANED_ALLIANCE_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveAllianceInfo"), 1)
+        self.assertEqual(list(EveAllianceInfo.objects.all()), [with_character])
+
+    @patch("tnnt_housekeeping.rules.TNNT_HOUSEKEEPING_ORPHAN_GRACE_PERIOD", 0)
+    def test_grace_period_can_be_disabled(self):
+        """
+        Test that without a grace period, orphans found just now are deleted as well.
+
+        :return:
+        :rtype:
+        """
+
+        create_alliance(alliance_id=99000001)
+
+        result = run_rule(rule=ORPHANED_ALLIANCE_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveAllianceInfo"), 1)
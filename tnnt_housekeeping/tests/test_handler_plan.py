@@ -0,0 +1,150 @@
+"""
+Unit tests for the deletion plan handler in tnnt_housekeeping.handler.plan.
+"""
+
+# Django
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_delete
+
+# Alliance Auth
+from allianceauth.authentication.models import (
+    CharacterOwnership,
+    OwnershipRecord,
+    State,
+    UserProfile,
+)
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.deletion import BatchedDeletion
+from tnnt_housekeeping.handler.plan import (
+    ACTION_DELETE,
+    ACTION_SET_NULL,
+    DeletionPlan,
+)
+from tnnt_housekeeping.tests import BaseTestCase, create_corporation
+
+
+class TestDeletionPlan(BaseTestCase):
+    """
+    Unit tests for the DeletionPlan class in tnnt_housekeeping.handler.plan.
+    """
+
+    def test_plans_are_registered_when_the_app_is_ready(self):
+        """
+        Test that the plans for the cleanup models are built in the app's ready().
+
+        :return:
+        :rtype:
+        """
+
+        self.assertIsNotNone(DeletionPlan.for_model(model=EveCharacter))
+        self.assertIsNotNone(DeletionPlan.for_model(model=EveCorporationInfo))
+        self.assertIsNone(DeletionPlan.for_model(model=User))
+
+    def test_lists_cascaded_and_nulled_relations_of_eve_character(self):
+        """
+        Test that the plan for EveCharacter contains every relation with its on_delete behaviour.
+
+        :return:
+        :rtype:
+        """
+
+        plan = DeletionPlan(model=EveCharacter)
+        steps = {(step.model, step.action): step for step in plan.steps}
+
+        self.assertEqual(
+            steps[(CharacterOwnership, ACTION_DELETE)].lookup, "character__pk"
+        )
+        self.assertEqual(
+            steps[(OwnershipRecord, ACTION_DELETE)].lookup, "character__pk"
+        )
+        self.assertEqual(
+            steps[(UserProfile, ACTION_SET_NULL)].field_name, "main_character"
+        )
+        self.assertIn(State.member_characters.through, plan.models)
+        self.assertEqual(plan.steps[-1].model, EveCharacter)
+        self.assertEqual(plan.blockers, [])
+
+    def test_is_not_safe_when_delete_receivers_are_connected(self):
+        """
+        Test that the plan for EveCharacter is not safe, because Alliance Auth has a pre_delete receiver for CharacterOwnership.
+
+        :return:
+        :rtype:
+        """
+
+        plan = DeletionPlan(model=EveCharacter)
+
+        self.assertEqual(plan.receivers(), ["authentication.CharacterOwnership"])
+        self.assertFalse(plan.is_safe())
+
+    def test_checks_receivers_connected_after_the_plan_was_built(self):
+        """
+        Test that is_safe notices receivers that have been connected after the plan was built.
+
+        :return:
+        :rtype:
+        """
+
+        plan = DeletionPlan(model=EveCorporationInfo)
+
+        self.assertTrue(plan.is_safe())
+
+        def receiver(sender, **kwargs):
+            pass
+
+        pre_delete.connect(receiver, sender=EveCorporationInfo)
+
+        try:
+            self.assertFalse(plan.is_safe())
+        finally:
+            pre_delete.disconnect(receiver, sender=EveCorporationInfo)
+
+    def test_executes_set_based_statements(self):
+        """
+        Test that execute deletes the root rows and their cascaded rows without the collector.
+
+        :return:
+        :rtype:
+        """
+
+        closed_corp = create_corporation(corporation_id=2001, ceo_id=1)
+        other_corp = create_corporation(corporation_id=2002, ceo_id=90000001)
+        state = State.objects.create(name="Test State", priority=75)
+        state.member_corporations.add(closed_corp, other_corp)
+        queryset = EveCorporationInfo.objects.filter(ceo_id=1)
+        plan = DeletionPlan(model=EveCorporationInfo)
+
+        # Lock + one DELETE per plan step, no per-row selects
+        with self.assertNumQueries(1 + len(plan.steps)):
+            deleted = plan.execute(queryset=queryset)
+
+        self.assertEqual(
+            deleted,
+            {
+                "authentication.State_member_corporations": 1,
+                "eveonline.EveCorporationInfo": 1,
+            },
+        )
+        self.assertFalse(queryset.exists())
+        self.assertEqual(list(state.member_corporations.all()), [other_corp])
+
+    def test_batched_deletion_uses_the_safe_plan(self):
+        """
+        Test that BatchedDeletion uses the registered plan when it is safe.
+
+        :return:
+        :rtype:
+        """
+
+        for corporation_id in range(3001, 3006):
+            create_corporation(corporation_id=corporation_id, ceo_id=1)
+
+        queryset = EveCorporationInfo.objects.filter(ceo_id=1)
+
+        result = BatchedDeletion(queryset=queryset, batch_size=2).run()
+
+        self.assertEqual(result.batches, 3)
+        self.assertEqual(result.deleted("eveonline.EveCorporationInfo"), 5)
+        self.assertFalse(queryset.exists())
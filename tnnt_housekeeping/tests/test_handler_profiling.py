@@ -0,0 +1,133 @@
+"""
+Unit tests for the query profiling handler in tnnt_housekeeping.handler.profiling.
+"""
+
+# Standard Library
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+# Django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.profiling import (
+    REPEATED_THRESHOLD,
+    QueryProfiler,
+    profile_queries,
+    statement_shape,
+)
+from tnnt_housekeeping.rules import get_rules
+from tnnt_housekeeping.tasks import daily_housekeeping
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+class TestQueryProfiler(BaseTestCase):
+    """
+    Unit tests for the query profiling handler in tnnt_housekeeping.handler.profiling.
+    """
+
+    def test_statement_shape_drops_literals_and_collapses_in_lists(self):
+        """
+        Test that statements only differing in parameters or IN list length have the same shape.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(
+            statement_shape(
+                sql='SELECT "id" FROM "t"  WHERE "id" IN (%s, %s, %s) AND "name" = \'x\''
+            ),
+            'SELECT "id" FROM "t" WHERE "id" IN (...) AND "name" = ?',
+        )
+        self.assertEqual(
+            statement_shape(sql='DELETE FROM "t" WHERE "id" IN (1, 2)'),
+            statement_shape(sql='DELETE FROM "t" WHERE "id" IN (%s)'),
+        )
+
+    def test_reports_repeated_shapes_and_origin(self):
+        """
+        Test that the report groups statements by shape, flags repeated ones and names their origin.
+
+        :return:
+        :rtype:
+        """
+
+        with profile_queries(top=3) as profiler:
+            for user_id in range(REPEATED_THRESHOLD):
+                User.objects.filter(pk=user_id).exists()
+
+            User.objects.count()
+
+        report = profiler.report()
+
+        self.assertEqual(report["queries"], REPEATED_THRESHOLD + 1)
+        self.assertEqual(report["distinct_shapes"], 2)
+        self.assertEqual(len(report["slowest"]), 3)
+        self.assertEqual(len(report["repeated"]), 1)
+        self.assertEqual(report["repeated"][0]["count"], REPEATED_THRESHOLD)
+        self.assertIn(__file__, report["repeated"][0]["origin"])
+        self.assertAlmostEqual(
+            report["python_time"] + report["db_time"], report["wall_time"]
+        )
+
+    def test_keeps_only_the_slowest_statements(self):
+        """
+        Test that only the top-N slowest statements are kept, slowest first.
+
+        :return:
+        :rtype:
+        """
+
+        profiler = QueryProfiler(top=2)
+
+        for duration in (0.3, 0.1, 0.5, 0.2):
+            profiler.record(sql=f"SELECT {duration}", duration=duration)
+
+        self.assertEqual(
+            [entry["sql"] for entry in profiler.report()["slowest"]],
+            ["SELECT 0.5", "SELECT 0.3"],
+        )
+        self.assertEqual(profiler.report()["shapes"][0]["count"], 4)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestProfiledHousekeeping(BaseTestCase):
+    """
+    Test cases for profiled housekeeping runs.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_profiled_run_returns_and_writes_the_report(self):
+        """
+        Test that a profiled daily run returns the report with the results and writes it to the profile directory.
+
+        :return:
+        :rtype:
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            with patch(
+                "tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_PROFILE_DIR", directory
+            ):
+                result = daily_housekeeping(profile=True)
+
+            (filename,) = os.listdir(directory)
+
+            with open(os.path.join(directory, filename), encoding="utf-8") as report:
+                self.assertEqual(json.load(report), result["profile"])
+
+        self.assertTrue(filename.startswith("daily-housekeeping-"))
+        self.assertEqual(
+            set(result["results"]),
+            {rule.name for rule in get_rules(tier="daily")},
+        )
+        self.assertGreater(result["profile"]["queries"], 0)
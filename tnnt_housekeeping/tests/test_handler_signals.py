@@ -0,0 +1,211 @@
+"""
+Unit tests for the deferred signal receiver handler in tnnt_housekeeping.handler.signals.
+"""
+
+# Standard Library
+from unittest.mock import patch
+
+# Django
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete
+
+# Alliance Auth
+from allianceauth.authentication.models import (
+    CharacterOwnership,
+    State,
+    UserProfile,
+    get_guest_state,
+)
+from allianceauth.eveonline.models import EveCharacter
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.deletion import BatchedDeletion
+from tnnt_housekeeping.handler.plan import DeletionPlan
+from tnnt_housekeeping.handler.signals import (
+    is_deferrable,
+    reconcile_users,
+)
+from tnnt_housekeeping.tests import BaseTestCase, create_character
+
+
+def create_user(username: str, characters: list) -> User:
+    """
+    Create a user owning the characters, the first one being the main character.
+
+    :param username:
+    :type username:
+    :param characters:
+    :type characters:
+    :return:
+    :rtype:
+    """
+
+    user = User.objects.create(username=username)
+
+    for character in characters:
+        CharacterOwnership.objects.create(
+            character=character, user=user, owner_hash=f"{character.character_id}"
+        )
+
+    user.profile.main_character = characters[0]
+    user.profile.save()
+
+    return user
+
+
+class TestDeferredReceivers(BaseTestCase):
+    """
+    Unit tests for the deferrable delete signal receivers.
+    """
+
+    def test_alliance_auth_receiver_is_registered_when_the_app_is_ready(self):
+        """
+        Test that Alliance Auth's main character check on CharacterOwnership is deferrable.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertTrue(is_deferrable(model=CharacterOwnership))
+
+    def test_other_receivers_are_not_deferrable(self):
+        """
+        Test that a model with an unknown delete receiver is not deferrable,
+        so the deletion plan is not used for it.
+
+        :return:
+        :rtype:
+        """
+
+        plan = DeletionPlan(model=EveCharacter)
+
+        self.assertEqual(plan.receivers(deferred=True), [])
+        self.assertTrue(plan.is_safe(deferred=True))
+
+        def receiver(sender, **kwargs):
+            pass
+
+        post_delete.connect(receiver, sender=CharacterOwnership)
+
+        try:
+            self.assertFalse(is_deferrable(model=CharacterOwnership))
+            self.assertFalse(plan.is_safe(deferred=True))
+        finally:
+            post_delete.disconnect(receiver, sender=CharacterOwnership)
+
+
+class TestBulkMode(BaseTestCase):
+    """
+    Unit tests for deleting in bulk mode with BatchedDeletion.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = create_character(character_id=1001, corporation_id=98000001)
+        cls.state = State.objects.create(name="Member State", priority=75)
+        cls.state.member_characters.add(cls.main)
+        cls.user = create_user(
+            username="owner",
+            characters=[cls.main, create_character(character_id=1002)],
+        )
+        cls.main.corporation_id = 1000001
+        cls.main.save()
+
+    def delete_doomheim(self, defer_signals: bool) -> dict:
+        """
+        Delete the characters in Doomheim, running the on commit callbacks.
+
+        :param defer_signals:
+        :type defer_signals:
+        :return:
+        :rtype:
+        """
+
+        execute = DeletionPlan.execute
+
+        with (
+            patch.object(
+                DeletionPlan, "execute", autospec=True, side_effect=execute
+            ) as mock_execute,
+            patch(
+                "tnnt_housekeeping.handler.deletion.reconcile_users",
+                wraps=reconcile_users,
+            ) as mock_reconcile,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            result = BatchedDeletion(
+                queryset=EveCharacter.objects.filter(corporation_id=1000001),
+                defer_signals=defer_signals,
+            ).run()
+
+        return {
+            "result": result,
+            "execute": mock_execute,
+            "reconcile": mock_reconcile,
+        }
+
+    def test_reconciles_every_user_once_after_the_batch(self):
+        """
+        Test that the characters are deleted with the deletion plan, and their
+        owner is reconciled once, losing the main character and the state.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(self.user.profile.state, self.state)
+
+        deletion = self.delete_doomheim(defer_signals=True)
+
+        deletion["execute"].assert_called_once()
+        deletion["reconcile"].assert_called_once_with(user_ids={self.user.pk})
+        self.assertEqual(
+            deletion["result"].deleted("authentication.CharacterOwnership"), 2
+        )
+
+        profile = UserProfile.objects.get(user=self.user)
+
+        self.assertIsNone(profile.main_character)
+        self.assertEqual(profile.state, get_guest_state())
+
+    def test_runs_the_receivers_per_row_without_bulk_mode(self):
+        """
+        Test that without bulk mode, the deletion collector runs the receivers.
+
+        :return:
+        :rtype:
+        """
+
+        deletion = self.delete_doomheim(defer_signals=False)
+
+        deletion["execute"].assert_not_called()
+        deletion["reconcile"].assert_not_called()
+
+        profile = UserProfile.objects.get(user=self.user)
+
+        self.assertIsNone(profile.main_character)
+        self.assertEqual(profile.state, get_guest_state())
+
+    def test_a_failing_user_does_not_stop_the_reconciliation(self):
+        """
+        Test that an error reconciling one user is logged, and the others are reconciled.
+
+        :return:
+        :rtype:
+        """
+
+        other = User.objects.create(username="other")
+
+        with (
+            patch.object(
+                UserProfile,
+                "assign_state",
+                autospec=True,
+                side_effect=[RuntimeError("boom"), None],
+            ) as mock_assign_state,
+            patch("tnnt_housekeeping.handler.signals.logger") as mock_logger,
+        ):
+            reconcile_users(user_ids={self.user.pk, other.pk})
+
+        self.assertEqual(mock_assign_state.call_count, 2)
+        mock_logger.error.assert_called_once()
@@ -0,0 +1,179 @@
+"""
+Unit tests for the adaptive throttle handler in tnnt_housekeeping.handler.throttle.
+"""
+
+# Standard Library
+from unittest.mock import patch
+
+# Django
+from django.core.cache import cache
+from django.test import override_settings
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.cache import Cache
+from tnnt_housekeeping.handler.deletion import BatchedDeletion
+from tnnt_housekeeping.handler.throttle import AdaptiveThrottle
+from tnnt_housekeeping.rules import CHARACTER_CLEANUP
+from tnnt_housekeeping.tasks import CACHE_KEY_TUNED_BATCH_SIZE, run_rule
+from tnnt_housekeeping.tests import BaseTestCase, create_doomheim_characters
+
+
+class TestAdaptiveThrottle(BaseTestCase):
+    """
+    Unit tests for the AdaptiveThrottle class in tnnt_housekeeping.handler.throttle.
+    """
+
+    def test_increases_additively_and_decreases_multiplicatively(self):
+        """
+        Test that fast batches grow the batch size step by step, and a slow one halves it.
+
+        :return:
+        :rtype:
+        """
+
+        throttle = AdaptiveThrottle(batch_size=100, target_latency=1.0)
+
+        throttle.observe(latency=0.5)
+        throttle.observe(latency=0.5)
+
+        self.assertEqual(throttle.batch_size, 120)
+        self.assertEqual(throttle.sleep, 0)
+
+        throttle.observe(latency=2.0)
+
+        self.assertEqual(throttle.batch_size, 60)
+        self.assertEqual(throttle.sleep, 1.0)
+
+        throttle.observe(latency=2.0)
+
+        self.assertEqual(throttle.batch_size, 30)
+        self.assertEqual(throttle.sleep, 2.0)
+
+        throttle.observe(latency=0.5)
+
+        self.assertEqual(throttle.batch_size, 40)
+        self.assertEqual(throttle.sleep, 1.0)
+
+    def test_stays_within_its_limits(self):
+        """
+        Test that the batch size and the pause never leave their configured range.
+
+        :return:
+        :rtype:
+        """
+
+        throttle = AdaptiveThrottle(
+            batch_size=1000,
+            target_latency=1.0,
+            min_batch_size=50,
+            max_batch_size=500,
+            max_sleep=3.0,
+        )
+
+        self.assertEqual(throttle.batch_size, 500)
+
+        for _ in range(10):
+            throttle.observe(latency=5.0)
+
+        self.assertEqual(throttle.batch_size, 50)
+        self.assertEqual(throttle.sleep, 3.0)
+
+        for _ in range(100):
+            throttle.observe(latency=0.1)
+
+        self.assertEqual(throttle.batch_size, 500)
+        self.assertEqual(throttle.sleep, 0)
+
+    def test_rejects_invalid_arguments(self):
+        """
+        Test that a throttle without a positive target or a valid range can't be created.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(ValueError):
+            AdaptiveThrottle(batch_size=100, target_latency=0)
+
+        with self.assertRaises(ValueError):
+            AdaptiveThrottle(
+                batch_size=100, target_latency=1, min_batch_size=10, max_batch_size=5
+            )
+
+    @patch("tnnt_housekeeping.handler.deletion.time.sleep")
+    def test_batched_deletion_follows_the_throttle(self, mock_sleep):
+        """
+        Test that every page is fetched with the batch size the throttle set after the previous batch.
+
+        :param mock_sleep:
+        :type mock_sleep:
+        :return:
+        :rtype:
+        """
+
+        create_doomheim_characters(count=20)
+        queryset = EveCharacter.objects.filter(corporation_id=1000001)
+        throttle = AdaptiveThrottle(batch_size=2, target_latency=60, increase=2)
+        deletion = BatchedDeletion(queryset=queryset, throttle=throttle)
+        pages = []
+
+        for pks in deletion.batches():
+            pages.append(len(pks))
+            deletion.delete_batch(pks=pks)
+            throttle.observe(latency=0)
+            deletion.batch_size = throttle.batch_size
+
+        self.assertEqual(pages, [2, 4, 6, 8])
+
+        # Only slow batches pause the run
+        create_doomheim_characters(count=4)
+        deletion = BatchedDeletion(
+            queryset=queryset,
+            throttle=AdaptiveThrottle(batch_size=2, target_latency=60),
+        )
+        result = deletion.run()
+
+        self.assertEqual(result.batches, 2)
+        mock_sleep.assert_not_called()
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+@patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_MIN_BATCH_SIZE", 1)
+@patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_TARGET_LATENCY", 60)
+class TestTunedBatchSize(BaseTestCase):
+    """
+    Test cases for the batch size tuned by the adaptive throttle across runs.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_next_run_starts_from_the_tuned_batch_size(self):
+        """
+        Test that a rule run saves its tuned batch size, and the next run starts from it.
+
+        :return:
+        :rtype:
+        """
+
+        tuned = Cache(subkey=f"{CACHE_KEY_TUNED_BATCH_SIZE}:{CHARACTER_CLEANUP.name}")
+        tuned.set(value=3, timeout=None)
+        create_doomheim_characters(count=10)
+
+        with patch(
+            "tnnt_housekeeping.tasks.BatchedDeletion", wraps=BatchedDeletion
+        ) as mock_deletion:
+            result = run_rule(rule=CHARACTER_CLEANUP)
+
+        throttle = mock_deletion.call_args.kwargs["throttle"]
+
+        # Pages of 3, 4 and 5 rows, the last one short
+        self.assertEqual(result.batches, 3)
+        self.assertEqual(throttle.batch_size, 5)
+        self.assertEqual(tuned.get(), 5)
+        self.assertFalse(EveCharacter.objects.exists())
@@ -0,0 +1,400 @@
+"""
+Query budget regression tests for the cleanup rules.
+
+Every built-in rule is run against fixture datasets of different sizes. The number
+of queries per batch must not depend on the number of rows in the batch, and must
+stay within the rule's budget. A new relation that makes a cascade fall back to
+per-row queries, or a new per-row cache access, fails these tests.
+"""
+
+# Standard Library
+import dataclasses
+from datetime import timedelta
+from unittest.mock import patch
+
+# Django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+# Alliance Auth
+from allianceauth.authentication.models import (
+    CharacterOwnership,
+    OwnershipRecord,
+    State,
+    UserProfile,
+)
+from allianceauth.eveonline.models import (
+    EveAllianceInfo,
+    EveCharacter,
+    EveCorporationInfo,
+)
+from allianceauth.notifications.models import Notification
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.rules import (
+    CHARACTER_CLEANUP,
+    CORPORATION_CLEANUP,
+    NOTIFICATION_CLEANUP,
+    ORPHANED_ALLIANCE_CLEANUP,
+    ORPHANED_CORPORATION_CLEANUP,
+    OWNERSHIP_RECORD_CLEANUP,
+    get_rules,
+)
+from tnnt_housekeeping.tasks import daily_housekeeping, run_rule
+from tnnt_housekeeping.tests import BaseTestCase, create_doomheim_characters
+
+
+def create_closed_corporations(count: int, offset: int = 0) -> None:
+    """
+    Create closed corporations, each a member corporation of a state.
+
+    :param count:
+    :type count:
+    :param offset:
+    :type offset:
+    :return:
+    :rtype:
+    """
+
+    state = State.objects.get_or_create(name="Budget State", defaults={"priority": 75})[
+        0
+    ]
+    corporations = EveCorporationInfo.objects.bulk_create(
+        EveCorporationInfo(
+            corporation_id=98000000 + offset + index,
+            corporation_name=f"Corporation {offset + index}",
+            corporation_ticker="CLSD",
+            member_count=0,
+            ceo_id=1,
+        )
+        for index in range(count)
+    )
+    state.member_corporations.add(*corporations)
+
+
+def create_main_characters(count: int, offset: int = 0, owned: bool = False):
+    """
+    Create characters in Doomheim, each a main character with an ownership record,
+    and a member character of a state.
+
+    :param count:
+    :type count:
+    :param offset:
+    :type offset:
+    :param owned: Also create a character ownership per character
+    :type owned: bool
+    :return:
+    :rtype:
+    """
+
+    state = State.objects.get_or_create(name="Budget State", defaults={"priority": 75})[
+        0
+    ]
+    characters = create_doomheim_characters(count=count, offset=offset)
+    users = User.objects.bulk_create(
+        User(username=f"budget-{character.character_id}") for character in characters
+    )
+    state.member_characters.add(*characters)
+    UserProfile.objects.bulk_create(
+        UserProfile(user=user, state=state, main_character=character)
+        for user, character in zip(users, characters)
+    )
+    OwnershipRecord.objects.bulk_create(
+        OwnershipRecord(
+            character=character, user=user, owner_hash=f"{character.character_id}"
+        )
+        for user, character in zip(users, characters)
+    )
+
+    if owned:
+        CharacterOwnership.objects.bulk_create(
+            CharacterOwnership(
+                character=character, user=user, owner_hash=f"{character.character_id}"
+            )
+            for user, character in zip(users, characters)
+        )
+
+
+def create_orphaned_corporations(count: int, offset: int = 0) -> None:
+    """
+    Create corporations nothing refers to.
+
+    :param count:
+    :type count:
+    :param offset:
+    :type offset:
+    :return:
+    :rtype:
+    """
+
+    EveCorporationInfo.objects.bulk_create(
+        EveCorporationInfo(
+            corporation_id=97000000 + offset + index,
+            corporation_name=f"Orphaned Corporation {offset + index}",
+            corporation_ticker="ORPH",
+            member_count=1,
+            ceo_id=90000000,
+        )
+        for index in range(count)
+    )
+
+
+def create_orphaned_alliances(count: int, offset: int = 0) -> None:
+    """
+    Create alliances nothing refers to.
+
+    :param count:
+    :type count:
+    :param offset:
+    :type offset:
+    :return:
+    :rtype:
+    """
+
+    EveAllianceInfo.objects.bulk_create(
+        EveAllianceInfo(
+            alliance_id=99000000 + offset + index,
+            alliance_name=f"Orphaned Alliance {offset + index}",
+            alliance_ticker="ORPH",
+            executor_corp_id=97000000,
+        )
+        for index in range(count)
+    )
+
+
+def create_superseded_ownership_records(count: int, offset: int = 0) -> None:
+    """
+    Create ownership records of a character from two years ago, each superseded by
+    the next one, and its newest record from today.
+
+    :param count:
+    :type count:
+    :param offset:
+    :type offset:
+    :return:
+    :rtype:
+    """
+
+    character = EveCharacter.objects.create(
+        character_id=91000000 + offset,
+        character_name=f"Traded Character {offset}",
+        corporation_id=98000000,
+        corporation_name="Corporation",
+        corporation_ticker="CORP",
+    )
+    user = User.objects.create(username=f"trader-{offset}")
+    records = OwnershipRecord.objects.bulk_create(
+        OwnershipRecord(character=character, user=user, owner_hash=f"{index}")
+        for index in range(count + 1)
+    )
+    OwnershipRecord.objects.filter(
+        pk__in=[record.pk for record in records[:-1]]
+    ).update(created=timezone.now() - timedelta(days=730))
+
+
+def create_old_notifications(count: int, offset: int = 0) -> None:
+    """
+    Create notifications of a user from half a year ago, every other one unread,
+    with alternating levels.
+
+    :param count:
+    :type count:
+    :param offset:
+    :type offset:
+    :return:
+    :rtype:
+    """
+
+    user = User.objects.create(username=f"notified-{offset}")
+    levels = list(Notification.Level)
+    notifications = Notification.objects.bulk_create(
+        Notification(
+            user=user,
+            level=levels[index % len(levels)],
+            title=f"Notification {index}",
+            message="Message",
+            viewed=index % 2 == 0,
+        )
+        for index in range(count)
+    )
+    Notification.objects.filter(
+        pk__in=[notification.pk for notification in notifications]
+    ).update(timestamp=timezone.now() - timedelta(days=180))
+
+
+# Fixture factory and maximum number of queries of a single-batch run, per rule.
+# Every batch runs in a savepoint, which counts as two queries.
+# - corporations (deletion plan): page, lock, M2M delete, delete, empty page
+# - characters (deletion plan, bulk mode): page, affected users, lock, M2M delete,
+#   main character update, ownership delete, record delete, delete, empty page
+# - orphaned corporations (anti-join): recording the orphans, then like corporations
+# - orphaned alliances (anti-join): recording the orphans, page, lock, M2M delete,
+#   corporation update, delete, empty page
+# - ownership records (semi-join): page, lock, delete, empty page
+# - notifications: page, lock, per-level counts, users with unread notifications,
+#   delete, empty page
+FIXTURES = {
+    CORPORATION_CLEANUP.name: (create_closed_corporations, 7),
+    CHARACTER_CLEANUP.name: (create_main_characters, 11),
+    ORPHANED_CORPORATION_CLEANUP.name: (create_orphaned_corporations, 8),
+    ORPHANED_ALLIANCE_CLEANUP.name: (create_orphaned_alliances, 9),
+    OWNERSHIP_RECORD_CLEANUP.name: (create_superseded_ownership_records, 6),
+    NOTIFICATION_CLEANUP.name: (create_old_notifications, 8),
+}
+
+# Additional queries per owned character: the owner is reconciled once after the batch,
+# reassessing their state, and notifying them when it changes
+OWNED_CHARACTER_BUDGET = 8
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+# The orphans are deleted by the run that records them
+@patch("tnnt_housekeeping.rules.TNNT_HOUSEKEEPING_ORPHAN_GRACE_PERIOD", 0)
+class TestQueryBudget(BaseTestCase):
+    """
+    Query budget regression tests for the cleanup rules.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self._offset = 0
+
+    def count_queries(self, rule, rows: int, batch_size: int, **kwargs) -> int:
+        """
+        Create `rows` candidates for a rule and count the queries of deleting them.
+
+        :param rule:
+        :type rule:
+        :param rows:
+        :type rows:
+        :param batch_size:
+        :type batch_size:
+        :param kwargs: Passed to the fixture factory
+        :type kwargs:
+        :return:
+        :rtype:
+        """
+
+        factory, _ = FIXTURES[rule.name]
+        factory(count=rows, offset=self._offset, **kwargs)
+        self._offset += rows
+        # Bulk created rows are not in the dirty set, so every run is a full scan
+        cache.clear()
+
+        # The reconciliation of deferred receivers runs on commit, and counts as well
+        with (
+            CaptureQueriesContext(connection) as context,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            # Fixed batches, the adaptive throttle would resize them
+            result = run_rule(
+                rule=dataclasses.replace(
+                    rule, batch_size=batch_size, target_latency=None
+                )
+            )
+
+        self.assertTrue(result.finished)
+        self.assertFalse(rule.candidates().exists())
+
+        return len(context.captured_queries)
+
+    def test_every_builtin_rule_has_a_fixture(self):
+        """
+        Test that every registered built-in rule is covered by a query budget.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(
+            {
+                rule.name
+                for rule in get_rules()
+                if rule.__module__ == CORPORATION_CLEANUP.__module__
+            },
+            set(FIXTURES),
+        )
+
+    def test_queries_per_batch_do_not_grow_with_the_rows(self):
+        """
+        Test that a batch of 40 rows takes as many queries as a batch of 5 rows, within the budget.
+
+        :return:
+        :rtype:
+        """
+
+        for name, (_, budget) in FIXTURES.items():
+            rule = next(rule for rule in get_rules() if rule.name == name)
+
+            with self.subTest(rule=name):
+                small = self.count_queries(rule=rule, rows=5, batch_size=5)
+                large = self.count_queries(rule=rule, rows=40, batch_size=40)
+
+                self.assertEqual(small, large)
+                self.assertLessEqual(large, budget)
+
+    def test_queries_grow_with_the_batches_only(self):
+        """
+        Test that every additional batch adds the same number of queries.
+
+        :return:
+        :rtype:
+        """
+
+        for name in FIXTURES:
+            rule = next(rule for rule in get_rules() if rule.name == name)
+
+            with self.subTest(rule=name):
+                one = self.count_queries(rule=rule, rows=10, batch_size=10)
+                two = self.count_queries(rule=rule, rows=20, batch_size=10)
+                four = self.count_queries(rule=rule, rows=40, batch_size=10)
+
+                self.assertEqual(four - two, 2 * (two - one))
+
+    def test_character_ownerships_cost_a_bounded_number_of_queries(self):
+        """
+        Test the per-row cost of owned characters, caused by reconciling their
+        owners after Alliance Auth's deferred receivers, doesn't get any worse.
+
+        :return:
+        :rtype:
+        """
+
+        owned_small = self.count_queries(
+            rule=CHARACTER_CLEANUP, rows=5, batch_size=40, owned=True
+        )
+        owned_large = self.count_queries(
+            rule=CHARACTER_CLEANUP, rows=25, batch_size=40, owned=True
+        )
+
+        self.assertLessEqual((owned_large - owned_small) / 20, OWNED_CHARACTER_BUDGET)
+
+    def test_cache_accesses_do_not_grow_with_the_rows(self):
+        """
+        Test that a daily run accesses the cache as often for 40 candidates as for 5.
+
+        :return:
+        :rtype:
+        """
+
+        calls = []
+
+        for rows, offset in ((5, 0), (40, 5)):
+            cache.clear()
+            create_closed_corporations(count=rows, offset=offset)
+            create_main_characters(count=rows, offset=offset)
+
+            with patch(
+                "tnnt_housekeeping.handler.cache.cache", wraps=cache
+            ) as mock_cache:
+                daily_housekeeping()
+
+            calls.append(len(mock_cache.method_calls))
+
+        self.assertEqual(calls[0], calls[1])
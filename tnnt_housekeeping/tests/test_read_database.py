@@ -0,0 +1,111 @@
+"""
+Unit tests for reading the cleanup candidates from a read replica.
+"""
+
+# Standard Library
+from unittest.mock import patch
+
+# Django
+from django.core.cache import cache
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.checks import check_read_database
+from tnnt_housekeeping.handler.estimate import estimate_rule
+from tnnt_housekeeping.rules import CHARACTER_CLEANUP
+from tnnt_housekeeping.tasks import run_rule
+from tnnt_housekeeping.tests import BaseTestCase, create_character
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+@patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_READ_DATABASE", "replica")
+class TestReadDatabase(BaseTestCase):
+    """
+    Unit tests for reading the cleanup candidates from a read replica.
+
+    The replica lags behind the primary:
+
+    - Characters 1 to 3 are in Doomheim on both.
+    - Character 4 has left Doomheim on the primary, but not yet on the replica.
+    """
+
+    databases = {"default", "replica"}
+
+    @classmethod
+    def setUpTestData(cls):
+        for using in ("default", "replica"):
+            for character_id in range(1, 4):
+                create_character(
+                    character_id=character_id, corporation_id=1000001, using=using
+                )
+
+        create_character(character_id=4, corporation_id=98000001, using="default")
+        create_character(character_id=4, corporation_id=1000001, using="replica")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reads_from_the_replica_and_deletes_on_the_primary(self):
+        """
+        Test that the candidates are read from the replica, but only the rows still
+        matching on the primary are deleted there.
+
+        :return:
+        :rtype:
+        """
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            result = run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 3)
+        self.assertEqual(
+            list(EveCharacter.objects.values_list("character_id", flat=True)), [4]
+        )
+        self.assertEqual(EveCharacter.objects.using("replica").count(), 4)
+        self.assertTrue(
+            all(query["sql"].startswith("SELECT") for query in replica.captured_queries)
+        )
+
+    def test_estimates_read_from_the_replica(self):
+        """
+        Test that impact estimates only query the read database.
+
+        :return:
+        :rtype:
+        """
+
+        with (
+            patch(
+                "tnnt_housekeeping.handler.estimate.TNNT_HOUSEKEEPING_READ_DATABASE",
+                "replica",
+            ),
+            CaptureQueriesContext(connections["default"]) as primary,
+        ):
+            estimate = estimate_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertEqual(estimate.candidates, 4)
+        self.assertFalse(primary.captured_queries)
+
+    def test_check_reports_unknown_read_database(self):
+        """
+        Test that the system check reports a read database that isn't configured.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(check_read_database(), [])
+
+        with patch(
+            "tnnt_housekeeping.checks.TNNT_HOUSEKEEPING_READ_DATABASE", "standby"
+        ):
+            (error,) = check_read_database()
+
+        self.assertEqual(error.id, "tnnt_housekeeping.E001")
@@ -0,0 +1,490 @@
+"""
+Unit tests for the cleanup rules in tnnt_housekeeping.rules.
+"""
+
+# Standard Library
+import dataclasses
+from datetime import timedelta
+from unittest.mock import patch
+
+# Django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from django.test import override_settings
+from django.utils import timezone
+
+# Alliance Auth
+from allianceauth.authentication.models import OwnershipRecord
+from allianceauth.eveonline.models import EveCharacter
+from allianceauth.notifications.models import Notification
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.rules import (
+    CHARACTER_CLEANUP,
+    CORPORATION_CLEANUP,
+    COST_HEAVY,
+    NOTIFICATION_CLEANUP,
+    OWNERSHIP_RECORD_CLEANUP,
+    RULES_HOOK,
+    CleanupRule,
+    get_rule,
+    get_rules,
+    register_rule,
+)
+from tnnt_housekeeping.tasks import _throttle, run_rule
+from tnnt_housekeeping.tests import BaseTestCase
+
+
+class TestCleanupRules(BaseTestCase):
+    """
+    Unit tests for the cleanup rules in tnnt_housekeeping.rules.
+    """
+
+    def setUp(self):
+        # Every test starts with the built-in rules and a fresh hook discovery
+        self._rules_patcher = patch.dict(
+            "tnnt_housekeeping.rules._rules",
+            {
+                CORPORATION_CLEANUP.name: CORPORATION_CLEANUP,
+                CHARACTER_CLEANUP.name: CHARACTER_CLEANUP,
+            },
+            clear=True,
+        )
+        self._discovered_patcher = patch(
+            "tnnt_housekeeping.rules._hooks_discovered", False
+        )
+        self._get_hooks_patcher = patch(
+            "tnnt_housekeeping.rules.get_hooks", return_value=[]
+        )
+        self._rules_patcher.start()
+        self._discovered_patcher.start()
+        self.mock_get_hooks = self._get_hooks_patcher.start()
+
+    def tearDown(self):
+        self._get_hooks_patcher.stop()
+        self._discovered_patcher.stop()
+        self._rules_patcher.stop()
+
+    def test_builtin_rules_are_daily_rules(self):
+        """
+        Test that the built-in rules belong to the daily tier, corporation cleanup first.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(
+            get_rules(tier="daily"), [CORPORATION_CLEANUP, CHARACTER_CLEANUP]
+        )
+        self.assertEqual(get_rules(tier="hourly"), [])
+        self.assertIs(get_rule(name="character_cleanup"), CHARACTER_CLEANUP)
+
+    def test_raises_value_error_for_unknown_rule(self):
+        """
+        Test that get_rule raises a ValueError for a rule that is not registered.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(ValueError):
+            get_rule(name="candidates")
+
+    def test_register_rule_validates_tier_and_cost(self):
+        """
+        Test that register_rule refuses rules with an unknown tier or cost class.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(ValueError):
+            register_rule(
+                CleanupRule(
+                    name="unknown_tier",
+                    model=User,
+                    predicate=lambda: Q(is_active=False),
+                    description="inactive users",
+                    tier="fortnightly",
+                )
+            )
+
+        with self.assertRaises(ValueError):
+            register_rule(
+                CleanupRule(
+                    name="unknown_cost",
+                    model=User,
+                    predicate=lambda: Q(is_active=False),
+                    description="inactive users",
+                    cost="expensive",
+                )
+            )
+
+    def test_discovers_rules_from_hooks(self):
+        """
+        Test that rules provided through the rules hook are registered, heavy rules after light ones.
+
+        :return:
+        :rtype:
+        """
+
+        heavy_rule = CleanupRule(
+            name="heavy_rule",
+            model=User,
+            predicate=lambda: Q(is_active=False),
+            description="inactive users",
+            cost=COST_HEAVY,
+        )
+        light_rule = CleanupRule(
+            name="light_rule",
+            model=User,
+            predicate=lambda: Q(last_login__isnull=True),
+            description="users who never logged in",
+            tier="hourly",
+        )
+        self.mock_get_hooks.return_value = [lambda: [heavy_rule], lambda: light_rule]
+
+        self.assertEqual(
+            get_rules(tier="daily"),
+            [CORPORATION_CLEANUP, CHARACTER_CLEANUP, heavy_rule],
+        )
+        self.assertEqual(get_rules(tier="hourly"), [light_rule])
+
+        # Hooks are only discovered once
+        get_rules()
+
+        self.mock_get_hooks.assert_called_once_with(RULES_HOOK)
+
+    def test_a_failing_hook_does_not_hide_the_rules_of_other_hooks(self):
+        """
+        Test that a hook raising an error is logged and skipped, and the rules of
+        the hooks after it are registered.
+
+        :return:
+        :rtype:
+        """
+
+        rule = CleanupRule(
+            name="later_rule",
+            model=User,
+            predicate=lambda: Q(is_active=False),
+            description="inactive users",
+        )
+
+        def failing_hook():
+            raise RuntimeError("Broken app")
+
+        self.mock_get_hooks.return_value = [failing_hook, lambda: rule]
+
+        with patch("tnnt_housekeeping.rules.logger") as mock_logger:
+            self.assertEqual(get_rule(name="later_rule"), rule)
+
+        self.assertIn("Broken app", mock_logger.error.call_args.args[0])
+
+    def test_run_rule_uses_the_rule_batch_size(self):
+        """
+        Test that run_rule deletes in batches of the rule's batch size.
+
+        :return:
+        :rtype:
+        """
+
+        for character_id in range(1, 6):
+            EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=98000001,
+                corporation_name="Test Corporation",
+                corporation_ticker="TEST",
+            )
+
+        rule = register_rule(
+            CleanupRule(
+                name="test_corporation_members",
+                model=EveCharacter,
+                predicate=lambda: Q(corporation_id=98000001),
+                description="test corporation members",
+                batch_size=2,
+            )
+        )
+
+        result = run_rule(rule=rule)
+
+        self.assertEqual(result.batches, 3)
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 5)
+        self.assertFalse(rule.candidates().exists())
+
+    def test_indexed_fields_are_derived_from_the_predicate(self):
+        """
+        Test that the indexed fields are the model's own fields the predicate filters on.
+
+        :return:
+        :rtype:
+        """
+
+        rule = CleanupRule(
+            name="inactive_users",
+            model=User,
+            predicate=lambda: Q(is_active=False)
+            & (Q(last_login__lt="2020-01-01") | Q(profile__state__name="Guest")),
+            description="inactive users",
+        )
+
+        self.assertEqual(CORPORATION_CLEANUP.indexed_fields(), ("ceo_id",))
+        self.assertEqual(CHARACTER_CLEANUP.indexed_fields(), ("corporation_id",))
+        self.assertEqual(rule.indexed_fields(), ("is_active", "last_login"))
+        self.assertEqual(
+            CleanupRule(
+                name="users_without_characters",
+                model=User,
+                predicate=lambda: Q(
+                    ~Exists(
+                        EveCharacter.objects.filter(character_name=OuterRef("username"))
+                    ),
+                    is_active=False,
+                ),
+                description="users without characters",
+            ).indexed_fields(),
+            ("is_active",),
+        )
+        self.assertEqual(
+            CleanupRule(
+                name="inactive_users",
+                model=User,
+                predicate=lambda: Q(is_active=False),
+                description="inactive users",
+                index_fields=(),
+            ).indexed_fields(),
+            (),
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestOwnershipRecordCleanup(BaseTestCase):
+    """
+    Test cases for pruning the ownership records.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="trader")
+        cls.characters = [
+            EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=98000001,
+                corporation_name="Test Corporation",
+                corporation_ticker="TEST",
+            )
+            for character_id in (1, 2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def create_record(self, character: EveCharacter, days: int) -> OwnershipRecord:
+        """
+        Create an ownership record of a character, created a number of days ago.
+
+        :param character:
+        :type character:
+        :param days:
+        :type days:
+        :return:
+        :rtype:
+        """
+
+        record = OwnershipRecord.objects.create(
+            character=character, user=self.user, owner_hash=f"{days}"
+        )
+        OwnershipRecord.objects.filter(pk=record.pk).update(
+            created=timezone.now() - timedelta(days=days)
+        )
+
+        return record
+
+    def test_keeps_the_newest_record_of_every_character(self):
+        """
+        Test that only records older than the retention are pruned, and the newest
+        record of a character is kept, however old.
+
+        :return:
+        :rtype:
+        """
+
+        first, second = self.characters
+        self.create_record(character=first, days=800)
+        self.create_record(character=first, days=400)
+        recent = self.create_record(character=first, days=30)
+        newest = self.create_record(character=first, days=1)
+        only = self.create_record(character=second, days=800)
+
+        result = run_rule(rule=OWNERSHIP_RECORD_CLEANUP)
+
+        self.assertEqual(result.deleted("authentication.OwnershipRecord"), 2)
+        self.assertEqual(
+            set(OwnershipRecord.objects.values_list("pk", flat=True)),
+            {recent.pk, newest.pk, only.pk},
+        )
+
+    def test_records_created_at_the_same_time_keep_one(self):
+        """
+        Test that of two old records created at the same time, the later one is kept.
+
+        :return:
+        :rtype:
+        """
+
+        self.create_record(character=self.characters[0], days=800)
+        newer = self.create_record(character=self.characters[0], days=800)
+        OwnershipRecord.objects.update(created=timezone.now() - timedelta(days=800))
+
+        run_rule(rule=OWNERSHIP_RECORD_CLEANUP)
+
+        self.assertEqual(list(OwnershipRecord.objects.all()), [newer])
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_TARGET_LATENCY", None)
+    def test_is_paced_without_a_global_target_latency(self):
+        """
+        Test that the rule's own target latency gives it an adaptive throttle.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertIsNone(_throttle(rule=CHARACTER_CLEANUP))
+        self.assertEqual(_throttle(rule=OWNERSHIP_RECORD_CLEANUP).target_latency, 0.25)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestNotificationCleanup(BaseTestCase):
+    """
+    Test cases for pruning the notifications.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="notified")
+        cls.other_user = User.objects.create(username="other")
+
+    def setUp(self):
+        cache.clear()
+
+    def create_notification(
+        self,
+        days: int,
+        viewed: bool,
+        level: str = Notification.Level.INFO,
+        user: User | None = None,
+    ) -> Notification:
+        """
+        Create a notification, sent a number of days ago.
+
+        :param days:
+        :type days:
+        :param viewed:
+        :type viewed:
+        :param level:
+        :type level:
+        :param user:
+        :type user:
+        :return:
+        :rtype:
+        """
+
+        notification = Notification.objects.create(
+            user=user or self.user,
+            level=level,
+            title=f"{days} days",
+            message="Message",
+            viewed=viewed,
+        )
+        Notification.objects.filter(pk=notification.pk).update(
+            timestamp=timezone.now() - timedelta(days=days)
+        )
+
+        return notification
+
+    def test_read_notifications_are_kept_shorter(self):
+        """
+        Test that read notifications are pruned after the read retention,
+        and unread ones only after the retention of all notifications.
+
+        :return:
+        :rtype:
+        """
+
+        self.create_notification(days=40, viewed=True)
+        self.create_notification(days=100, viewed=False)
+        recent_read = self.create_notification(days=10, viewed=True)
+        old_unread = self.create_notification(days=40, viewed=False)
+
+        result = run_rule(rule=NOTIFICATION_CLEANUP)
+
+        self.assertEqual(result.deleted("notifications.Notification"), 2)
+        self.assertEqual(
+            set(Notification.objects.values_list("pk", flat=True)),
+            {recent_read.pk, old_unread.pk},
+        )
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_TARGET_LATENCY", None)
+    def test_reports_the_deleted_rows_per_level(self):
+        """
+        Test that the result counts the deleted notifications per level, across batches.
+
+        :return:
+        :rtype:
+        """
+
+        for level in (
+            Notification.Level.DANGER,
+            Notification.Level.INFO,
+            Notification.Level.INFO,
+            Notification.Level.WARNING,
+        ):
+            self.create_notification(days=100, viewed=False, level=level)
+
+        self.create_notification(days=10, viewed=False, level=Notification.Level.DANGER)
+
+        with patch("tnnt_housekeeping.tasks.logger") as mock_logger:
+            result = run_rule(
+                rule=dataclasses.replace(NOTIFICATION_CLEANUP, batch_size=3)
+            )
+
+        self.assertEqual(result.batches, 2)
+        self.assertEqual(
+            result.as_dict()["breakdown"], {"danger": 1, "info": 2, "warning": 1}
+        )
+        self.assertTrue(
+            any(
+                "old notifications per level" in call.args[0]
+                for call in mock_logger.info.call_args_list
+            )
+        )
+
+    def test_invalidates_the_unread_counts_on_commit(self):
+        """
+        Test that the cached unread counts of the users whose unread notifications
+        are deleted are invalidated once the batch committed.
+
+        :return:
+        :rtype:
+        """
+
+        self.create_notification(days=100, viewed=False)
+        self.create_notification(days=100, viewed=False)
+        self.create_notification(days=100, viewed=True, user=self.other_user)
+
+        self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 2)
+        self.assertEqual(Notification.objects.user_unread_count(self.other_user.pk), 0)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            run_rule(rule=NOTIFICATION_CLEANUP)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Notification.objects.user_unread_count(self.user.pk), 0)
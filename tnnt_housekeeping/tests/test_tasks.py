@@ -3,25 +3,82 @@ Unit tests for the housekeeping tasks.
 """
 
 # Standard Library
+from collections import Counter
 from unittest.mock import MagicMock, patch
 
+# Django
+from django.core.cache import cache
+from django.db import OperationalError
+from django.db.models import Q
+from django.test import override_settings
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+
 # TN-NT Auth Housekeeping
-from tnnt_housekeeping.tasks import DailyTasks, daily_housekeeping, housekeeping
+from tnnt_housekeeping.handler.cache import Cache
+from tnnt_housekeeping.handler.deletion import DeletionResult
+from tnnt_housekeeping.handler.dirty import DirtySet
+from tnnt_housekeeping.handler.estimate import estimate_rule
+from tnnt_housekeeping.handler.idset import IdSet
+from tnnt_housekeeping.handler.metrics import load_metrics
+from tnnt_housekeeping.handler.plan import DeletionPlan
+from tnnt_housekeeping.rules import (
+    CHARACTER_CLEANUP,
+    CORPORATION_CLEANUP,
+    NOTIFICATION_CLEANUP,
+    ORPHANED_ALLIANCE_CLEANUP,
+    ORPHANED_CORPORATION_CLEANUP,
+    OWNERSHIP_RECORD_CLEANUP,
+)
+from tnnt_housekeeping.tasks import (
+    CACHE_KEY_CLEANUP_CURSOR,
+    CACHE_KEY_DAILY_HOUSEKEEPING,
+    CACHE_KEY_DAILY_HOUSEKEEPING_CLAIM,
+    CACHE_KEY_FULL_SCAN,
+    CACHE_KEY_SHARDED_HOUSEKEEPING,
+    daily_housekeeping,
+    finalize_sharded_housekeeping,
+    housekeeping,
+    housekeeping_shard,
+    run_rule,
+)
 from tnnt_housekeeping.tests import BaseTestCase
 
 
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
 class TestDailyHousekeepingTasks(BaseTestCase):
     """
     Test cases for the housekeeping tasks.
     """
 
+    def setUp(self):
+        cache.clear()
+        self._claim_patcher = patch(
+            "tnnt_housekeeping.tasks.Cache.claim", return_value=True
+        )
+        self._extend_patcher = patch(
+            "tnnt_housekeeping.tasks.Cache.extend", return_value=True
+        )
+        self._release_patcher = patch("tnnt_housekeeping.tasks.Cache.release")
+        self.mock_claim = self._claim_patcher.start()
+        self.mock_extend = self._extend_patcher.start()
+        self.mock_release = self._release_patcher.start()
+
+    def tearDown(self):
+        self._claim_patcher.stop()
+        self._extend_patcher.stop()
+        self._release_patcher.stop()
+
     ##
     # CORPORATION CLEANUP TESTS
     ##
 
     def test_corporation_cleanup_logs_and_deletes_closed_corporations(self):
         """
-        Test that the corporation_cleanup method logs the number of closed corporations found and deletes them.
+        Test that the corporation cleanup rule logs the number of closed corporations found and deletes them.
 
         :return:
         :rtype:
@@ -29,25 +86,45 @@ class TestDailyHousekeepingTasks(BaseTestCase):
 
         with (
             patch(
-                "tnnt_housekeeping.tasks.EveCorporationInfo.objects.filter"
+                "tnnt_housekeeping.rules.EveCorporationInfo.objects.filter"
             ) as mock_filter,
             patch("tnnt_housekeeping.tasks.logger") as mock_logger,
+            patch("tnnt_housekeeping.tasks.BatchedDeletion") as mock_deletion,
         ):
             mock_queryset = MagicMock()
-            mock_queryset.count.return_value = 3
             mock_filter.return_value = mock_queryset
+            mock_deletion.return_value.result = DeletionResult(
+                batches=1, per_model=Counter({"eveonline.EveCorporationInfo": 3})
+            )
 
-            DailyTasks.corporation_cleanup()
+            result = run_rule(rule=CORPORATION_CLEANUP)
 
+            mock_logger.info.assert_any_call("Starting cleanup of closed corporations.")
             mock_logger.info.assert_any_call(
-                "Starting daily corporation cleanup tasks."
+                "Deleted 3 closed corporations (3 rows in total: "
+                "{'eveonline.EveCorporationInfo': 3})."
+            )
+            mock_queryset.count.assert_not_called()
+            mock_deletion.assert_called_once_with(
+                queryset=mock_queryset,
+                batch_size=None,
+                heartbeat=None,
+                time_budget=None,
+                cursor=None,
+                throttle=None,
+                read_using=None,
+                defer_signals=True,
+                archive=None,
+                breakdown=None,
+                before_delete=None,
+                select=None,
             )
-            mock_logger.info.assert_any_call("Found 3 closed corporations to delete.")
-            mock_queryset.delete.assert_called_once()
+            mock_deletion.return_value.run.assert_called_once()
+            self.assertEqual(result.total, 3)
 
     def test_corporation_cleanup_handles_deletion_error(self):
         """
-        Test that the corporation_cleanup method logs an error if there is an exception during deletion.
+        Test that the corporation cleanup rule logs an error if there is an exception during deletion.
 
         :return:
         :rtype:
@@ -55,25 +132,26 @@ class TestDailyHousekeepingTasks(BaseTestCase):
 
         with (
             patch(
-                "tnnt_housekeeping.tasks.EveCorporationInfo.objects.filter"
+                "tnnt_housekeeping.rules.EveCorporationInfo.objects.filter"
             ) as mock_filter,
             patch("tnnt_housekeeping.tasks.logger") as mock_logger,
+            patch("tnnt_housekeeping.tasks.BatchedDeletion") as mock_deletion,
         ):
             mock_queryset = MagicMock()
-            mock_queryset.count.return_value = 2
-            mock_queryset.delete.side_effect = Exception("Deletion error")
+            mock_deletion.return_value.result = DeletionResult()
+            mock_deletion.return_value.run.side_effect = Exception("Deletion error")
             mock_filter.return_value = mock_queryset
 
-            DailyTasks.corporation_cleanup()
+            run_rule(rule=CORPORATION_CLEANUP)
 
             mock_logger.error.assert_called_once_with(
                 "Error deleting closed corporations: Deletion error"
             )
 
-    @patch("tnnt_housekeeping.tasks.EveCorporationInfo.objects.filter")
+    @patch("tnnt_housekeeping.rules.EveCorporationInfo.objects.filter")
     def test_corporation_cleanup_no_closed_corporations_to_delete(self, mock_filter):
         """
-        Test that the corporation_cleanup method does not attempt to delete when there are no closed corporations.
+        Test that the corporation cleanup rule does not attempt to delete when there are no closed corporations.
 
         :param mock_filter:
         :type mock_filter:
@@ -81,11 +159,8 @@ class TestDailyHousekeepingTasks(BaseTestCase):
         :rtype:
         """
 
-        mock_queryset = mock_filter.return_value
-        mock_queryset.count.return_value = 0
-
-        DailyTasks.corporation_cleanup()
-        mock_filter.assert_called_once_with(ceo_id=1)
+        run_rule(rule=CORPORATION_CLEANUP)
+        mock_filter.assert_called_once_with(Q(ceo_id=1))
 
     ##
     # CHARACTER CLEANUP TESTS
@@ -93,53 +168,84 @@ class TestDailyHousekeepingTasks(BaseTestCase):
 
     def test_character_cleanup_logs_and_deletes_doomheim_characters(self):
         """
-        Test that the character_cleanup method logs the number of characters found in Doomheim and deletes them.
+        Test that the character cleanup rule logs the number of characters found in Doomheim and deletes them.
 
         :return:
         :rtype:
         """
 
         with (
-            patch("tnnt_housekeeping.tasks.EveCharacter.objects.filter") as mock_filter,
+            patch("tnnt_housekeeping.rules.EveCharacter.objects.filter") as mock_filter,
             patch("tnnt_housekeeping.tasks.logger") as mock_logger,
+            patch("tnnt_housekeeping.tasks.BatchedDeletion") as mock_deletion,
         ):
             mock_queryset = MagicMock()
-            mock_queryset.count.return_value = 5
             mock_filter.return_value = mock_queryset
+            mock_deletion.return_value.result = DeletionResult(
+                batches=1,
+                per_model=Counter(
+                    {
+                        "eveonline.EveCharacter": 5,
+                        "authentication.CharacterOwnership": 2,
+                    }
+                ),
+            )
 
-            DailyTasks.character_cleanup()
+            result = run_rule(rule=CHARACTER_CLEANUP)
 
-            mock_logger.info.assert_any_call("Starting daily character cleanup tasks.")
-            mock_logger.info.assert_any_call("Found 5 characters to delete.")
-            mock_queryset.delete.assert_called_once()
+            mock_logger.info.assert_any_call(
+                "Starting cleanup of characters in Doomheim."
+            )
+            mock_logger.info.assert_any_call(
+                "Deleted 5 characters in Doomheim (7 rows in total: "
+                "{'eveonline.EveCharacter': 5, 'authentication.CharacterOwnership': 2})."
+            )
+            mock_queryset.count.assert_not_called()
+            mock_deletion.assert_called_once_with(
+                queryset=mock_queryset,
+                batch_size=None,
+                heartbeat=None,
+                time_budget=None,
+                cursor=None,
+                throttle=None,
+                read_using=None,
+                defer_signals=True,
+                archive=None,
+                breakdown=None,
+                before_delete=None,
+                select=None,
+            )
+            mock_deletion.return_value.run.assert_called_once()
+            self.assertEqual(result.total, 7)
 
     def test_character_cleanup_handles_deletion_error(self):
         """
-        Test that the character_cleanup method logs an error if there is an exception during deletion of characters in Doomheim.
+        Test that the character cleanup rule logs an error if there is an exception during deletion of characters in Doomheim.
 
         :return:
         :rtype:
         """
 
         with (
-            patch("tnnt_housekeeping.tasks.EveCharacter.objects.filter") as mock_filter,
+            patch("tnnt_housekeeping.rules.EveCharacter.objects.filter") as mock_filter,
             patch("tnnt_housekeeping.tasks.logger") as mock_logger,
+            patch("tnnt_housekeeping.tasks.BatchedDeletion") as mock_deletion,
         ):
             mock_queryset = MagicMock()
-            mock_queryset.count.return_value = 3
-            mock_queryset.delete.side_effect = Exception("Deletion error")
+            mock_deletion.return_value.result = DeletionResult()
+            mock_deletion.return_value.run.side_effect = Exception("Deletion error")
             mock_filter.return_value = mock_queryset
 
-            DailyTasks.character_cleanup()
+            run_rule(rule=CHARACTER_CLEANUP)
 
             mock_logger.error.assert_called_once_with(
                 "Error deleting characters in Doomheim: Deletion error"
             )
 
-    @patch("tnnt_housekeeping.tasks.EveCharacter.objects.filter")
+    @patch("tnnt_housekeeping.rules.EveCharacter.objects.filter")
     def test_character_cleanup_no_characters_to_delete(self, mock_filter):
         """
-        Test that the character_cleanup method does not attempt to delete when there are no characters in corporation ID 1000001 (Doomheim).
+        Test that the character cleanup rule does not attempt to delete when there are no characters in corporation ID 1000001 (Doomheim).
 
         :param mock_filter:
         :type mock_filter:
@@ -147,97 +253,1109 @@ class TestDailyHousekeepingTasks(BaseTestCase):
         :rtype:
         """
 
-        mock_queryset = mock_filter.return_value
-        mock_queryset.count.return_value = 0
-
-        DailyTasks.character_cleanup()
+        run_rule(rule=CHARACTER_CLEANUP)
 
-        mock_filter.assert_called_once_with(corporation_id=1000001)
+        mock_filter.assert_called_once_with(Q(corporation_id=1000001))
 
     ##
     # DAILY HOUSEKEEPING TASKS
     ##
 
-    @patch("tnnt_housekeeping.tasks.Cache.get")
-    @patch("tnnt_housekeeping.tasks.DailyTasks.corporation_cleanup")
-    @patch("tnnt_housekeeping.tasks.DailyTasks.character_cleanup")
-    @patch("tnnt_housekeeping.tasks.Cache.set_daily")
-    def test_runs_daily_tasks_when_cache_is_empty(
-        self,
-        mock_set_daily,
-        mock_character_cleanup,
-        mock_corporation_cleanup,
-        mock_cache_get,
+    @patch("tnnt_housekeeping.tasks.run_rule")
+    def test_runs_daily_tasks_when_cache_is_empty(self, mock_run_rule):
+        """
+        Test that the daily_housekeeping function runs the daily rules when the cache is empty.
+
+        :param mock_run_rule:
+        :type mock_run_rule:
+        :return:
+        :rtype:
+        """
+
+        mock_run_rule.side_effect = [
+            DeletionResult(
+                batches=1, per_model=Counter({"eveonline.EveCorporationInfo": 2})
+            ),
+            DeletionResult(),
+            DeletionResult(),
+            DeletionResult(),
+            DeletionResult(),
+            DeletionResult(),
+        ]
+
+        result = daily_housekeeping()
+
+        self.assertEqual(
+            [call.kwargs["rule"] for call in mock_run_rule.call_args_list],
+            [
+                CORPORATION_CLEANUP,
+                CHARACTER_CLEANUP,
+                NOTIFICATION_CLEANUP,
+                ORPHANED_CORPORATION_CLEANUP,
+                ORPHANED_ALLIANCE_CLEANUP,
+                OWNERSHIP_RECORD_CLEANUP,
+            ],
+        )
+        self.assertTrue(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+        self.assertEqual(
+            result,
+            {
+                "corporation_cleanup": {
+                    "batches": 1,
+                    "total": 2,
+                    "per_model": {"eveonline.EveCorporationInfo": 2},
+                    "finished": True,
+                    "retries": 0,
+                    "failed": False,
+                    "breakdown": {},
+                },
+                "character_cleanup": {
+                    "batches": 0,
+                    "total": 0,
+                    "per_model": {},
+                    "finished": True,
+                    "retries": 0,
+                    "failed": False,
+                    "breakdown": {},
+                },
+                "notification_cleanup": {
+                    "batches": 0,
+                    "total": 0,
+                    "per_model": {},
+                    "finished": True,
+                    "retries": 0,
+                    "failed": False,
+                    "breakdown": {},
+                },
+                "orphaned_corporation_cleanup": {
+                    "batches": 0,
+                    "total": 0,
+                    "per_model": {},
+                    "finished": True,
+                    "retries": 0,
+                    "failed": False,
+                    "breakdown": {},
+                },
+                "orphaned_alliance_cleanup": {
+                    "batches": 0,
+                    "total": 0,
+                    "per_model": {},
+                    "finished": True,
+                    "retries": 0,
+                    "failed": False,
+                    "breakdown": {},
+                },
+                "ownership_record_cleanup": {
+                    "batches": 0,
+                    "total": 0,
+                    "per_model": {},
+                    "finished": True,
+                    "retries": 0,
+                    "failed": False,
+                    "breakdown": {},
+                },
+            },
+        )
+
+    @patch("tnnt_housekeeping.tasks.run_rule")
+    @patch("tnnt_housekeeping.tasks.Tier.set_marker")
+    def test_skips_daily_tasks_when_cache_is_set(self, mock_set_marker, mock_run_rule):
+        """
+        Test that the daily_housekeeping function skips daily tasks when the cache is set.
+
+        :param mock_set_marker:
+        :type mock_set_marker:
+        :param mock_run_rule:
+        :type mock_run_rule:
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).set(value=True, timeout=60)
+
+        result = daily_housekeeping()
+
+        self.assertIsNone(result)
+        mock_run_rule.assert_not_called()
+        mock_set_marker.assert_not_called()
+
+    @patch("tnnt_housekeeping.tasks.tier_housekeeping.delay")
+    def test_triggers_daily_housekeeping_task(self, mock_tier_housekeeping):
+        """
+        Test that the housekeeping function triggers the housekeeping of the daily tier.
+
+        :param mock_tier_housekeeping:
+        :type mock_tier_housekeeping:
+        :return:
+        :rtype:
+        """
+
+        housekeeping()
+
+        mock_tier_housekeeping.assert_called_once_with(tier="daily")
+
+    @patch("tnnt_housekeeping.tasks.Cache.incr")
+    @patch("tnnt_housekeeping.tasks.tier_housekeeping.delay")
+    def test_suppresses_dispatch_when_daily_housekeeping_is_not_due(
+        self, mock_tier_housekeeping, mock_cache_incr
+    ):
+        """
+        Test that the housekeeping function doesn't enqueue the daily tier when it has already run, and counts the suppressed dispatch.
+
+        :param mock_tier_housekeeping:
+        :type mock_tier_housekeeping:
+        :param mock_cache_incr:
+        :type mock_cache_incr:
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).set(value=True, timeout=60)
+        mock_cache_incr.return_value = 3
+
+        housekeeping()
+
+        mock_tier_housekeeping.assert_not_called()
+        mock_cache_incr.assert_called_once_with(timeout=None, delta=1)
+
+    @patch("tnnt_housekeeping.tasks.Cache.get_many")
+    @patch("tnnt_housekeeping.tasks.tier_housekeeping.delay")
+    def test_checks_all_tiers_with_a_single_cache_read(
+        self, mock_tier_housekeeping, mock_cache_get_many
     ):
         """
-        Test that the daily_housekeeping function runs daily tasks when the cache is empty.
+        Test that the housekeeping function reads the markers of all tiers at once.
+
+        :param mock_tier_housekeeping:
+        :type mock_tier_housekeeping:
+        :param mock_cache_get_many:
+        :type mock_cache_get_many:
+        :return:
+        :rtype:
+        """
+
+        mock_cache_get_many.return_value = {
+            "daily-housekeeping-last-run": False,
+            "sharded-daily-housekeeping-run": False,
+        }
+
+        housekeeping()
+
+        mock_cache_get_many.assert_called_once_with(
+            subkeys=["daily-housekeeping-last-run", "sharded-daily-housekeeping-run"]
+        )
+        mock_tier_housekeeping.assert_called_once_with(tier="daily")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestDailyHousekeepingClaim(BaseTestCase):
+    """
+    Test cases for the claim of the daily housekeeping.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    @patch("tnnt_housekeeping.tasks._run_tier_housekeeping")
+    def test_skips_when_another_worker_holds_the_claim(self, mock_run):
+        """
+        Test that daily_housekeeping doesn't run while another worker holds the daily claim.
 
-        :param mock_set_daily:
-        :type mock_set_daily:
-        :param mock_character_cleanup:
-        :type mock_character_cleanup:
-        :param mock_corporation_cleanup:
-        :type mock_corporation_cleanup:
-        :param mock_cache_get:
-        :type mock_cache_get:
+        :param mock_run:
+        :type mock_run:
         :return:
         :rtype:
         """
 
-        mock_cache_get.return_value = False
+        Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING_CLAIM).claim(
+            owner="other-worker", timeout=60
+        )
+
+        result = daily_housekeeping()
+
+        self.assertIsNone(result)
+        mock_run.assert_not_called()
+        self.assertEqual(
+            Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING_CLAIM).get(), "other-worker"
+        )
+
+    @patch("tnnt_housekeeping.tasks._run_tier_housekeeping")
+    def test_releases_the_claim_after_the_run(self, mock_run):
+        """
+        Test that daily_housekeeping releases its claim when done, even if the run fails.
+
+        :param mock_run:
+        :type mock_run:
+        :return:
+        :rtype:
+        """
+
+        mock_run.side_effect = RuntimeError("Worker lost")
+
+        with self.assertRaises(RuntimeError):
+            daily_housekeeping()
+
+        self.assertFalse(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING_CLAIM).get())
+
+    @patch("tnnt_housekeeping.tasks.Cache.extend")
+    @patch("tnnt_housekeeping.tasks.run_rule")
+    def test_cleanups_get_a_heartbeat_extending_the_claim(
+        self, mock_run_rule, mock_extend
+    ):
+        """
+        Test that the cleanup rules are passed a heartbeat, which extends the daily claim.
+
+        :param mock_run_rule:
+        :type mock_run_rule:
+        :param mock_extend:
+        :type mock_extend:
+        :return:
+        :rtype:
+        """
+
+        mock_run_rule.return_value = DeletionResult()
 
         daily_housekeeping()
 
-        mock_cache_get.assert_called_once_with()
-        mock_corporation_cleanup.assert_called_once()
-        mock_character_cleanup.assert_called_once()
-        mock_set_daily.assert_called_once()
-
-    @patch("tnnt_housekeeping.tasks.Cache.get")
-    @patch("tnnt_housekeeping.tasks.DailyTasks.corporation_cleanup")
-    @patch("tnnt_housekeeping.tasks.DailyTasks.character_cleanup")
-    @patch("tnnt_housekeeping.tasks.Cache.set_daily")
-    def test_skips_daily_tasks_when_cache_is_set(
-        self,
-        mock_set_daily,
-        mock_character_cleanup,
-        mock_corporation_cleanup,
-        mock_cache_get,
+        heartbeat = mock_run_rule.call_args.kwargs["heartbeat"]
+        mock_extend.reset_mock()
+        heartbeat()
+
+        mock_extend.assert_called_once()
+        self.assertEqual(mock_extend.call_args.kwargs["timeout"], 300)
+
+    @patch("tnnt_housekeeping.tasks.run_rule")
+    def test_postpones_the_remaining_rules_when_the_claim_is_lost(self, mock_run_rule):
+        """
+        Test that once the claim has expired and been taken over by another worker,
+        no further rule is run, and the tier is not marked as done.
+
+        :param mock_run_rule:
+        :type mock_run_rule:
+        :return:
+        :rtype:
+        """
+
+        def take_over(**kwargs):
+            Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING_CLAIM).set(
+                value="other-worker", timeout=60
+            )
+
+            return DeletionResult(finished=False)
+
+        mock_run_rule.side_effect = take_over
+
+        with patch("tnnt_housekeeping.tasks.logger") as mock_logger:
+            result = daily_housekeeping()
+
+        mock_run_rule.assert_called_once()
+        self.assertFalse(any(values["finished"] for values in result.values()))
+        self.assertIn("Lost the daily claim", mock_logger.warning.call_args.args[0])
+        self.assertFalse(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+        self.assertEqual(
+            Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING_CLAIM).get(), "other-worker"
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+@patch("tnnt_housekeeping.handler.deletion.TNNT_HOUSEKEEPING_BATCH_SIZE", 2)
+class TestResumableHousekeeping(BaseTestCase):
+    """
+    Test cases for time-budgeted, resumable daily housekeeping.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for character_id in range(1, 6):
+            EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cleanup_saves_and_resumes_its_cursor(self):
+        """
+        Test that a cleanup which runs out of time saves its cursor, and the next run continues from it.
+
+        :return:
+        :rtype:
+        """
+
+        pks = list(EveCharacter.objects.order_by("pk").values_list("pk", flat=True))
+        cursor_cache = Cache(subkey=f"{CACHE_KEY_CLEANUP_CURSOR}:character_cleanup")
+
+        result = run_rule(rule=CHARACTER_CLEANUP, time_budget=0)
+
+        self.assertFalse(result.finished)
+        self.assertEqual(cursor_cache.get(), pks[1])
+        self.assertEqual(EveCharacter.objects.count(), 3)
+
+        result = run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertTrue(result.finished)
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 3)
+        self.assertFalse(cursor_cache.get())
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_TIME_BUDGET", 0)
+    def test_daily_marker_is_only_set_when_all_cleanups_finished(self):
+        """
+        Test that daily_housekeeping doesn't set the daily marker while a cleanup is unfinished.
+
+        :return:
+        :rtype:
+        """
+
+        results = daily_housekeeping()
+
+        self.assertFalse(results["corporation_cleanup"]["finished"])
+        self.assertFalse(results["character_cleanup"]["finished"])
+        self.assertFalse(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+
+        with patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_TIME_BUDGET", None):
+            results = daily_housekeeping()
+
+        self.assertTrue(results["character_cleanup"]["finished"])
+        self.assertEqual(results["character_cleanup"]["total"], 5)
+        self.assertTrue(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+
+    def test_failing_rule_does_not_stop_the_other_rules(self):
+        """
+        Test that a rule failing with an error that is not retried only stops that rule.
+
+        :return:
+        :rtype:
+        """
+
+        EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Closed Corporation",
+            corporation_ticker="CLSD",
+            member_count=0,
+            ceo_id=1,
+        )
+
+        execute = DeletionPlan.execute
+
+        def fail_for_corporations(plan, queryset, pks=None):
+            if plan.model is EveCorporationInfo:
+                raise OperationalError(1146, "Table doesn't exist")
+
+            return execute(plan, queryset=queryset, pks=pks)
+
+        with (
+            patch.object(
+                DeletionPlan,
+                "execute",
+                autospec=True,
+                side_effect=fail_for_corporations,
+            ),
+            patch("tnnt_housekeeping.tasks.logger") as mock_logger,
+        ):
+            results = daily_housekeeping()
+
+        mock_logger.error.assert_called_once_with(
+            'Error deleting closed corporations: (1146, "Table doesn\'t exist")'
+        )
+        self.assertEqual(results["corporation_cleanup"]["total"], 0)
+        self.assertTrue(results["corporation_cleanup"]["failed"])
+        self.assertEqual(results["character_cleanup"]["total"], 5)
+        self.assertFalse(results["character_cleanup"]["failed"])
+        self.assertTrue(EveCorporationInfo.objects.exists())
+        self.assertFalse(EveCharacter.objects.exists())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestShardedHousekeepingTasks(BaseTestCase):
+    """
+    Test cases for the sharded daily housekeeping.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for character_id in range(1, 7):
+            EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            )
+
+        EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Closed Corporation",
+            corporation_ticker="CLSD",
+            member_count=0,
+            ceo_id=1,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_SHARDS", 3)
+    @patch("tnnt_housekeeping.tasks.group")
+    def test_dispatches_shards_at_low_priority(self, mock_group):
+        """
+        Test that daily_housekeeping dispatches a group of shards when sharding is enabled.
+
+        :param mock_group:
+        :type mock_group:
+        :return:
+        :rtype:
+        """
+
+        result = daily_housekeeping()
+
+        # 1 range for the single corporation, 3 ranges for the characters, and 1 range
+        # recording the corporation as orphan
+        self.assertEqual(result["shards"], 5)
+        self.assertEqual(len(list(mock_group.call_args.args[0])), 5)
+        mock_group.return_value.apply_async.assert_called_once_with(priority=9)
+        self.assertEqual(
+            Cache(subkey=CACHE_KEY_SHARDED_HOUSEKEEPING).get(), result["run_id"]
+        )
+        self.assertFalse(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+        self.assertEqual(EveCharacter.objects.count(), 6)
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_SHARDS", 3)
+    @patch("tnnt_housekeeping.tasks.group")
+    def test_skips_while_sharded_run_is_in_progress(self, mock_group):
+        """
+        Test that daily_housekeeping doesn't dispatch a second sharded run while one is in progress.
+
+        :param mock_group:
+        :type mock_group:
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey=CACHE_KEY_SHARDED_HOUSEKEEPING).set(value="abc", timeout=60)
+
+        result = daily_housekeeping()
+
+        self.assertIsNone(result)
+        mock_group.assert_not_called()
+
+    @patch("tnnt_housekeeping.tasks.finalize_sharded_housekeeping.apply_async")
+    def test_last_shard_triggers_the_aggregation(self, mock_finalize):
+        """
+        Test that only the last finished shard triggers finalize_sharded_housekeeping.
+
+        :param mock_finalize:
+        :type mock_finalize:
+        :return:
+        :rtype:
+        """
+
+        character_pks = list(
+            EveCharacter.objects.order_by("pk").values_list("pk", flat=True)
+        )
+        corporation_pk = EveCorporationInfo.objects.get().pk
+        shards = [
+            ("corporation_cleanup", corporation_pk, corporation_pk),
+            ("character_cleanup", character_pks[0], character_pks[2]),
+            ("character_cleanup", character_pks[3], character_pks[-1]),
+        ]
+
+        for shard, (cleanup, pk_min, pk_max) in enumerate(shards):
+            mock_finalize.assert_not_called()
+
+            housekeeping_shard(
+                run_id="abc",
+                shard=shard,
+                shards=len(shards),
+                cleanup=cleanup,
+                pk_min=pk_min,
+                pk_max=pk_max,
+            )
+
+        mock_finalize.assert_called_once_with(
+            kwargs={"run_id": "abc", "shards": 3, "tier": "daily"}, priority=9
+        )
+        self.assertFalse(EveCharacter.objects.exists())
+        self.assertFalse(EveCorporationInfo.objects.exists())
+
+        results = finalize_sharded_housekeeping(run_id="abc", shards=3)
+
+        self.assertEqual(results["character_cleanup"]["total"], 6)
+        self.assertEqual(results["character_cleanup"]["batches"], 2)
+        self.assertEqual(results["corporation_cleanup"]["total"], 1)
+        self.assertTrue(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+        self.assertFalse(Cache(subkey=CACHE_KEY_SHARDED_HOUSEKEEPING).get())
+
+        # The metrics of the rule cover all of its shards
+        metrics = load_metrics(rules=["character_cleanup"])["character_cleanup"]
+
+        self.assertEqual(metrics["per_model"], {"eveonline.EveCharacter": 6})
+        self.assertEqual(metrics["batches"], 2)
+        self.assertIsNone(metrics["pk_range"])
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_SHARDS", 3)
+    @patch("tnnt_housekeeping.tasks.finalize_sharded_housekeeping.apply_async")
+    @patch("tnnt_housekeeping.tasks.group")
+    def test_dirty_rules_are_split_by_their_dirty_primary_keys(
+        self, mock_group, mock_finalize
     ):
         """
-        Test that the daily_housekeeping function skips daily tasks when the cache is set.
+        Test that after a full scan, shards carry the dirty primary keys as encoded
+        IdSet, and the dirty set is drained once all shards finished.
 
-        :param mock_set_daily:
-        :type mock_set_daily:
-        :param mock_character_cleanup:
-        :type mock_character_cleanup:
-        :param mock_corporation_cleanup:
-        :type mock_corporation_cleanup:
-        :param mock_cache_get:
-        :type mock_cache_get:
+        :param mock_group:
+        :type mock_group:
+        :param mock_finalize:
+        :type mock_finalize:
         :return:
         :rtype:
         """
 
-        mock_cache_get.return_value = True
+        for cleanup in ("corporation_cleanup", "character_cleanup"):
+            Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:{cleanup}").set(value=True, timeout=60)
+
+        dirty_pks = []
+
+        for character in EveCharacter.objects.order_by("pk")[:4]:
+            with self.captureOnCommitCallbacks(execute=True):
+                character.save()
+
+            dirty_pks.append(character.pk)
+
+        result = daily_housekeeping()
+        signatures = list(mock_group.call_args.args[0])
+
+        # The corporation rule has nothing dirty, the 4 characters make 2 shards,
+        # the orphaned corporation rule has no dirty set
+        self.assertEqual(result["shards"], 3)
+        self.assertEqual(DirtySet(name="corporation_cleanup").snapshot(), (0, set()))
+        self.assertEqual(
+            [
+                IdSet.decode(encoded=s.kwargs["pks"])
+                for s in signatures
+                if s.kwargs["cleanup"] == "character_cleanup"
+            ],
+            IdSet(ids=dirty_pks).chunks(count=3),
+        )
+
+        for signature in signatures:
+            housekeeping_shard(**signature.kwargs)
+
+        mock_finalize.assert_called_once()
+        self.assertEqual(EveCharacter.objects.count(), 2)
+
+        results = finalize_sharded_housekeeping(
+            **mock_finalize.call_args.kwargs["kwargs"]
+        )
+
+        self.assertEqual(results["character_cleanup"]["total"], 4)
+        self.assertEqual(DirtySet(name="character_cleanup").snapshot(), (4, set()))
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_SHARDS", 3)
+    @patch("tnnt_housekeeping.tasks.finalize_sharded_housekeeping.apply_async")
+    @patch("tnnt_housekeeping.tasks.group")
+    def test_sharded_full_scan_is_remembered(self, mock_group, mock_finalize):
+        """
+        Test that a finished sharded full scan is remembered, so the next sharded run
+        only looks at the dirty primary keys.
+
+        :param mock_group:
+        :type mock_group:
+        :param mock_finalize:
+        :type mock_finalize:
+        :return:
+        :rtype:
+        """
 
         daily_housekeeping()
 
-        mock_cache_get.assert_called_once_with()
-        mock_corporation_cleanup.assert_not_called()
-        mock_character_cleanup.assert_not_called()
-        mock_set_daily.assert_not_called()
+        for signature in mock_group.call_args.args[0]:
+            self.assertIsNone(signature.kwargs["pks"])
+
+            housekeeping_shard(**signature.kwargs)
+
+        finalize_sharded_housekeeping(**mock_finalize.call_args.kwargs["kwargs"])
+
+        self.assertTrue(Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:character_cleanup").get())
+        self.assertTrue(
+            Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:corporation_cleanup").get()
+        )
 
-    @patch("tnnt_housekeeping.tasks.daily_housekeeping.delay")
-    def test_triggers_daily_housekeeping_task(self, mock_daily_housekeeping):
+        # Bulk created, so not in the dirty set and left alone until the next full scan
+        EveCharacter.objects.bulk_create(
+            [
+                EveCharacter(
+                    character_id=7,
+                    character_name="Character 7",
+                    corporation_id=1000001,
+                    corporation_name="Doomheim",
+                    corporation_ticker="666",
+                )
+            ]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            character = EveCharacter.objects.create(
+                character_id=8,
+                character_name="Character 8",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            )
+
+        Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).delete()
+
+        result = daily_housekeeping()
+        signatures = list(mock_group.call_args.args[0])
+
+        self.assertEqual(result["shards"], 1)
+        self.assertEqual(
+            IdSet.decode(encoded=signatures[0].kwargs["pks"]),
+            IdSet(ids=[character.pk]),
+        )
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_SHARDS", 3)
+    @patch("tnnt_housekeeping.tasks.finalize_sharded_housekeeping.apply_async")
+    @patch("tnnt_housekeeping.tasks.group")
+    def test_incomplete_sharded_run_keeps_the_tier_due(self, mock_group, mock_finalize):
         """
-        Test that the housekeeping function triggers the daily_housekeeping task.
+        Test that a sharded run with a missing or failed shard neither sets the tier's
+        marker nor remembers its full scans.
 
-        :param mock_daily_housekeeping:
-        :type mock_daily_housekeeping:
+        :param mock_group:
+        :type mock_group:
+        :param mock_finalize:
+        :type mock_finalize:
         :return:
         :rtype:
         """
 
-        housekeeping()
-        mock_daily_housekeeping.assert_called_once()
+        daily_housekeeping()
+
+        signatures = list(mock_group.call_args.args[0])
+        missing = [
+            signature
+            for signature in signatures
+            if signature.kwargs["cleanup"] == "character_cleanup"
+        ][-1]
+
+        # The last shard of the characters never reports
+        for signature in signatures:
+            if signature is not missing:
+                housekeeping_shard(**signature.kwargs)
+
+        finalize_sharded_housekeeping(
+            run_id=signatures[0].kwargs["run_id"], shards=len(signatures)
+        )
+
+        self.assertFalse(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+        self.assertFalse(Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:character_cleanup").get())
+        self.assertFalse(Cache(subkey=CACHE_KEY_SHARDED_HOUSEKEEPING).get())
+
+        daily_housekeeping()
+
+        signatures = list(mock_group.call_args.args[0])
+
+        with patch(
+            "tnnt_housekeeping.handler.deletion.BatchedDeletion.run",
+            side_effect=RuntimeError("Database is gone"),
+        ):
+            housekeeping_shard(**signatures[0].kwargs)
+
+        for signature in signatures[1:]:
+            housekeeping_shard(**signature.kwargs)
+
+        results = finalize_sharded_housekeeping(
+            **mock_finalize.call_args.kwargs["kwargs"]
+        )
+
+        self.assertTrue(results[signatures[0].kwargs["cleanup"]]["failed"])
+        self.assertFalse(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+
+    def test_shard_rejects_unknown_cleanups(self):
+        """
+        Test that housekeeping_shard refuses to run a method that is not a cleanup.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(ValueError):
+            housekeeping_shard(
+                run_id="abc",
+                shard=0,
+                shards=1,
+                cleanup="candidates",
+                pk_min=1,
+                pk_max=2,
+            )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+@patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_IMPACT_THRESHOLD", 4)
+class TestImpactThreshold(BaseTestCase):
+    """
+    Test cases for the impact threshold of housekeeping runs.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for character_id in range(1, 7):
+            EveCharacter.objects.create(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            )
+
+        EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Closed Corporation",
+            corporation_ticker="CLSD",
+            member_count=0,
+            ceo_id=1,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @patch("tnnt_housekeeping.tasks.group")
+    def test_switches_to_sharded_mode_above_the_threshold(self, mock_group):
+        """
+        Test that a run switches to enough shards to keep each below the threshold.
+
+        :param mock_group:
+        :type mock_group:
+        :return:
+        :rtype:
+        """
+
+        result = daily_housekeeping()
+
+        # 1 range for the single corporation, 2 ranges for the 6 characters, and 1 range
+        # recording the corporation as orphan
+        self.assertEqual(result["shards"], 4)
+        mock_group.return_value.apply_async.assert_called_once_with(priority=9)
+        self.assertEqual(EveCharacter.objects.count(), 6)
+
+    @patch("tnnt_housekeeping.tasks.group")
+    def test_splits_clustered_candidates_by_count(self, mock_group):
+        """
+        Test that an oversized rule is split into ranges of about the same number of
+        candidates, so a cluster of candidates doesn't end up in a single shard.
+
+        :param mock_group:
+        :type mock_group:
+        :return:
+        :rtype:
+        """
+
+        # One candidate far from the cluster of the others
+        EveCharacter.objects.create(
+            pk=EveCharacter.objects.order_by("pk").last().pk + 1000,
+            character_id=7,
+            character_name="Character 7",
+            corporation_id=1000001,
+            corporation_name="Doomheim",
+            corporation_ticker="666",
+        )
+
+        daily_housekeeping()
+
+        candidates = [
+            EveCharacter.objects.filter(
+                pk__range=(shard.kwargs["pk_min"], shard.kwargs["pk_max"])
+            ).count()
+            for shard in mock_group.call_args.args[0]
+            if shard.kwargs["cleanup"] == "character_cleanup"
+        ]
+
+        self.assertEqual(candidates, [4, 3])
+
+    @patch("tnnt_housekeeping.tasks.group")
+    @patch("tnnt_housekeeping.tasks.estimate_rule")
+    def test_refuses_shards_still_above_the_threshold(
+        self, mock_estimate_rule, mock_group
+    ):
+        """
+        Test that the impact of every shard of an oversized rule is estimated again,
+        and a shard whose cascades are clustered above the threshold is refused.
+
+        :param mock_estimate_rule:
+        :type mock_estimate_rule:
+        :param mock_group:
+        :type mock_group:
+        :return:
+        :rtype:
+        """
+
+        shard_estimates = []
+
+        def estimate(rule, explain=True, using=None, q=None):
+            impact = estimate_rule(rule=rule, explain=explain, using=using, q=q)
+
+            if q is not None and rule == CHARACTER_CLEANUP:
+                shard_estimates.append(q)
+
+                # The cascades of the first shard are clustered
+                if len(shard_estimates) == 1:
+                    impact.deleted["authentication.CharacterOwnership"] += 10
+
+            return impact
+
+        mock_estimate_rule.side_effect = estimate
+
+        with patch("tnnt_housekeeping.tasks.logger") as mock_logger:
+            result = daily_housekeeping()
+
+        self.assertEqual(len(shard_estimates), 2)
+        # 1 range for the single corporation, the second range of the characters,
+        # and 1 range recording the corporation as orphan
+        self.assertEqual(result["shards"], 3)
+        self.assertIn(
+            "Refusing to run character_cleanup for primary keys",
+            mock_logger.error.call_args.args[0],
+        )
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_SHARDS", 2)
+    @patch("tnnt_housekeeping.tasks.group")
+    @patch("tnnt_housekeeping.tasks.estimate_rule")
+    def test_splits_and_checks_oversized_rules_when_sharded(
+        self, mock_estimate_rule, mock_group
+    ):
+        """
+        Test that an oversized rule of an already sharded run is split by candidate
+        count too, and the impact of its shards is estimated again.
+
+        :param mock_estimate_rule:
+        :type mock_estimate_rule:
+        :param mock_group:
+        :type mock_group:
+        :return:
+        :rtype:
+        """
+
+        # One candidate far from the cluster of the others
+        EveCharacter.objects.create(
+            pk=EveCharacter.objects.order_by("pk").last().pk + 1000,
+            character_id=7,
+            character_name="Character 7",
+            corporation_id=1000001,
+            corporation_name="Doomheim",
+            corporation_ticker="666",
+        )
+        shard_estimates = []
+
+        def estimate(rule, explain=True, using=None, q=None):
+            impact = estimate_rule(rule=rule, explain=explain, using=using, q=q)
+
+            if q is not None and rule == CHARACTER_CLEANUP:
+                shard_estimates.append(q)
+
+                # The cascades of the first shard are clustered
+                if len(shard_estimates) == 1:
+                    impact.deleted["authentication.CharacterOwnership"] += 10
+
+            return impact
+
+        mock_estimate_rule.side_effect = estimate
+
+        with patch("tnnt_housekeeping.tasks.logger") as mock_logger:
+            daily_housekeeping()
+
+        candidates = [
+            EveCharacter.objects.filter(
+                pk__range=(shard.kwargs["pk_min"], shard.kwargs["pk_max"])
+            ).count()
+            for shard in mock_group.call_args.args[0]
+            if shard.kwargs["cleanup"] == "character_cleanup"
+        ]
+
+        self.assertEqual(len(shard_estimates), 2)
+        # The second of the ranges of [4, 3] candidates
+        self.assertEqual(candidates, [3])
+        self.assertIn(
+            "Refusing to run character_cleanup for primary keys",
+            mock_logger.error.call_args.args[0],
+        )
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_IMPACT_ACTION", "refuse")
+    def test_refuses_rules_above_the_threshold(self):
+        """
+        Test that only the rules within the threshold run when refusing.
+
+        :return:
+        :rtype:
+        """
+
+        with patch("tnnt_housekeeping.tasks.logger") as mock_logger:
+            result = daily_housekeeping()
+
+        self.assertEqual(
+            set(result),
+            {
+                "corporation_cleanup",
+                "notification_cleanup",
+                "orphaned_corporation_cleanup",
+                "orphaned_alliance_cleanup",
+                "ownership_record_cleanup",
+            },
+        )
+        self.assertIn(
+            "Refusing to run character_cleanup", mock_logger.error.call_args.args[0]
+        )
+        self.assertEqual(EveCharacter.objects.count(), 6)
+        self.assertFalse(EveCorporationInfo.objects.exists())
+        self.assertTrue(Cache(subkey=CACHE_KEY_DAILY_HOUSEKEEPING).get())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestDirtySetHousekeeping(BaseTestCase):
+    """
+    Test cases for cleanups only looking at the rows in their dirty set.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # Bulk created, so they are not in the dirty set
+        EveCharacter.objects.bulk_create(
+            EveCharacter(
+                character_id=character_id,
+                character_name=f"Character {character_id}",
+                corporation_id=1000001,
+                corporation_name="Doomheim",
+                corporation_ticker="666",
+            )
+            for character_id in range(1, 4)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def biomass(self, character_id: int) -> EveCharacter:
+        """
+        Create a character and move it to Doomheim, as an affiliation update does.
+
+        :param character_id:
+        :type character_id:
+        :return:
+        :rtype:
+        """
+
+        character = EveCharacter.objects.create(
+            character_id=character_id,
+            character_name=f"Character {character_id}",
+            corporation_id=98000001,
+            corporation_name="Corporation",
+            corporation_ticker="CORP",
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            character.corporation_id = 1000001
+            character.save()
+
+        return character
+
+    def test_first_run_is_a_full_scan(self):
+        """
+        Test that a rule without a recent full scan scans fully, and remembers it.
+
+        :return:
+        :rtype:
+        """
+
+        result = run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 3)
+        self.assertTrue(Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:character_cleanup").get())
+
+    def test_only_changed_rows_are_cleaned_up_between_full_scans(self):
+        """
+        Test that after a full scan, only the rows in the dirty set are looked at,
+        and the dirty set is drained.
+
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:character_cleanup").set(
+            value=True, timeout=60
+        )
+        character = self.biomass(character_id=4)
+
+        result = run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 1)
+        self.assertFalse(EveCharacter.objects.filter(pk=character.pk).exists())
+        self.assertEqual(EveCharacter.objects.count(), 3)
+        self.assertEqual(DirtySet(name="character_cleanup").snapshot(), (1, set()))
+
+    def test_full_scan_drains_the_dirty_set(self):
+        """
+        Test that a full scan from scratch drains the rows marked before it started.
+
+        :return:
+        :rtype:
+        """
+
+        self.biomass(character_id=4)
+
+        result = run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 4)
+        self.assertEqual(DirtySet(name="character_cleanup").snapshot(), (1, set()))
+
+    def test_failed_run_keeps_the_dirty_set(self):
+        """
+        Test that a run failing with an error neither drains the dirty set nor
+        counts as a full scan.
+
+        :return:
+        :rtype:
+        """
+
+        character = self.biomass(character_id=4)
+
+        with (
+            patch(
+                "tnnt_housekeeping.tasks.BatchedDeletion.run",
+                side_effect=OperationalError(1146, "Table doesn't exist"),
+            ),
+            patch("tnnt_housekeeping.tasks.logger"),
+        ):
+            run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertFalse(Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:character_cleanup").get())
+        self.assertEqual(
+            DirtySet(name="character_cleanup").snapshot(), (1, {character.pk})
+        )
+
+    @patch("tnnt_housekeeping.tasks.TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL", 0)
+    def test_always_scans_fully_without_an_interval(self):
+        """
+        Test that with TNNT_HOUSEKEEPING_FULL_SCAN_INTERVAL of 0, every run is a full scan.
+
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey=f"{CACHE_KEY_FULL_SCAN}:character_cleanup").set(
+            value=True, timeout=60
+        )
+
+        result = run_rule(rule=CHARACTER_CLEANUP)
+
+        self.assertEqual(result.deleted("eveonline.EveCharacter"), 3)
@@ -0,0 +1,107 @@
+"""
+Unit tests for the housekeeping tiers in tnnt_housekeeping.tiers.
+"""
+
+# Standard Library
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+# Django
+from django.core.cache import cache
+from django.test import override_settings
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.cache import Cache
+from tnnt_housekeeping.tests import BaseTestCase
+from tnnt_housekeeping.tiers import DAILY, HOURLY, Tier, due_tiers, get_tier
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TestTiers(BaseTestCase):
+    """
+    Unit tests for the housekeeping tiers in tnnt_housekeeping.tiers.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_builtin_tiers_are_registered(self):
+        """
+        Test that the hourly and daily tiers are registered.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertIs(get_tier(name="hourly"), HOURLY)
+        self.assertIs(get_tier(name="daily"), DAILY)
+
+    def test_raises_value_error_for_unknown_tier(self):
+        """
+        Test that get_tier raises a ValueError for a tier that is not registered.
+
+        :return:
+        :rtype:
+        """
+
+        with self.assertRaises(ValueError):
+            get_tier(name="fortnightly")
+
+    def test_seconds_until_due_without_anchor(self):
+        """
+        Test that a tier without an anchor is due again a full period after its run.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(HOURLY.seconds_until_due(), 3600)
+
+    @patch("tnnt_housekeeping.tiers.now")
+    def test_seconds_until_due_with_anchor(self, mock_now):
+        """
+        Test that an anchored tier is due again at the next anchor time.
+
+        :param mock_now:
+        :type mock_now:
+        :return:
+        :rtype:
+        """
+
+        mock_now.return_value = datetime(2025, 3, 5, 10, 30, tzinfo=timezone.utc)
+
+        self.assertEqual(DAILY.seconds_until_due(), 3600)
+
+        mock_now.return_value = datetime(2025, 3, 5, 11, 30, tzinfo=timezone.utc)
+
+        self.assertEqual(DAILY.seconds_until_due(), 86400)
+
+        weekly = Tier(
+            name="weekly",
+            period=timedelta(weeks=1),
+            # Mondays at 11:30
+            anchor=datetime(2024, 1, 1, 11, 30, tzinfo=timezone.utc),
+        )
+
+        # Wednesday 11:30, so due again in 5 days
+        self.assertEqual(weekly.seconds_until_due(), 5 * 86400)
+
+    def test_due_tiers_skips_tiers_with_a_marker_or_a_sharded_run(self):
+        """
+        Test that due_tiers only returns tiers with neither a marker nor a sharded run in progress.
+
+        :return:
+        :rtype:
+        """
+
+        self.assertEqual(due_tiers(tiers=[HOURLY, DAILY]), [HOURLY, DAILY])
+
+        HOURLY.set_marker(value=True)
+
+        self.assertEqual(due_tiers(tiers=[HOURLY, DAILY]), [DAILY])
+
+        Cache(subkey=DAILY.sharded_cache_key).set(value="abc", timeout=60)
+
+        self.assertEqual(due_tiers(tiers=[HOURLY, DAILY]), [])
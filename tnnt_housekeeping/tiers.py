@@ -0,0 +1,175 @@
+"""
+Housekeeping tiers for TN-NT Housekeeping
+"""
+
+# Standard Library
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+# Django
+from django.utils.timezone import now
+
+# TN-NT Auth Housekeeping
+from tnnt_housekeeping.handler.cache import Cache
+
+
+@dataclass(frozen=True)
+class Tier:
+    """
+    A housekeeping tier, e.g. hourly or daily.
+
+    - A tier is due when its marker is not in the cache. After a run, the marker
+      is set until the tier is due again.
+    - Without an anchor, a tier is due again `period` after its last run.
+    - With an anchor, it is due again at the next `anchor + n * period`,
+      e.g. every day at 11:30, or every week on Monday at 11:30.
+    - The cleanup rules of a tier declare it by name, see `tnnt_housekeeping.rules`.
+      A tier without rules is never dispatched.
+    """
+
+    name: str
+    period: timedelta
+    anchor: datetime | None = None
+
+    @property
+    def cache_key(self) -> str:
+        """
+        Subkey of the tier's marker in the cache.
+
+        :return:
+        :rtype:
+        """
+
+        return f"{self.name}-housekeeping-last-run"
+
+    @property
+    def claim_cache_key(self) -> str:
+        """
+        Subkey of the claim held by the worker running the tier.
+
+        :return:
+        :rtype:
+        """
+
+        return f"{self.name}-housekeeping-claim"
+
+    @property
+    def sharded_cache_key(self) -> str:
+        """
+        Subkey of the tier's marker for a sharded run in progress.
+
+        :return:
+        :rtype:
+        """
+
+        return f"sharded-{self.name}-housekeeping-run"
+
+    def seconds_until_due(self) -> int:
+        """
+        Number of seconds from now until the tier is due again.
+
+        :return:
+        :rtype:
+        """
+
+        if self.anchor is None:
+            return int(self.period.total_seconds())
+
+        elapsed = (now() - self.anchor) % self.period
+
+        return int((self.period - elapsed).total_seconds())
+
+    def set_marker(self, value) -> None:
+        """
+        Mark the tier as run, until it is due again.
+
+        :param value:
+        :type value:
+        :return:
+        :rtype:
+        """
+
+        Cache(subkey=self.cache_key).set(value=value, timeout=self.seconds_until_due())
+
+
+_tiers: dict[str, Tier] = {}
+
+
+def register_tier(tier: Tier) -> Tier:
+    """
+    Register a housekeeping tier.
+
+    :param tier:
+    :type tier:
+    :return:
+    :rtype:
+    """
+
+    _tiers[tier.name] = tier
+
+    return tier
+
+
+def get_tier(name: str) -> Tier:
+    """
+    Get a registered housekeeping tier by its name.
+
+    :param name:
+    :type name:
+    :return:
+    :rtype:
+    """
+
+    try:
+        return _tiers[name]
+    except KeyError:
+        raise ValueError(f"Unknown housekeeping tier: {name}") from None
+
+
+def get_tiers() -> list[Tier]:
+    """
+    Get all registered housekeeping tiers.
+
+    :return:
+    :rtype:
+    """
+
+    return list(_tiers.values())
+
+
+def due_tiers(tiers: list[Tier]) -> list[Tier]:
+    """
+    Get the tiers that are due, with a single multi-key cache read.
+
+    A tier with a sharded run still in progress is not due.
+
+    :param tiers:
+    :type tiers:
+    :return:
+    :rtype:
+    """
+
+    markers = Cache.get_many(
+        subkeys=[
+            subkey
+            for tier in tiers
+            for subkey in (tier.cache_key, tier.sharded_cache_key)
+        ]
+    )
+
+    return [
+        tier
+        for tier in tiers
+        if not markers[tier.cache_key] and not markers[tier.sharded_cache_key]
+    ]
+
+
+HOURLY = register_tier(Tier(name="hourly", period=timedelta(hours=1)))
+DAILY = register_tier(
+    Tier(
+        name="daily",
+        period=timedelta(days=1),
+        # Every day at 11:30 (after downtime)
+        anchor=datetime(2024, 1, 1, 11, 30, tzinfo=timezone.utc),
+    )
+)